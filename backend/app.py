@@ -5,171 +5,3684 @@ Version optimisée : Gzip, Cache, Portable
 ============================================================
 """
 
-from fastapi import FastAPI, HTTPException, Header, Request
-from fastapi.responses import FileResponse, Response
+from fastapi import FastAPI, HTTPException, Header, Query, Request
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.gzip import GZipMiddleware
-from pydantic import BaseModel, Field
-import os, secrets, time, json, csv, io, sqlite3, base64, zipfile
+from starlette.background import BackgroundTask
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import UploadFile
+from starlette.formparsers import MultiPartException, MultiPartParser
+from pydantic import BaseModel, BeforeValidator, Field, ValidationError
+import os, re, hmac, secrets, time, json, csv, io, sqlite3, base64, zipfile, threading, zlib, hashlib, bisect, math, mimetypes, tempfile
+import asyncio, logging, multiprocessing, urllib.error, urllib.request
+from collections import OrderedDict
+from urllib.parse import quote, urlparse
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import asynccontextmanager, contextmanager, nullcontext
 from datetime import datetime, timezone
+from typing import Annotated
+
+try:
+    from PIL import Image, features as _pil_features
+except ImportError:  # Pillow absent : les images originales sont servies telles quelles
+    Image = None
+
+try:
+    import brotli
+except ImportError:  # brotli absent : gzip seulement (ou .br produits au build)
+    brotli = None
+
+try:
+    from fpdf import FPDF
+except ImportError:  # fpdf2 absent : /api/report/pdf répond 503, le rapport reste généré côté navigateur
+    FPDF = None
+
+try:
+    import fcntl
+except ImportError:  # Windows (dev) : un seul process, les verrous threading suffisent
+    fcntl = None
 
 # ============================================================
 # CONFIGURATION PORTABLE
 # ============================================================
 
-APP_ROOT = os.path.dirname(os.path.abspath(__file__))
-BASE_DIR = os.path.abspath(os.path.join(APP_ROOT, ".."))
+APP_ROOT = os.path.dirname(os.path.abspath(__file__))
+BASE_DIR = os.path.abspath(os.path.join(APP_ROOT, ".."))
+
+# Frontend : cherche dans plusieurs endroits (portable)
+FRONTEND_CANDIDATES = [
+    os.path.join(BASE_DIR, "frontend", "dist"),
+    os.path.join(BASE_DIR, "dist"),
+    os.path.join(APP_ROOT, "dist"),
+]
+FRONTEND_DIST = next((p for p in FRONTEND_CANDIDATES if os.path.isdir(p)), FRONTEND_CANDIDATES[0])
+
+# Data : idem
+DATA_CANDIDATES = [
+    os.path.join(BASE_DIR, "data"),
+    os.path.join(APP_ROOT, "data"),
+    os.path.join(APP_ROOT, "..", "data"),
+]
+DATA_DIR = os.getenv("DATA_DIR") or next((p for p in DATA_CANDIDATES if os.path.isdir(p)), DATA_CANDIDATES[0])
+
+# Admin password depuis variable d'environnement
+ADMIN_PASSWORD = os.getenv("CONFIG_ADMIN_PASSWORD", "admin")
+
+# Sessions admin : "signed" (jetons HMAC sans état, partagés entre workers) ou "sqlite" (table partagée + purge)
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "signed").strip().lower()
+SESSION_TTL_S = int(os.getenv("SESSION_TTL_S", str(24 * 3600)))
+SESSION_SECRET_FILE = os.getenv("SESSION_SECRET_FILE", os.path.join(APP_ROOT, ".session_secret"))
+SESSION_DB = os.getenv("SESSION_DB", os.path.join(APP_ROOT, "sessions.sqlite3"))
+
+# Catalogues autorisés
+ALLOWED_CATALOGS = {
+    "cameras": "cameras.csv",
+    "nvrs": "nvrs.csv",
+    "hdds": "hdds.csv",
+    "switches": "switches.csv",
+    "accessories": "accessories.csv",
+    "screens": "screens.csv",
+    "enclosures": "enclosures.csv",
+    "signage": "signage.csv",
+}
+
+# Historique des catalogues (1 instantané CSV par version, pour rollback)
+CATALOG_HISTORY_DIR = os.getenv("CATALOG_HISTORY_DIR", os.path.join(APP_ROOT, "catalog_history"))
+CATALOG_HISTORY_KEEP = int(os.getenv("CATALOG_HISTORY_KEEP", "30"))
+
+# Store SQLite des catalogues (tables typées indexées, resynchronisées sur l'ETag du CSV)
+CATALOG_DB = os.getenv("CATALOG_DB", os.path.join(APP_ROOT, "catalog.sqlite3"))
+
+# Verrous inter-processus (plusieurs workers uvicorn/gunicorn sur le même disque)
+LOCK_DIR = os.getenv("LOCK_DIR", os.path.join(APP_ROOT, ".locks"))
+
+# Métriques : instantané publié par chaque worker toutes les N s, agrégé par /metrics
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") != "0"
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")  # si défini : Authorization: Bearer <token>
+METRICS_DIR = os.getenv("METRICS_DIR", os.path.join(LOCK_DIR, "metrics"))
+METRICS_FLUSH_S = float(os.getenv("METRICS_FLUSH_S", "5"))
+SQL_SLOW_MS = float(os.getenv("SQL_SLOW_MS", "200"))  # seuil du journal des requêtes SQLite lentes
+
+# Base KPI : rollups dans kpi.sqlite3, events bruts partitionnés par mois (1 fichier SQLite / mois)
+KPI_DB = os.getenv("KPI_DB", os.path.join(APP_ROOT, "kpi.sqlite3"))
+KPI_PARTS_DIR = os.getenv("KPI_PARTS_DIR", os.path.join(APP_ROOT, "kpi_parts"))
+KPI_ARCHIVE_DIR = os.getenv("KPI_ARCHIVE_DIR", os.path.join(APP_ROOT, "kpi_archive"))
+
+# Rétention : nb de mois gardés en SQLite (mois courant inclus), les plus anciens
+# sont archivés en NDJSON gzip puis supprimés (0 = pas de compaction)
+KPI_RETENTION_MONTHS = int(os.getenv("KPI_RETENTION_MONTHS", "12"))
+KPI_COMPACT_INTERVAL_S = float(os.getenv("KPI_COMPACT_INTERVAL_S", "21600"))
+
+# Ingestion KPI : flush dès qu'un lot atteint N events ou que le plus ancien a X secondes
+KPI_FLUSH_MAX_EVENTS = int(os.getenv("KPI_FLUSH_MAX_EVENTS", "200"))
+KPI_FLUSH_MAX_AGE_S = float(os.getenv("KPI_FLUSH_MAX_AGE_S", "1.0"))
+KPI_BATCH_MAX_EVENTS = 200  # events max par appel /api/kpi/batch
+KPI_QUEUE_MAX = int(os.getenv("KPI_QUEUE_MAX", "20000"))  # au-delà, les events sont délestés (202)
+
+# Garde d'ingestion KPI (par worker) : seaux à jetons par session et par IP (0 = sans limite),
+# taille des corps et des payloads, doublons (session, event, payload) ignorés sur une fenêtre.
+# Derrière un proxy, l'IP cliente n'est vue que si uvicorn lui fait confiance (FORWARDED_ALLOW_IPS).
+KPI_RATE_SESSION_PER_S = float(os.getenv("KPI_RATE_SESSION_PER_S", "2"))
+KPI_RATE_SESSION_BURST = float(os.getenv("KPI_RATE_SESSION_BURST", "100"))
+KPI_RATE_IP_PER_S = float(os.getenv("KPI_RATE_IP_PER_S", "20"))
+KPI_RATE_IP_BURST = float(os.getenv("KPI_RATE_IP_BURST", "400"))
+KPI_MAX_BODY_BYTES = int(os.getenv("KPI_MAX_BODY_KB", "128")) * 1024
+KPI_MAX_PAYLOAD_BYTES = int(os.getenv("KPI_MAX_PAYLOAD_BYTES", "4096"))  # JSON d'un payload
+KPI_DEDUP_WINDOW_S = float(os.getenv("KPI_DEDUP_WINDOW_S", "10"))
+KPI_GUARD_MAX_KEYS = 100_000  # clients suivis et empreintes récentes (LRU)
+KPI_EXPORT_CHUNK = 2000     # lignes lues par fetchmany (mémoire bornée)
+
+# Fiches techniques : arborescence locale (scripts/fetch_media.py) puis cache médias
+DATASHEET_DIR = os.path.join(DATA_DIR, "Fiche_tech")
+DATASHEET_WORKERS = 4
+
+# Upload binaire du rapport (/export/localzip/upload) : plafond, puis débordement disque au-delà de 1 Mo
+EXPORT_MAX_UPLOAD_BYTES = int(os.getenv("EXPORT_MAX_UPLOAD_MB", "50")) * 1024 * 1024
+EXPORT_SPOOL_BYTES = 1024 * 1024
+
+# Cache médias (proxy images / PDF distants) : budget disque, TTL avant revalidation
+MEDIA_CACHE_DIR = os.getenv("MEDIA_CACHE_DIR", os.path.join(APP_ROOT, "media_cache"))
+MEDIA_CACHE_MAX_BYTES = int(os.getenv("MEDIA_CACHE_MAX_MB", "512")) * 1024 * 1024
+MEDIA_CACHE_TTL_S = float(os.getenv("MEDIA_CACHE_TTL_S", "86400"))
+MEDIA_MAX_OBJECT_BYTES = 50 * 1024 * 1024
+MEDIA_TIMEOUT_S = 25
+# Images produits : variantes (largeurs x formats) générées à la demande puis gardées sur disque
+IMAGES_DIR = os.path.join(DATA_DIR, "Images")
+IMAGE_CACHE_DIR = os.getenv("IMAGE_CACHE_DIR", os.path.join(APP_ROOT, "image_cache"))
+IMAGE_WIDTHS = (64, 128, 256, 512)
+IMAGE_QUALITY = 80
+
+# Rapport PDF serveur : PDF gardés par hash du document, rendu dans un pool de processus
+REPORT_CACHE_DIR = os.getenv("REPORT_CACHE_DIR", os.path.join(APP_ROOT, "report_cache"))
+REPORT_CACHE_KEEP = int(os.getenv("REPORT_CACHE_KEEP", "200"))
+REPORT_WORKERS = int(os.getenv("REPORT_WORKERS", str(min(2, os.cpu_count() or 1))))  # par worker web ; 0 = rendu en thread
+REPORT_FONT = os.getenv("REPORT_FONT", "")  # TTF Unicode (défaut : DejaVu système, sinon Helvetica latin-1)
+REPORT_I18N = os.path.join(DATA_DIR, "report_i18n.json")
+REPORT_LOGO_CANDIDATES = [
+    os.path.join(FRONTEND_DIST, "assets", "logo.png"),
+    os.path.join(BASE_DIR, "frontend", "public", "assets", "logo.png"),
+]
+REPORT_THUMB_PX = 256
+
+# Liens de partage : instantanés de projet adressés par hash, expirés par TTL (dernier accès) puis LRU sous budget
+SHARE_DB = os.getenv("SHARE_DB", os.path.join(APP_ROOT, "shares.sqlite3"))
+SHARE_TTL_S = float(os.getenv("SHARE_TTL_DAYS", "180")) * 86400
+SHARE_MAX_BYTES = int(os.getenv("SHARE_MAX_MB", "64")) * 1024 * 1024  # données compressées
+SHARE_MAX_SNAPSHOT_BYTES = 256 * 1024  # JSON canonique d'un instantané
+
+# Garde-fou (même liste que scripts/fetch_media.py), surchargeable pour un serveur de test local
+MEDIA_ALLOWED_HOSTS = {h.strip() for h in os.getenv("MEDIA_ALLOWED_HOSTS", "staticpro.comelitgroup.com").split(",") if h.strip()}
+
+# ============================================================
+# ÉTAT PARTAGÉ ENTRE WORKERS
+# ============================================================
+#
+# Mode production : N workers (`uvicorn --workers N` ou gunicorn + UvicornWorker),
+# chacun avec ses globals. Inventaire de l'état module et de sa tenue en multi-process :
+#   - _CATALOG_CACHE / _BUNDLE / store SQLite / memos reco & dimensionnement :
+#     caches par process, invalidés par stat/ETag du CSV -> cohérents entre workers.
+#   - Écritures catalogue : verrou threading + _process_lock par catalogue.
+#   - Sessions admin : jetons signés ou table SQLite partagée (SESSIONS).
+#   - Liens de partage : table SQLite WAL, insertion sous BEGIN IMMEDIATE.
+#   - KPI : file mémoire bornée par worker, SQLite WAL partagé ; init du schéma, migration
+#     et compaction sous _process_lock (un seul worker compacte à la fois).
+#   - KPI_GUARD (seaux à jetons, doublons récents) : par worker, limites effectives x N.
+#   - MEDIA_CACHE / images dérivées : fichiers écrits par renommage atomique ; le
+#     budget disque est compté par worker (dépassement borné à N x MEDIA_CACHE_MAX_MB).
+#   - STATIC : index en lecture seule construit au warm-up.
+
+@contextmanager
+def _process_lock(name: str, blocking: bool = True, shared: bool = False):
+    """
+    Verrou entre processus (flock sur LOCK_DIR/<name>.lock), exclusif ou partagé.
+    Rend True si acquis ; en non bloquant, False si un autre worker le détient.
+    """
+    if fcntl is None:
+        yield True
+        return
+    os.makedirs(LOCK_DIR, exist_ok=True)
+    fd = os.open(os.path.join(LOCK_DIR, f"{name}.lock"), os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        try:
+            fcntl.flock(fd, (fcntl.LOCK_SH if shared else fcntl.LOCK_EX) | (0 if blocking else fcntl.LOCK_NB))
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+    finally:
+        os.close(fd)
+
+# ============================================================
+# MÉTRIQUES (latences par route, sections chaudes, SQL lent)
+# ============================================================
+
+_LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+_SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+_METRICS_HELP = {
+    "http_requests_total": ("counter", "Requêtes HTTP par méthode, route et statut"),
+    "http_request_duration_seconds": ("histogram", "Durée des requêtes HTTP (jusqu'au dernier octet)"),
+    "http_response_size_bytes": ("histogram", "Taille des réponses HTTP (après compression)"),
+    "app_op_duration_seconds": ("histogram", "Durée des sections chaudes (connexion KPI, insert, catalogue, export)"),
+    "sqlite_statement_duration_seconds": ("histogram", "Durée des requêtes SQLite par verbe"),
+    "sqlite_slow_statements_total": ("counter", "Requêtes SQLite au-delà de SQL_SLOW_MS"),
+    "kpi_events_received_total": ("counter", "Events KPI mis en file"),
+    "kpi_events_written_total": ("counter", "Events KPI écrits en base"),
+    "kpi_queue_depth": ("gauge", "Events KPI en attente d'écriture"),
+    "kpi_events_dropped_total": ("counter", "Events KPI écartés (rate_limited, duplicate, too_large, shed)"),
+    "share_snapshots_total": ("counter", "Instantanés partagés enregistrés (created) ou dédupliqués (dedup)"),
+    "app_workers": ("gauge", "Workers ayant publié leurs métriques"),
+}
+
+
+class Metrics:
+    """
+    Registre compteurs / histogrammes / jauges du process. Chaque worker publie un
+    instantané JSON dans METRICS_DIR ; /metrics agrège les instantanés récents.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters: dict[tuple, float] = {}
+        self.hists: dict[tuple, list] = {}  # (nom, labels) -> [n par bucket..., somme, total]
+        self.buckets: dict[str, tuple] = {}
+        self.gauges: dict[str, object] = {}  # nom -> fonction évaluée à l'instantané
+
+    def inc(self, name: str, labels: tuple = (), value: float = 1.0):
+        if not METRICS_ENABLED:
+            return
+        key = (name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0.0) + value
+
+    def observe(self, name: str, value: float, labels: tuple = (), buckets: tuple = _LATENCY_BUCKETS):
+        if not METRICS_ENABLED:
+            return
+        key = (name, labels)
+        i = bisect.bisect_left(buckets, value)
+        with self._lock:
+            h = self.hists.get(key)
+            if h is None:
+                h = self.hists[key] = [0] * len(buckets) + [0.0, 0]
+                self.buckets[name] = buckets
+            if i < len(buckets):
+                h[i] += 1
+            h[-2] += value
+            h[-1] += 1
+
+    @contextmanager
+    def timed(self, op: str):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe("app_op_duration_seconds", time.perf_counter() - t0, (("op", op),))
+
+    def timed_iter(self, chunks, op: str):
+        """Mesure un générateur de réponse (export streamé) du 1er au dernier chunk."""
+        with self.timed(op):
+            yield from chunks
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            counters = [[n, list(map(list, l)), v] for (n, l), v in self.counters.items()]
+            hists = [[n, list(map(list, l)), list(self.buckets[n]), list(h)] for (n, l), h in self.hists.items()]
+        gauges = []
+        for name, fn in self.gauges.items():
+            try:
+                gauges.append([name, [], float(fn())])
+            except Exception:
+                pass
+        return {"pid": os.getpid(), "ts": time.time(), "counters": counters, "hists": hists, "gauges": gauges}
+
+
+METRICS = Metrics()
+
+
+class TimedConnection(sqlite3.Connection):
+    """Connexion SQLite instrumentée : durée par verbe + journal des requêtes lentes."""
+
+    def execute(self, sql, parameters=()):
+        t0 = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            _sql_timing(sql, time.perf_counter() - t0)
+
+    def executemany(self, sql, seq_of_parameters):
+        t0 = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            _sql_timing(sql, time.perf_counter() - t0)
+
+
+_SQL_LOG = logging.getLogger("configurateur.sql")
+
+
+def _sql_timing(sql: str, dt: float):
+    verb = sql.lstrip().split(None, 1)[0].upper() if sql.strip() else "?"
+    METRICS.observe("sqlite_statement_duration_seconds", dt, (("verb", verb),))
+    if dt * 1000 >= SQL_SLOW_MS:
+        METRICS.inc("sqlite_slow_statements_total", (("verb", verb),))
+        _SQL_LOG.warning("SQL lent (%.0f ms): %s", dt * 1000, " ".join(sql.split())[:200])
+
+
+def _sqlite_connect(path: str, **kwargs) -> sqlite3.Connection:
+    """sqlite3.connect instrumenté (toutes les bases de l'app passent par ici)."""
+    return sqlite3.connect(path, factory=TimedConnection, **kwargs)
+
+
+class MetricsMiddleware:
+    """
+    Middleware ASGI : durée, statut et taille de chaque réponse, étiquetés par le
+    gabarit de route (/api/img/{family}/{ref}) pour borner la cardinalité.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+        t0 = time.perf_counter()
+        status, size = 500, 0
+
+        async def _send(message):
+            nonlocal status, size
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, _send)
+        finally:
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            labels = (("method", scope["method"]), ("route", route))
+            METRICS.observe("http_request_duration_seconds", time.perf_counter() - t0, labels)
+            METRICS.observe("http_response_size_bytes", size, labels, _SIZE_BUCKETS)
+            METRICS.inc("http_requests_total", labels + (("status", str(status)),))
+
+
+def _metrics_publish():
+    """Écrit l'instantané du worker (renommage atomique)."""
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    path = os.path.join(METRICS_DIR, f"{os.getpid()}.json")
+    tmp = f"{path}.{secrets.token_hex(4)}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(METRICS.snapshot(), f, separators=(",", ":"))
+    os.replace(tmp, path)
+
+
+_METRICS_STOP = threading.Event()
+
+
+def _metrics_loop():
+    while not _METRICS_STOP.wait(METRICS_FLUSH_S):
+        try:
+            _metrics_publish()
+        except OSError as e:
+            print(f"⚠️  Métriques: publication impossible: {e}")
+
+
+def _metrics_collect() -> list[dict]:
+    """Instantanés de tous les workers vivants (celui-ci publié à l'instant)."""
+    _metrics_publish()
+    snaps, horizon = [], time.time() - max(30.0, 3 * METRICS_FLUSH_S)
+    for name in os.listdir(METRICS_DIR):
+        if not name.endswith(".json"):
+            continue
+        path = os.path.join(METRICS_DIR, name)
+        try:
+            if os.stat(path).st_mtime < horizon:
+                os.remove(path)  # worker arrêté
+                continue
+            with open(path, encoding="utf-8") as f:
+                snaps.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return snaps
+
+
+def _prom_labels(labels) -> str:
+    if not labels:
+        return ""
+    esc = lambda v: str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{k}="{esc(v)}"' for k, v in labels) + "}"
+
+
+def _prom_num(v: float) -> str:
+    return str(int(v)) if float(v).is_integer() else repr(float(v))
+
+
+def _metrics_render(snaps: list[dict]) -> str:
+    """Agrège (somme) les instantanés et produit le format texte Prometheus 0.0.4."""
+    counters: dict[tuple, float] = {}
+    gauges: dict[tuple, float] = {("app_workers", ()): float(len(snaps))}
+    hists: dict[tuple, list] = {}
+    buckets: dict[str, list] = {}
+    for s in snaps:
+        for name, labels, v in s["counters"]:
+            key = (name, tuple(map(tuple, labels)))
+            counters[key] = counters.get(key, 0.0) + v
+        for name, labels, v in s["gauges"]:
+            key = (name, tuple(map(tuple, labels)))
+            gauges[key] = gauges.get(key, 0.0) + v
+        for name, labels, b, h in s["hists"]:
+            key = (name, tuple(map(tuple, labels)))
+            buckets[name] = b
+            acc = hists.setdefault(key, [0] * len(h))
+            for i, x in enumerate(h):
+                acc[i] += x
+    by_name: dict[str, list[str]] = {}
+    for (name, labels), v in sorted(counters.items()):
+        by_name.setdefault(name, []).append(f"{name}{_prom_labels(labels)} {_prom_num(v)}")
+    for (name, labels), v in sorted(gauges.items()):
+        by_name.setdefault(name, []).append(f"{name}{_prom_labels(labels)} {_prom_num(v)}")
+    for (name, labels), h in sorted(hists.items()):
+        lines, cum = by_name.setdefault(name, []), 0
+        for le, n in zip(buckets[name], h):
+            cum += n
+            lines.append(f"{name}_bucket{_prom_labels(labels + (('le', _prom_num(le)),))} {cum}")
+        lines.append(f"{name}_bucket{_prom_labels(labels + (('le', '+Inf'),))} {h[-1]}")
+        lines.append(f"{name}_sum{_prom_labels(labels)} {_prom_num(h[-2])}")
+        lines.append(f"{name}_count{_prom_labels(labels)} {h[-1]}")
+    out = []
+    for name, lines in by_name.items():
+        kind, help_ = _METRICS_HELP.get(name, ("untyped", name))
+        out += [f"# HELP {name} {help_}", f"# TYPE {name} {kind}", *lines]
+    return "\n".join(out) + "\n"
+
+# ============================================================
+# DATABASE KPI
+# ============================================================
+
+_KPI_SCHEMA_READY = False
+_KPI_ROLLUP_TABLES = ("kpi_daily", "kpi_daily_sessions", "kpi_daily_keys")
+_KPI_COLS = "ts_utc, session_id, event, payload_json, path, ua, ip"
+
+# id = AAAAMM * stride + n : les ids restent croissants d'une partition à l'autre
+_KPI_ID_STRIDE = 10**10
+
+
+def _next_month(month: str) -> str:
+    """'2025-12' -> '2026-01'."""
+    y, m = int(month[:4]), int(month[5:7])
+    return f"{y + 1}-01" if m == 12 else f"{y}-{m + 1:02d}"
+
+
+def _kpi_id_month(kpi_id: int) -> str:
+    """Mois de la partition qui contient cet id."""
+    ym = kpi_id // _KPI_ID_STRIDE
+    return f"{ym // 100:04d}-{ym % 100:02d}"
+
+
+def _kpi_part_path(month: str) -> str:
+    return os.path.join(KPI_PARTS_DIR, f"kpi_{month}.sqlite3")
+
+
+def _kpi_archive_path(month: str) -> str:
+    return os.path.join(KPI_ARCHIVE_DIR, f"kpi_{month}.ndjson.gz")
+
+
+def _kpi_part_db(month: str, create: bool = False, check_same_thread: bool = True):
+    """Connexion à la partition d'un mois (None si elle n'existe pas et create=False)."""
+    path = _kpi_part_path(month)
+    if not create and not os.path.exists(path):
+        return None
+    os.makedirs(KPI_PARTS_DIR, exist_ok=True)
+    con = _sqlite_connect(path, timeout=10, check_same_thread=check_same_thread)
+    con.execute("PRAGMA synchronous=NORMAL;")
+    if create:
+        con.execute("PRAGMA journal_mode=WAL;")
+        with con:
+            con.execute("""
+                CREATE TABLE IF NOT EXISTS kpi_events(
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    ts_utc TEXT NOT NULL,
+                    session_id TEXT,
+                    event TEXT NOT NULL,
+                    payload_json TEXT,
+                    path TEXT,
+                    ua TEXT,
+                    ip TEXT
+                );
+            """)
+            con.execute("CREATE INDEX IF NOT EXISTS idx_kpi_ts ON kpi_events(ts_utc);")
+            con.execute("CREATE INDEX IF NOT EXISTS idx_kpi_event ON kpi_events(event);")
+            # SQLite ajoute le rowid (id) en fin d'index : (session_id, id) sert la pagination par curseur
+            con.execute("CREATE INDEX IF NOT EXISTS idx_kpi_session ON kpi_events(session_id);")
+            # filtre par préfixe de path (intervalle), avec ou sans bornes de dates : (path, ts_utc, id)
+            con.execute("CREATE INDEX IF NOT EXISTS idx_kpi_path ON kpi_events(path, ts_utc);")
+            ym = int(month[:4]) * 100 + int(month[5:7])
+            con.execute(
+                "INSERT INTO sqlite_sequence(name, seq) SELECT 'kpi_events', ? "
+                "WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = 'kpi_events')",
+                (ym * _KPI_ID_STRIDE,))
+    return con
+
+
+def _kpi_months(start: str | None = None, end: str | None = None) -> list[str]:
+    """Mois disposant d'une partition (triés), restreints à l'intervalle [start, end]."""
+    try:
+        names = os.listdir(KPI_PARTS_DIR)
+    except FileNotFoundError:
+        return []
+    months = sorted(n[4:11] for n in names
+                    if n.startswith("kpi_") and n.endswith(".sqlite3") and len(n) == 19)
+    if start:
+        months = [m for m in months if m >= start[:7]]
+    if end:
+        months = [m for m in months if m <= end[:7]]
+    return months
+
+
+def _kpi_drop_partition(month: str):
+    """
+    Supprime la partition d'un mois : simple suppression de fichiers, aucun scan.
+    Seul point de suppression (reset-month, compaction). Protocole entre workers :
+    la suppression prend le verrou "kpi-part-<mois>" en exclusif ; tout écrivain
+    le prend en partagé et, sous ce verrou, vérifie que sa connexion gardée pointe
+    toujours sur le fichier en place (inode) avant d'écrire, sinon la rouvre.
+    Aucun event n'est donc écrit dans un fichier déjà supprimé.
+    """
+    path = _kpi_part_path(month)
+    with _process_lock(f"kpi-part-{month}"):
+        for p in (path, path + "-wal", path + "-shm"):
+            try:
+                os.remove(p)
+            except FileNotFoundError:
+                pass
+
+
+def _kpi_init(con: sqlite3.Connection):
+    """Crée le schéma KPI (une seule fois par process)."""
+    global _KPI_SCHEMA_READY
+    if _KPI_SCHEMA_READY:
+        return
+    with _process_lock("kpi-schema"):
+        _kpi_init_schema(con)
+    _KPI_SCHEMA_READY = True
+
+
+def _kpi_init_schema(con: sqlite3.Connection):
+    con.execute("PRAGMA journal_mode=WAL;")
+    # Rollups (tenus à jour à l'ingestion, cf. _kpi_store_rows)
+    con.execute("""
+        CREATE TABLE IF NOT EXISTS kpi_daily(
+            day TEXT NOT NULL,
+            event TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY(day, event)
+        ) WITHOUT ROWID;
+    """)
+    con.execute("""
+        CREATE TABLE IF NOT EXISTS kpi_daily_sessions(
+            day TEXT NOT NULL,
+            session_id TEXT NOT NULL,
+            PRIMARY KEY(day, session_id)
+        ) WITHOUT ROWID;
+    """)
+    con.execute("""
+        CREATE TABLE IF NOT EXISTS kpi_daily_keys(
+            day TEXT NOT NULL,
+            key TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY(day, key)
+        ) WITHOUT ROWID;
+    """)
+    con.commit()
+    _kpi_migrate_legacy(con)
+    # Partitions créées avant l'ajout d'un index : schéma complété (CREATE ... IF NOT EXISTS)
+    for month in _kpi_months():
+        _kpi_part_db(month, create=True).close()
+    # Base existante sans rollups : reconstruction unique
+    if con.execute("SELECT 1 FROM kpi_daily LIMIT 1").fetchone() is None and _kpi_months():
+        _kpi_rebuild_rollups(con)
+
+
+def _kpi_migrate_legacy(con: sqlite3.Connection):
+    """Déplace l'ancienne table kpi_events (base unique) vers les partitions mensuelles."""
+    if not con.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='kpi_events'").fetchone():
+        return
+    months = [m for (m,) in con.execute("SELECT DISTINCT substr(ts_utc,1,7) FROM kpi_events") if m]
+    for month in months:
+        _kpi_part_db(month, create=True).close()
+        con.execute("ATTACH DATABASE ? AS part", (_kpi_part_path(month),))
+        try:
+            with con:
+                rng = (month + "-01", _next_month(month) + "-01")
+                con.execute(
+                    f"INSERT INTO part.kpi_events({_KPI_COLS}) SELECT {_KPI_COLS} FROM main.kpi_events "
+                    "WHERE ts_utc >= ? AND ts_utc < ? ORDER BY id", rng)
+                con.execute("DELETE FROM main.kpi_events WHERE ts_utc >= ? AND ts_utc < ?", rng)
+        finally:
+            con.execute("DETACH DATABASE part")
+    con.execute("DROP TABLE kpi_events")
+    con.commit()
+    print(f"✅ KPI: {len(months)} mois migrés vers {KPI_PARTS_DIR}")
+
+
+def _kpi_rebuild_rollups(con: sqlite3.Connection, months: list[str] | None = None):
+    """
+    Recalcule les rollups depuis les partitions (toutes, ou les mois donnés).
+    Les mois déjà archivés gardent leurs rollups.
+    """
+    for month in (_kpi_months() if months is None else months):
+        path = _kpi_part_path(month)
+        if not os.path.exists(path):
+            continue
+        rng = (month + "-01", _next_month(month) + "-01")
+        con.execute("ATTACH DATABASE ? AS part", (path,))
+        try:
+            with con:
+                for t in _KPI_ROLLUP_TABLES:
+                    con.execute(f"DELETE FROM {t} WHERE day >= ? AND day < ?", rng)
+                con.execute(
+                    "INSERT INTO kpi_daily(day, event, count) "
+                    "SELECT substr(e.ts_utc,1,10), e.event, COUNT(*) FROM part.kpi_events e GROUP BY 1, 2")
+                con.execute(
+                    "INSERT OR IGNORE INTO kpi_daily_sessions(day, session_id) "
+                    "SELECT DISTINCT substr(e.ts_utc,1,10), e.session_id FROM part.kpi_events e "
+                    "WHERE e.session_id IS NOT NULL AND e.session_id != ''")
+                con.execute(
+                    "INSERT INTO kpi_daily_keys(day, key, count) "
+                    "SELECT substr(e.ts_utc,1,10), j.key, COUNT(*) FROM part.kpi_events e, json_each(e.payload_json) j "
+                    "WHERE json_valid(e.payload_json) AND json_type(e.payload_json) = 'object' GROUP BY 1, 2")
+        finally:
+            con.execute("DETACH DATABASE part")
+
+
+def _db(check_same_thread: bool = True):
+    """Ouvre une connexion KPI (WAL : les lectures ne bloquent pas l'écrivain)."""
+    with METRICS.timed("kpi_db_connect"):
+        con = _sqlite_connect(KPI_DB, timeout=10, check_same_thread=check_same_thread)
+        con.execute("PRAGMA synchronous=NORMAL;")
+        _kpi_init(con)
+    return con
+
+# ============================================================
+# KPI INGESTION (file mémoire + écriture groupée)
+# ============================================================
+
+_KPI_INSERT_SQL = f"INSERT INTO kpi_events({_KPI_COLS}) VALUES(?,?,?,?,?,?,?)"
+
+
+def _kpi_store_rows(con: sqlite3.Connection, rows: list[tuple], part):
+    """
+    Insère un lot d'events dans les partitions mensuelles (part(mois) -> connexion),
+    puis met à jour les rollups journaliers de la base principale.
+    Une transaction par fichier.
+    """
+    with METRICS.timed("kpi_insert"):
+        _kpi_insert_rows(con, rows, part)
+    METRICS.inc("kpi_events_written_total", value=len(rows))
+
+
+def _kpi_insert_rows(con: sqlite3.Connection, rows: list[tuple], part):
+    by_month: dict[str, list[tuple]] = {}
+    for r in rows:
+        by_month.setdefault(r[0][:7], []).append(r)
+    for month, month_rows in by_month.items():
+        with _process_lock(f"kpi-part-{month}", shared=True):  # cf. _kpi_drop_partition
+            pcon = part(month)
+            with pcon:
+                pcon.executemany(_KPI_INSERT_SQL, month_rows)
+    by_event: dict[tuple, int] = {}
+    by_key: dict[tuple, int] = {}
+    sessions: set[tuple] = set()
+    for ts, sid, event, payload_json, *_ in rows:
+        day = ts[:10]
+        by_event[(day, event)] = by_event.get((day, event), 0) + 1
+        if sid:
+            sessions.add((day, sid))
+        try:
+            payload = json.loads(payload_json) if payload_json else {}
+        except ValueError:
+            payload = {}
+        if isinstance(payload, dict):
+            for k in payload:
+                by_key[(day, k)] = by_key.get((day, k), 0) + 1
+    with con:
+        con.executemany(
+            "INSERT INTO kpi_daily(day, event, count) VALUES(?,?,?) "
+            "ON CONFLICT(day, event) DO UPDATE SET count = count + excluded.count",
+            [(d, e, c) for (d, e), c in by_event.items()])
+        con.executemany("INSERT OR IGNORE INTO kpi_daily_sessions(day, session_id) VALUES(?,?)", sessions)
+        con.executemany(
+            "INSERT INTO kpi_daily_keys(day, key, count) VALUES(?,?,?) "
+            "ON CONFLICT(day, key) DO UPDATE SET count = count + excluded.count",
+            [(d, k, c) for (d, k), c in by_key.items()])
+
+
+class KpiWriter:
+    """
+    Écrivain KPI en arrière-plan.
+    Les requêtes empilent des lignes en mémoire ; un thread dédié les écrit
+    par lots (executemany + 1 commit) sur des connexions WAL persistantes
+    (base principale + partition du mois en cours).
+    """
+
+    def __init__(self, max_events: int, max_age_s: float, max_queue: int = 0):
+        self.max_events = max(1, max_events)
+        self.max_age_s = max(0.01, max_age_s)
+        self.max_queue = max_queue  # 0 = file non bornée
+        self._buf: list[tuple] = []
+        self._oldest = 0.0
+        self._cond = threading.Condition()
+        self._io_lock = threading.Lock()
+        self._con: sqlite3.Connection | None = None
+        self._parts: dict[str, tuple[sqlite3.Connection, int]] = {}  # mois -> (connexion, inode)
+        self._thread: threading.Thread | None = None
+        self._stopping = False
+        self.stats = {
+            "enqueued": 0,
+            "shed": 0,
+            "written": 0,
+            "failed": 0,
+            "flushes": 0,
+            "last_batch": 0,
+            "max_queue_depth": 0,
+            "last_flush_ms": 0.0,
+            "max_flush_ms": 0.0,
+            "total_flush_ms": 0.0,
+        }
+
+    # --- cycle de vie ---
+
+    def start(self):
+        with self._cond:
+            if self._thread and self._thread.is_alive():
+                return
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name="kpi-writer", daemon=True)
+            self._thread.start()
+
+    def alive(self) -> bool:
+        return bool(self._thread and self._thread.is_alive())
+
+    def stop(self, timeout: float = 10.0):
+        """Arrête le thread après avoir vidé la file."""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+        self.flush()
+        with self._io_lock:
+            for pcon, _ in self._parts.values():
+                pcon.close()
+            self._parts.clear()
+            if self._con is not None:
+                self._con.close()
+                self._con = None
+
+    # --- API ---
+
+    def put_many(self, rows: list[tuple]) -> int:
+        """Met en file ; au-delà de max_queue le surplus est délesté. Renvoie le nombre accepté."""
+        if not rows:
+            return 0
+        with self._cond:
+            if self.max_queue:
+                room = max(0, self.max_queue - len(self._buf))
+                if room < len(rows):
+                    self.stats["shed"] += len(rows) - room
+                    rows = rows[:room]
+                if not rows:
+                    return 0
+            if not self._buf:
+                self._oldest = time.monotonic()
+            self._buf.extend(rows)
+            self.stats["enqueued"] += len(rows)
+            depth = len(self._buf)
+            if depth > self.stats["max_queue_depth"]:
+                self.stats["max_queue_depth"] = depth
+            if depth == len(rows) or depth >= self.max_events:
+                self._cond.notify_all()
+        METRICS.inc("kpi_events_received_total", value=len(rows))
+        if self._thread is None:
+            self.start()
+        return len(rows)
+
+    def put(self, row: tuple) -> int:
+        return self.put_many([row])
+
+    def flush(self):
+        """Écrit immédiatement tout ce qui est en file (appel synchrone)."""
+        with self._cond:
+            batch, self._buf = self._buf, []
+        self._write(batch)
+
+    def release(self, month: str):
+        """Ferme la connexion gardée sur une partition (avant suppression/archivage)."""
+        with self._io_lock:
+            held = self._parts.pop(month, None)
+            if held is not None:
+                held[0].close()
+
+    def snapshot(self) -> dict:
+        with self._cond:
+            depth = len(self._buf)
+        st = dict(self.stats)
+        st["queue_depth"] = depth
+        st["avg_flush_ms"] = round(st["total_flush_ms"] / st["flushes"], 3) if st["flushes"] else 0.0
+        st["total_flush_ms"] = round(st["total_flush_ms"], 3)
+        st["max_events"] = self.max_events
+        st["max_queue"] = self.max_queue
+        st["max_age_s"] = self.max_age_s
+        st["running"] = bool(self._thread and self._thread.is_alive())
+        return st
+
+    # --- interne ---
+
+    def _due(self) -> bool:
+        if not self._buf:
+            return False
+        return len(self._buf) >= self.max_events or time.monotonic() - self._oldest >= self.max_age_s
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._stopping and not self._due():
+                    wait = None
+                    if self._buf:
+                        wait = max(0.0, self.max_age_s - (time.monotonic() - self._oldest))
+                    self._cond.wait(wait)
+                if self._stopping and not self._buf:
+                    return
+                batch, self._buf = self._buf, []
+            self._write(batch)
+
+    def _part(self, month: str) -> sqlite3.Connection:
+        """Connexion gardée sur la partition ; rouverte si le fichier a été supprimé (appel sous verrou partagé)."""
+        try:
+            inode = os.stat(_kpi_part_path(month)).st_ino
+        except FileNotFoundError:
+            inode = None
+        held = self._parts.get(month)
+        if held is not None and held[1] != inode:
+            # partition supprimée par un autre worker (reset / compaction). L'inode comparé ne peut pas
+            # avoir été réattribué au nouveau fichier : notre connexion garde l'ancien ouvert.
+            held[0].close()
+            held = None
+        if held is None:
+            pcon = _kpi_part_db(month, create=True, check_same_thread=False)
+            held = self._parts[month] = (pcon, os.stat(_kpi_part_path(month)).st_ino)
+            # on ne garde ouverts que les deux mois les plus récents
+            for old in sorted(self._parts)[:-2]:
+                self._parts.pop(old)[0].close()
+        return held[0]
+
+    def _write(self, batch: list[tuple]):
+        if not batch:
+            return
+        t0 = time.perf_counter()
+        with self._io_lock:
+            try:
+                if self._con is None:
+                    self._con = _db(check_same_thread=False)
+                _kpi_store_rows(self._con, batch, self._part)
+            except Exception as e:
+                self.stats["failed"] += len(batch)
+                print(f"⚠️  KPI: échec d'écriture ({len(batch)} events): {e}")
+                return
+        ms = (time.perf_counter() - t0) * 1000
+        st = self.stats
+        st["written"] += len(batch)
+        st["flushes"] += 1
+        st["last_batch"] = len(batch)
+        st["last_flush_ms"] = round(ms, 3)
+        st["max_flush_ms"] = round(max(st["max_flush_ms"], ms), 3)
+        st["total_flush_ms"] += ms
+
+
+KPI_WRITER = KpiWriter(KPI_FLUSH_MAX_EVENTS, KPI_FLUSH_MAX_AGE_S, KPI_QUEUE_MAX)
+METRICS.gauges["kpi_queue_depth"] = lambda: KPI_WRITER.snapshot()["queue_depth"]
+
+
+class KpiGuard:
+    """
+    Filtre d'entrée de /api/kpi/* avant la file de l'écrivain : payloads trop gros,
+    doublons récents (retries keepalive/beacon) puis seaux à jetons session + IP.
+    Mémoire bornée (LRU) ; un event refusé par le débit n'est pas mémorisé comme vu,
+    il peut donc être renvoyé après le Retry-After.
+    """
+
+    def __init__(self, session_rate: float, session_burst: float, ip_rate: float, ip_burst: float,
+                 max_payload: int, dedup_window_s: float, max_keys: int):
+        self.limits = {"s": (session_rate, session_burst), "ip": (ip_rate, ip_burst)}
+        self.max_payload = max_payload
+        self.dedup_window_s = dedup_window_s
+        self.max_keys = max_keys
+        self._buckets: OrderedDict[str, list[float]] = OrderedDict()  # clé -> [jetons, instant]
+        self._seen: OrderedDict[bytes, float] = OrderedDict()          # empreinte -> 1re vue
+        self._lock = threading.Lock()
+        self.stats = {"accepted": 0, "rate_limited": 0, "duplicate": 0, "too_large": 0, "shed": 0, "body_too_large": 0}
+
+    def count(self, reason: str, n: int = 1):
+        if n <= 0:
+            return
+        with self._lock:
+            self.stats[reason] += n
+        if reason not in ("accepted", "body_too_large"):
+            METRICS.inc("kpi_events_dropped_total", (("reason", reason),), n)
+
+    def _grant(self, keys: list[tuple[str, str]], n: int, now: float) -> tuple[int, float]:
+        """Jetons accordés (min des seaux concernés) et attente avant le prochain jeton."""
+        buckets, granted = [], n
+        for kind, key in keys:
+            rate, burst = self.limits[kind]
+            if rate <= 0:
+                continue
+            b = self._buckets.get(key)
+            if b is None:
+                b = self._buckets[key] = [burst, now]
+                if len(self._buckets) > self.max_keys:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+                b[0] = min(burst, b[0] + (now - b[1]) * rate)
+                b[1] = now
+            buckets.append((b, rate))
+            granted = min(granted, int(b[0]))
+        for b, _ in buckets:
+            b[0] -= granted
+        wait = max(((1 - b[0]) / rate for b, rate in buckets if b[0] < 1), default=0.0) if granted < n else 0.0
+        return granted, wait
+
+    def admit(self, ip: str, session_id: str | None, rows: list[tuple]) -> tuple[list[tuple], float]:
+        """Lignes admises et Retry-After (s, 0 si aucune n'a été limitée en débit)."""
+        fresh, marks, batch = [], [], set()
+        too_large = duplicate = 0
+        with self._lock:
+            now = time.monotonic()
+            while self._seen and next(iter(self._seen.values())) < now - self.dedup_window_s:
+                self._seen.popitem(last=False)
+            for row in rows:
+                if len(row[3].encode("utf-8")) > self.max_payload:
+                    too_large += 1
+                    continue
+                mark = hashlib.blake2b(f"{row[1]}\x00{row[2]}\x00{row[3]}".encode("utf-8"), digest_size=12).digest()
+                if mark in self._seen or mark in batch:
+                    duplicate += 1
+                    continue
+                batch.add(mark)
+                fresh.append(row)
+                marks.append(mark)
+            keys = [("ip", f"ip:{ip}")] + ([("s", f"s:{session_id}")] if session_id else [])
+            granted, wait = self._grant(keys, len(fresh), now) if fresh else (0, 0.0)
+            for mark in marks[:granted]:
+                self._seen[mark] = now
+            while len(self._seen) > self.max_keys:
+                self._seen.popitem(last=False)
+        self.count("too_large", too_large)
+        self.count("duplicate", duplicate)
+        self.count("rate_limited", len(fresh) - granted)
+        return fresh[:granted], (wait if granted < len(fresh) else 0.0)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {**self.stats, "clients": len(self._buckets), "recent": len(self._seen)}
+
+
+KPI_GUARD = KpiGuard(KPI_RATE_SESSION_PER_S, KPI_RATE_SESSION_BURST, KPI_RATE_IP_PER_S, KPI_RATE_IP_BURST,
+                     KPI_MAX_PAYLOAD_BYTES, KPI_DEDUP_WINDOW_S, KPI_GUARD_MAX_KEYS)
+
+# ============================================================
+# KPI RÉTENTION (archivage des partitions anciennes)
+# ============================================================
+
+def _kpi_ndjson_line(row: tuple) -> str:
+    """Ligne NDJSON d'un event ; payload_json (déjà du JSON) est recopié tel quel."""
+    ts, sid, ev, payload, path, ua, ip = row
+    return '{"ts_utc":%s,"session_id":%s,"event":%s,"payload":%s,"path":%s,"ua":%s,"ip":%s}\n' % (
+        json.dumps(ts), json.dumps(sid), json.dumps(ev), payload or "{}",
+        json.dumps(path), json.dumps(ua), json.dumps(ip))
+
+
+def _gzip_chunks(chunks, level: int = 6):
+    """Compresse un flux à la volée (format gzip)."""
+    z = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = z.compress(chunk)
+        if data:
+            yield data
+    yield z.flush()
+
+
+def _kpi_archive_partition(month: str) -> int:
+    """
+    Écrit la partition d'un mois dans KPI_ARCHIVE_DIR (NDJSON gzip).
+    Si l'archive existe déjà, un nouveau membre gzip y est ajouté.
+    """
+    con = _kpi_part_db(month)
+    if con is None:
+        return 0
+    os.makedirs(KPI_ARCHIVE_DIR, exist_ok=True)
+    dest = _kpi_archive_path(month)
+    tmp = f"{dest}.{os.getpid()}.tmp"
+    count = 0
+
+    def lines():
+        nonlocal count
+        cur = con.execute(f"SELECT {_KPI_COLS} FROM kpi_events ORDER BY id")
+        while True:
+            rows = cur.fetchmany(KPI_EXPORT_CHUNK)
+            if not rows:
+                break
+            count += len(rows)
+            yield "".join(_kpi_ndjson_line(r) for r in rows).encode("utf-8")
+
+    try:
+        with open(tmp, "wb") as f:
+            for chunk in _gzip_chunks(lines()):
+                f.write(chunk)
+    finally:
+        con.close()
+    if os.path.exists(dest):
+        with open(dest, "ab") as out, open(tmp, "rb") as f:
+            out.write(f.read())
+        os.remove(tmp)
+    else:
+        os.replace(tmp, dest)
+    return count
+
+
+def _kpi_compact(retention_months: int = KPI_RETENTION_MONTHS) -> list[dict]:
+    """Archive puis supprime les partitions hors rétention (les rollups sont conservés)."""
+    if retention_months <= 0:
+        return []
+    now = datetime.now(timezone.utc)
+    idx = now.year * 12 + now.month - 1 - (retention_months - 1)
+    first_kept = f"{idx // 12:04d}-{idx % 12 + 1:02d}"
+    done = []
+    for month in _kpi_months():
+        if month >= first_kept:
+            break
+        KPI_WRITER.flush()
+        KPI_WRITER.release(month)
+        n = _kpi_archive_partition(month)
+        _kpi_drop_partition(month)
+        done.append({"month": month, "archived": n})
+        print(f"✅ KPI: {month} archivé ({n} events)")
+    return done
+
+
+_KPI_COMPACT_STOP = threading.Event()
+
+
+def _kpi_compaction_loop():
+    while not _KPI_COMPACT_STOP.is_set():
+        try:
+            with _process_lock("kpi-compaction", blocking=False) as acquired:
+                if acquired:
+                    _kpi_compact()
+        except Exception as e:
+            print(f"⚠️  KPI: échec de compaction: {e}")
+        _KPI_COMPACT_STOP.wait(KPI_COMPACT_INTERVAL_S)
+
+
+# ============================================================
+# DÉMARRAGE (warm-up avant de se déclarer prêt)
+# ============================================================
+
+_READY = threading.Event()
+_WARMUP: dict = {"steps": {}, "errors": {}}
+
+
+def _warmup():
+    """
+    Prépare tout ce qui coûte à la 1re requête : schéma KPI, catalogues parsés +
+    bundle compressé, store SQLite, index statique (variantes br/gzip), moteurs
+    reco / dimensionnement, index des fiches et manifeste images.
+    Une étape en échec est signalée par /health/ready sans bloquer les autres.
+    """
+    steps = [
+        ("kpi_schema", lambda: _db().close()),
+        ("catalogs", _bundle_get),
+        ("catalog_store", lambda: [_store_sync(kind) for kind in ALLOWED_CATALOGS]),
+        ("static", lambda: STATIC.load() if STATIC is not None else None),
+        ("recommend", _reco_engine),
+        ("sizing", _sizing_tables),
+        ("datasheets", _datasheet_index),
+        ("images", _image_manifest),
+    ]
+    for name, fn in steps:
+        t0 = time.perf_counter()
+        try:
+            fn()
+            _WARMUP["errors"].pop(name, None)
+        except Exception as e:
+            _WARMUP["errors"][name] = str(e)
+            print(f"⚠️  Warm-up {name}: {e}")
+        _WARMUP["steps"][name] = round((time.perf_counter() - t0) * 1000, 1)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    global SESSIONS
+    t0 = time.perf_counter()
+    _READY.clear()
+    SESSIONS = _sessions_open()
+    _warmup()
+    KPI_WRITER.start()
+    _KPI_COMPACT_STOP.clear()
+    if KPI_RETENTION_MONTHS > 0:
+        threading.Thread(target=_kpi_compaction_loop, name="kpi-compaction", daemon=True).start()
+    _METRICS_STOP.clear()
+    if METRICS_ENABLED:
+        threading.Thread(target=_metrics_loop, name="metrics", daemon=True).start()
+    _WARMUP["total_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+    _READY.set()
+    if ADMIN_PASSWORD == "admin":
+        print("⚠️  ATTENTION: Mot de passe admin par défaut! Définissez CONFIG_ADMIN_PASSWORD")
+    print(f"""
+╔══════════════════════════════════════════════════════════╗
+║  🚀 Configurateur Comelit - Ready                        ║
+╠══════════════════════════════════════════════════════════╣
+║  Frontend: {str(STATIC is not None):5} | Data: {str(os.path.isdir(DATA_DIR)):5}              ║
+║  PID: {os.getpid():<8} | Warm-up: {_WARMUP["total_ms"]:>8.0f} ms              ║
+╚══════════════════════════════════════════════════════════╝
+""")
+    yield
+    _READY.clear()
+    _report_pool_shutdown()
+    _METRICS_STOP.set()
+    _KPI_COMPACT_STOP.set()
+    KPI_WRITER.stop()
+    try:
+        os.remove(os.path.join(METRICS_DIR, f"{os.getpid()}.json"))
+    except OSError:
+        pass
+
+# ============================================================
+# APP FASTAPI
+# ============================================================
+
+app = FastAPI(
+    title="Configurateur Comelit",
+    version="1.0.0",
+    docs_url="/api/docs",
+    redoc_url="/api/redoc",
+    lifespan=lifespan,
+)
+
+# Middleware Gzip : compresse automatiquement les réponses > 500 bytes
+app.add_middleware(GZipMiddleware, minimum_size=500)
+
+# CORS
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+
+# Métriques HTTP (ajouté en dernier = le plus externe : tailles mesurées après compression)
+app.add_middleware(MetricsMiddleware)
+
+# ============================================================
+# SESSIONS ADMIN
+# ============================================================
+
+def _session_secret() -> bytes:
+    """
+    Clé HMAC des jetons : SESSION_SECRET, sinon un secret aléatoire créé une seule fois
+    sur disque (O_EXCL : tous les workers lisent le même). Le mot de passe admin entre
+    dans la dérivation, le changer invalide donc les sessions ouvertes.
+    """
+    secret = os.getenv("SESSION_SECRET", "").encode()
+    if not secret:
+        try:
+            fd = os.open(SESSION_SECRET_FILE, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+            with os.fdopen(fd, "w") as f:
+                f.write(secrets.token_hex(32))
+        except FileExistsError:
+            pass
+        for _ in range(50):  # fichier créé par un autre worker, pas encore écrit
+            with open(SESSION_SECRET_FILE) as f:
+                secret = f.read().strip().encode()
+            if secret:
+                break
+            time.sleep(0.01)
+    return hmac.new(secret, ADMIN_PASSWORD.encode(), hashlib.sha256).digest()
+
+
+def _b64url(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode("ascii")
+
+
+class SignedSessions:
+    """Jeton = payload.signature (HMAC-SHA256) : vérification sans état ni lecture."""
+
+    def __init__(self, key: bytes):
+        self.key = key
+
+    def issue(self, ttl: int) -> str:
+        payload = _b64url(json.dumps({"sid": secrets.token_urlsafe(12), "exp": int(time.time()) + ttl},
+                                     separators=(",", ":")).encode())
+        return payload + "." + _b64url(hmac.new(self.key, payload.encode(), hashlib.sha256).digest())
+
+    def verify(self, token: str) -> bool:
+        payload, _, sig = token.partition(".")
+        expected = _b64url(hmac.new(self.key, payload.encode(), hashlib.sha256).digest())
+        if not sig or not hmac.compare_digest(sig, expected):
+            return False
+        try:
+            data = json.loads(base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4)))
+            return float(data["exp"]) > time.time()
+        except (ValueError, KeyError, TypeError):
+            return False
+
+    def revoke(self, token: str):
+        pass  # sans état : le jeton expire de lui-même
+
+    def purge(self) -> int:
+        return 0
+
+
+class SqliteSessions:
+    """Table partagée (hash du jeton -> expiration) indexée sur l'expiration, purgée à chaque login."""
+
+    def __init__(self, path: str):
+        self.path = path
+        con = self._con()
+        try:
+            con.execute("CREATE TABLE IF NOT EXISTS sessions (token_hash TEXT PRIMARY KEY, exp REAL NOT NULL)")
+            con.execute("CREATE INDEX IF NOT EXISTS ix_sessions_exp ON sessions(exp)")
+            con.commit()
+        finally:
+            con.close()
+
+    def _con(self):
+        con = _sqlite_connect(self.path, timeout=10)
+        con.execute("PRAGMA journal_mode=WAL;")
+        con.execute("PRAGMA synchronous=NORMAL;")
+        return con
+
+    @staticmethod
+    def _hash(token: str) -> str:
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    def issue(self, ttl: int) -> str:
+        token = secrets.token_urlsafe(24)
+        con = self._con()
+        try:
+            with con:
+                con.execute("DELETE FROM sessions WHERE exp < ?", (time.time(),))
+                con.execute("INSERT INTO sessions (token_hash, exp) VALUES (?, ?)", (self._hash(token), time.time() + ttl))
+        finally:
+            con.close()
+        return token
+
+    def verify(self, token: str) -> bool:
+        con = self._con()
+        try:
+            row = con.execute("SELECT exp FROM sessions WHERE token_hash = ?", (self._hash(token),)).fetchone()
+        finally:
+            con.close()
+        return bool(row and row[0] > time.time())
+
+    def revoke(self, token: str):
+        con = self._con()
+        try:
+            with con:
+                con.execute("DELETE FROM sessions WHERE token_hash = ?", (self._hash(token),))
+        finally:
+            con.close()
+
+    def purge(self) -> int:
+        con = self._con()
+        try:
+            with con:
+                return con.execute("DELETE FROM sessions WHERE exp < ?", (time.time(),)).rowcount
+        finally:
+            con.close()
+
+
+if SESSION_BACKEND not in ("signed", "sqlite"):
+    raise RuntimeError(f"SESSION_BACKEND inconnu: {SESSION_BACKEND} (signed | sqlite)")
+
+# Créé au démarrage (lifespan) : l'import du module ne touche ni au secret ni à la base
+SESSIONS: SignedSessions | SqliteSessions | None = None
+
+
+def _sessions_open() -> SignedSessions | SqliteSessions:
+    if SESSION_BACKEND == "sqlite":
+        return SqliteSessions(SESSION_DB)
+    return SignedSessions(_session_secret())
+
+
+def _sessions() -> SignedSessions | SqliteSessions:
+    if SESSIONS is None:
+        raise HTTPException(status_code=503, detail="Démarrage en cours")
+    return SESSIONS
+
+# ============================================================
+# HELPERS
+# ============================================================
+
+def _bearer(auth: str | None) -> str:
+    if not auth or not auth.lower().startswith("bearer "):
+        raise HTTPException(status_code=401, detail="Missing token")
+    return auth.split(" ", 1)[1].strip()
+
+
+def require_auth(auth: str | None):
+    """Vérifie le token d'authentification."""
+    if not _sessions().verify(_bearer(auth)):
+        raise HTTPException(status_code=401, detail="Invalid or expired token")
+
+
+def _csv_path(kind: str) -> str:
+    """Retourne le chemin du fichier CSV."""
+    fn = ALLOWED_CATALOGS.get(kind)
+    if not fn:
+        raise HTTPException(status_code=404, detail="Unknown catalog")
+    p = os.path.abspath(os.path.join(DATA_DIR, fn))
+    if not p.startswith(os.path.abspath(DATA_DIR)):
+        raise HTTPException(status_code=400, detail="Bad path")
+    return p
+
+
+def _read_csv(path: str):
+    """Lit un fichier CSV et retourne colonnes + lignes."""
+    if not os.path.exists(path):
+        return [], []
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        reader = csv.DictReader(f)
+        return reader.fieldnames or [], list(reader)
+
+
+# ============================================================
+# CACHE CATALOGUES (relu seulement si mtime/taille du CSV changent)
+# ============================================================
+
+_CATALOG_CACHE: dict[str, dict] = {}
+_CATALOG_LOCK = threading.Lock()
+_CATALOG_BY_FILE = {fn: kind for kind, fn in ALLOWED_CATALOGS.items()}
+
+
+def _catalog_load(kind: str) -> dict:
+    """
+    Retourne le catalogue parsé (colonnes, lignes), ses octets bruts et un ETag fort.
+    Les lignes sont partagées entre requêtes : ne pas les modifier.
+    """
+    path = _csv_path(kind)
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return {"path": path, "stamp": None, "raw": b"", "etag": '"empty"', "version": 0, "columns": [], "rows": []}
+    entry = _CATALOG_CACHE.get(kind)
+    if entry and entry["stamp"] == (st.st_mtime_ns, st.st_size):
+        return entry
+    with _CATALOG_LOCK, METRICS.timed("catalog_parse"):
+        with open(path, "rb") as f:
+            raw = f.read()
+            st = os.fstat(f.fileno())
+        reader = csv.DictReader(io.StringIO(raw.decode("utf-8-sig"), newline=""))
+        rows = list(reader)
+        etag = '"%s"' % hashlib.sha256(raw).hexdigest()[:32]
+        entry = {
+            "path": path,
+            "stamp": (st.st_mtime_ns, st.st_size),
+            "raw": raw,
+            "etag": etag,
+            "version": _catalog_version(kind, etag),
+            "columns": reader.fieldnames or [],
+            "rows": rows,
+        }
+        _CATALOG_CACHE[kind] = entry
+    return entry
+
+
+def _etag_match(if_none_match: str | None, etag: str) -> bool:
+    """Compare un en-tête If-None-Match (liste, W/, *) à un ETag."""
+    if not if_none_match:
+        return False
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*" or tag.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+def _not_modified(etag: str, cache_control: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": cache_control})
+
+
+# ============================================================
+# BUNDLE CATALOGUES (1 requête, valeurs typées, pré-compressé)
+# ============================================================
+
+_LOCALES = ("en", "it", "es", "de")  # "fr" = colonne de base
+_PIPE_LIST_COLUMNS = {"compatible_with", "screen_compatible_with"}
+_BUNDLE: dict = {}
+_BUNDLE_LOCK = threading.Lock()
+
+
+def _is_text_column(col: str) -> bool:
+    """Colonnes jamais typées (ids, noms, URLs)."""
+    c = col.lower()
+    return c == "id" or c.endswith("_id") or "name" in c or "url" in c
+
+
+def _to_number(v: str):
+    try:
+        n = float(v.replace(",", "."))
+    except ValueError:
+        return None
+    if n != n or n in (float("inf"), float("-inf")):
+        return None
+    return int(n) if n.is_integer() and "." not in v and "," not in v else n
+
+
+def _column_types(columns: list[str], rows: list[dict]) -> dict[str, str]:
+    """Déduit le type de chaque colonne : bool, number, list ou str."""
+    types = {}
+    for col in columns:
+        if col in _PIPE_LIST_COLUMNS:
+            types[col] = "list"
+            continue
+        if _is_text_column(col):
+            types[col] = "str"
+            continue
+        values = [str(r.get(col) or "").strip() for r in rows]
+        values = [v for v in values if v]
+        if values and all(v.lower() in ("true", "false") for v in values):
+            types[col] = "bool"
+        elif values and all(_to_number(v) is not None for v in values):
+            types[col] = "number"
+        else:
+            types[col] = "str"
+    return types
+
+
+def _typed_rows(columns: list[str], rows: list[dict], types: dict | None = None) -> list[dict]:
+    """
+    Convertit les lignes CSV en objets typés ; "" et "false" (marqueur d'absence)
+    deviennent null, les noms traduits sont regroupés sous "i18n".
+    `types` permet d'imposer les types du catalogue complet (pages partielles).
+    """
+    types = types or _column_types(columns, rows)
+    localized = {c for c in columns if c[-3:-2] == "_" and c[-2:] in _LOCALES and c[:-3] in columns}
+    out = []
+    for r in rows:
+        row, i18n = {}, {}
+        for col in columns:
+            v = str(r.get(col) or "").strip()
+            if col in localized:
+                if v and v.lower() != "false":
+                    i18n.setdefault(col[:-3], {})[col[-2:]] = v
+                continue
+            t = types[col]
+            if t == "bool":
+                row[col] = v.lower() == "true" if v else None
+            elif not v or v.lower() == "false":
+                row[col] = [] if t == "list" else None
+            elif t == "number":
+                row[col] = _to_number(v)
+            elif t == "list":
+                row[col] = [x.strip() for x in v.split("|") if x.strip()]
+            else:
+                row[col] = v
+        if i18n:
+            row["i18n"] = i18n
+        out.append(row)
+    return out
+
+
+def _bundle_get() -> dict:
+    """Bundle courant ; reconstruit seulement si un catalogue a changé (ETag)."""
+    entries = {kind: _catalog_load(kind) for kind in ALLOWED_CATALOGS}
+    version = hashlib.sha256("".join(e["etag"] for e in entries.values()).encode()).hexdigest()[:32]
+    global _BUNDLE
+    bundle = _BUNDLE
+    if bundle.get("version") == version:
+        return bundle
+    with _BUNDLE_LOCK:
+        if _BUNDLE.get("version") == version:
+            return _BUNDLE
+        catalogs = {}
+        accessories = {}
+        for kind, e in entries.items():
+            rows = _typed_rows(e["columns"], e["rows"])
+            if kind == "accessories":
+                accessories = {r["camera_id"]: r for r in rows if r.get("camera_id")}
+            else:
+                catalogs[kind] = [r for r in rows if r.get("id")]
+        body = json.dumps(
+            {"version": version, "versions": {k: e["version"] for k, e in entries.items()},
+             "locales": ["fr", *_LOCALES], "catalogs": catalogs, "accessories": accessories},
+            ensure_ascii=False, separators=(",", ":"),
+        ).encode("utf-8")
+        # nouveau dict publié en une affectation : un lecteur voit l'ancien ou le nouveau, jamais un mélange
+        _BUNDLE = {
+            "version": version,
+            "etag": f'"{version}"',
+            "json": body,
+            "gzip": b"".join(_gzip_chunks([body], level=9)),
+        }
+        return _BUNDLE
+
+
+# ============================================================
+# ÉCRITURE CATALOGUES (validation, écriture atomique, versions, historique)
+# ============================================================
+
+# Colonnes obligatoires par catalogue (schéma serveur)
+_CATALOG_SCHEMAS = {
+    "cameras": ["id", "name", "form_factor", "resolution_mp", "image_url", "datasheet_url"],
+    "nvrs": ["id", "name", "channels", "nvr_output", "image_url", "datasheet_url"],
+    "hdds": ["id", "name", "capacity_tb"],
+    "switches": ["id", "name"],
+    "accessories": ["camera_id"],
+    "screens": ["id", "name", "size_inch", "format", "vesa", "Resolution", "image_url", "datasheet_url"],
+    "enclosures": ["id", "name", "screen_compatible_with", "compatible_with", "image_url", "datasheet_url"],
+    "signage": ["id", "name", "image_url", "datasheet_url"],
+}
+# Colonnes numériques (vide ou "false" toléré)
+_CATALOG_NUMERIC = {
+    "cameras": {"resolution_mp", "sensor_count", "focal_min_mm", "focal_max_mm", "dori_detection_m",
+                "dori_observation_m", "dori_recognition_m", "dori_identification_m", "ir_range_m",
+                "white_led_range_m", "ip", "ik", "poe_w", "bitrate_mbps_typical", "streams_max"},
+    "nvrs": {"channels", "max_in_mbps", "nvr_output", "hdd_bays", "max_hdd_tb_per_bay", "poe_ports", "poe_budget_w"},
+    "hdds": {"capacity_tb"},
+    "switches": {"poe_ports", "poe_budget_w", "uplink_gbps"},
+    "screens": {"size_inch"},
+}
+_CATALOG_KEYS = {"accessories": "camera_id"}  # clé de ligne (défaut : id)
+_CATALOG_WRITE_LOCKS = {kind: threading.Lock() for kind in ALLOWED_CATALOGS}
+
+
+def _catalog_key(kind: str) -> str:
+    return _CATALOG_KEYS.get(kind, "id")
+
+
+def _catalog_validate(kind: str, columns: list[str], rows: list[dict]) -> list[str]:
+    """Erreurs bloquantes (colonnes, clés vides ou en double, valeurs non numériques)."""
+    errors = []
+    if not columns:
+        return ["colonnes vides"]
+    dup_cols = sorted({c for c in columns if columns.count(c) > 1})
+    if dup_cols:
+        errors.append("colonnes en double: " + ", ".join(dup_cols))
+    missing = [c for c in _CATALOG_SCHEMAS.get(kind, []) if c not in columns]
+    if missing:
+        errors.append("colonnes manquantes: " + ", ".join(missing))
+    key = _catalog_key(kind)
+    if key in columns:
+        seen = set()
+        for i, r in enumerate(rows):
+            k = str(r.get(key) or "").strip()
+            if not k:
+                errors.append(f"ligne {i + 1}: {key} vide")
+            elif k in seen:
+                errors.append(f"ligne {i + 1}: {key} en double ({k})")
+            seen.add(k)
+    for col in _CATALOG_NUMERIC.get(kind, set()) & set(columns):
+        for r in rows:
+            v = str(r.get(col) or "").strip()
+            if v and v.lower() != "false" and _to_number(v) is None:
+                errors.append(f"{r.get(key) or '?'}: {col} non numérique ({v})")
+    return errors[:20]
+
+
+def _csv_bytes(columns: list[str], rows: list[dict]) -> bytes:
+    buf = io.StringIO(newline="")
+    w = csv.DictWriter(buf, fieldnames=columns, extrasaction="ignore", lineterminator="\r\n")
+    w.writeheader()
+    for r in rows:
+        w.writerow({c: str(r.get(c) or "") for c in columns})
+    return buf.getvalue().encode("utf-8")
+
+
+def _atomic_write(path: str, data: bytes):
+    """Fichier temporaire dans le même dossier, fsync puis renommage (lecteurs jamais sur un fichier partiel)."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{secrets.token_hex(4)}.tmp"
+    try:
+        with open(tmp, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def _catalog_history_dir(kind: str) -> str:
+    return os.path.join(CATALOG_HISTORY_DIR, kind)
+
+
+def _catalog_history(kind: str) -> list[dict]:
+    try:
+        with open(os.path.join(_catalog_history_dir(kind), "index.json"), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return []
+
+
+def _catalog_version(kind: str, etag: str) -> int:
+    """Version du contenu courant : dernière version enregistrée, +1 si le fichier a changé hors API."""
+    hist = _catalog_history(kind)
+    if not hist:
+        return 1
+    return hist[-1]["version"] if hist[-1]["etag"] == etag else hist[-1]["version"] + 1
+
+
+def _catalog_snapshot(kind: str, hist: list[dict], version: int, raw: bytes, etag: str, rows: int, op: str):
+    d = _catalog_history_dir(kind)
+    _atomic_write(os.path.join(d, f"{version:06d}.csv"), raw)
+    hist.append({"version": version, "etag": etag, "at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                 "rows": rows, "op": op})
+    for old in hist[:-CATALOG_HISTORY_KEEP]:
+        try:
+            os.remove(os.path.join(d, f"{old['version']:06d}.csv"))
+        except FileNotFoundError:
+            pass
+    del hist[:-CATALOG_HISTORY_KEEP]
+    _atomic_write(os.path.join(d, "index.json"), json.dumps(hist, indent=1).encode("utf-8"))
+
+
+def _catalog_write(kind: str, op: str, build, base_version: int | None = None) -> dict:
+    """
+    Écriture sérialisée par catalogue : build(entrée courante) -> (colonnes, lignes),
+    validation, écriture atomique, nouvelle version + instantané d'historique.
+    """
+    path = _csv_path(kind)
+    with _CATALOG_WRITE_LOCKS[kind], _process_lock(f"catalog-{kind}"), METRICS.timed("catalog_write"):
+        current = _catalog_load(kind)
+        if base_version is not None and base_version != current["version"]:
+            raise HTTPException(409, {"error": "version_conflict", "version": current["version"]})
+        columns, rows = build(current)
+        columns = [c.strip() for c in columns if c and c.strip()]
+        errors = _catalog_validate(kind, columns, rows)
+        if errors:
+            raise HTTPException(422, {"error": "invalid_catalog", "errors": errors})
+        raw = _csv_bytes(columns, rows)
+        if raw == current["raw"]:
+            return current  # aucun changement : pas de nouvelle version
+        hist = _catalog_history(kind)
+        if current["stamp"] is not None and (not hist or hist[-1]["etag"] != current["etag"]):
+            # contenu courant jamais enregistré (état initial ou modif hors API) : gardé pour rollback
+            _catalog_snapshot(kind, hist, current["version"], current["raw"], current["etag"], len(current["rows"]), "import")
+        version = (hist[-1]["version"] if hist else 0) + 1
+        etag = '"%s"' % hashlib.sha256(raw).hexdigest()[:32]
+        _catalog_snapshot(kind, hist, version, raw, etag, len(rows), op)
+        _atomic_write(path, raw)
+        with _CATALOG_LOCK:
+            _CATALOG_CACHE.pop(kind, None)
+        entry = _catalog_load(kind)
+    _bundle_get()  # recalcul immédiat du bundle public
+    _store_sync(kind)
+    return entry
+
+
+def _catalog_patch_rows(kind: str, current: dict, upsert: list[dict], delete: list[str], stats: dict) -> tuple[list[str], list[dict]]:
+    """
+    Applique suppressions puis upserts (fusion cellule par cellule) sur une copie des lignes :
+    une clé supprimée puis ré-insérée dans le même PATCH repart d'une ligne vide.
+    """
+    key, columns = _catalog_key(kind), list(current["columns"])
+    known = {str(r.get(key) or "").strip() for r in current["rows"]}
+    errors = []
+    gone = set()
+    for k in delete:
+        k = str(k or "").strip()
+        if k not in known:
+            errors.append(f"{key} inconnu: {k}")
+        gone.add(k)
+    rows = [dict(r) for r in current["rows"] if str(r.get(key) or "").strip() not in gone]
+    pos = {str(r.get(key) or "").strip(): i for i, r in enumerate(rows)}
+    for patch in upsert:
+        k = str(patch.get(key) or "").strip()
+        unknown = [c for c in patch if c not in columns]
+        if not k:
+            errors.append(f"{key} manquant dans une ligne")
+            continue
+        if unknown:
+            errors.append(f"{k}: colonnes inconnues: {', '.join(unknown)}")
+            continue
+        values = {c: "" if v is None else str(v) for c, v in patch.items()}
+        if k in pos:
+            rows[pos[k]].update(values)
+            stats["updated"] += 1
+        else:
+            pos[k] = len(rows)
+            rows.append({**{c: "" for c in columns}, **values})
+            stats["inserted"] += 1
+    if errors:
+        raise HTTPException(422, {"error": "invalid_patch", "errors": errors[:20]})
+    stats["deleted"] = len(gone)
+    return columns, rows
+
+
+# ============================================================
+# CATALOGUE SQLITE (tables typées indexées + requêtes filtrées)
+# ============================================================
+
+_STORE_LOCK = threading.Lock()
+_STORE_OPS = {"eq": "=", "ne": "!=", "gt": ">", "gte": ">=", "lt": "<", "lte": "<="}
+QUERY_MAX_LIMIT = 1000
+
+
+def _store_db():
+    """Connexion au store catalogue (WAL, une par appel comme pour _db)."""
+    con = _sqlite_connect(CATALOG_DB, timeout=10, check_same_thread=False)
+    con.execute("PRAGMA journal_mode=WAL;")
+    con.execute("PRAGMA synchronous=NORMAL;")
+    con.execute("""
+        CREATE TABLE IF NOT EXISTS _catalog_meta (
+            kind TEXT PRIMARY KEY,
+            etag TEXT NOT NULL,
+            version INTEGER NOT NULL,
+            types TEXT NOT NULL
+        )
+    """)
+    return con
+
+
+def _qcol(col: str) -> str:
+    return '"' + col.replace('"', '""') + '"'
+
+
+def _store_value(t: str, v: str):
+    """Valeur CSV -> valeur SQLite typée ("" / "false" = NULL, sauf colonnes booléennes)."""
+    v = (v or "").strip()
+    if t == "bool":
+        return None if not v else int(v.lower() == "true")
+    if not v or v.lower() == "false":
+        return None
+    if t == "number":
+        return _to_number(v)
+    return v
+
+
+def _store_sync(kind: str, con=None) -> dict:
+    """
+    (Ré)importe le CSV dans la table cat_<kind> si son ETag a changé.
+    Retourne {"etag", "version", "types"} de la table à jour.
+    """
+    entry = _catalog_load(kind)
+    own = con is None
+    con = con or _store_db()
+    try:
+        row = con.execute("SELECT etag, version, types FROM _catalog_meta WHERE kind=?", (kind,)).fetchone()
+        if row and row[0] == entry["etag"]:
+            return {"etag": row[0], "version": row[1], "types": json.loads(row[2])}
+        with _STORE_LOCK:
+            columns, rows = entry["columns"], entry["rows"]
+            types = _column_types(columns, rows)
+            table = _qcol(f"cat_{kind}")
+            sql_types = {"number": "REAL", "bool": "INTEGER", "list": "TEXT", "str": "TEXT"}
+            con.execute("BEGIN IMMEDIATE")
+            con.execute(f"DROP TABLE IF EXISTS {table}")
+            con.execute(f"CREATE TABLE {table} (_pos INTEGER PRIMARY KEY, _raw TEXT NOT NULL, "
+                        + ", ".join(f"{_qcol(c)} {sql_types[types[c]]}" for c in columns) + ")")
+            con.executemany(
+                f"INSERT INTO {table} VALUES (?, ?{', ?' * len(columns)})",
+                [(i, json.dumps({c: r.get(c) or "" for c in columns}, ensure_ascii=False),
+                  *(_store_value(types[c], r.get(c)) for c in columns)) for i, r in enumerate(rows)],
+            )
+            key = _catalog_key(kind)
+            for c in columns:
+                if c == key or types[c] in ("number", "bool"):
+                    con.execute(f"CREATE INDEX {_qcol(f'ix_{kind}_{c}')} ON {table} ({_qcol(c)})")
+            con.execute("INSERT OR REPLACE INTO _catalog_meta (kind, etag, version, types) VALUES (?, ?, ?, ?)",
+                        (kind, entry["etag"], entry["version"], json.dumps(types)))
+            con.execute("COMMIT")
+        return {"etag": entry["etag"], "version": entry["version"], "types": types}
+    except Exception:
+        if con.in_transaction:
+            con.execute("ROLLBACK")
+        raise
+    finally:
+        if own:
+            con.close()
+
+
+def _store_filter(types: dict, spec: str) -> tuple[str, list]:
+    """Filtre "colonne:op:valeur" -> (SQL, paramètres). Ops : eq ne gt gte lt lte in like prefix has null notnull."""
+    col, _, rest = spec.partition(":")
+    op, _, value = rest.partition(":")
+    if col not in types:
+        raise HTTPException(400, f"Colonne inconnue: {col}")
+    t, qc = types[col], _qcol(col)
+
+    def typed(v: str):
+        if t == "bool":
+            return int(v.strip().lower() in ("1", "true", "yes", "oui"))
+        if t == "number":
+            n = _to_number(v.strip())
+            if n is None:
+                raise HTTPException(400, f"Valeur numérique attendue pour {col}: {v}")
+            return n
+        return v
+
+    if op in _STORE_OPS:
+        return f"{qc} {_STORE_OPS[op]} ?", [typed(value)]
+    if op == "in":
+        vals = [typed(v) for v in value.split("|") if v != ""]
+        if not vals:
+            raise HTTPException(400, f"Liste vide pour {col}")
+        return f"{qc} IN ({', '.join('?' * len(vals))})", vals
+    if op == "like":
+        return f"{qc} LIKE ? ESCAPE '\\'", ["%" + value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"]
+    if op == "prefix":
+        return f"{qc} >= ? AND {qc} < ?", [value, value + "\U0010ffff"]
+    if op == "has":  # élément d'une liste "A|B|C"
+        return f"('|' || {qc} || '|') LIKE ? ESCAPE '\\'", ["%|" + value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "|%"]
+    if op == "null":
+        return f"{qc} IS NULL", []
+    if op == "notnull":
+        return f"{qc} IS NOT NULL", []
+    raise HTTPException(400, f"Opérateur inconnu: {op}")
+
+
+def _store_query(kind: str, fields: list[str], filters: list[str], sort: list[str], limit: int, offset: int) -> dict:
+    con = _store_db()
+    try:
+        meta = _store_sync(kind, con)
+        types = meta["types"]
+        for f in fields:
+            if f not in types:
+                raise HTTPException(400, f"Colonne inconnue: {f}")
+        clauses, params = [], []
+        for spec in filters:
+            sql, p = _store_filter(types, spec)
+            clauses.append(f"({sql})")
+            params += p
+        where = " WHERE " + " AND ".join(clauses) if clauses else ""
+        order = []
+        for s in sort:
+            col = s.lstrip("-")
+            if col not in types:
+                raise HTTPException(400, f"Colonne inconnue: {col}")
+            # valeurs absentes toujours en fin de liste
+            order.append(f"{_qcol(col)} IS NULL, {_qcol(col)} {'DESC' if s.startswith('-') else 'ASC'}")
+        order.append("_pos")
+        table = _qcol(f"cat_{kind}")
+        total = con.execute(f"SELECT COUNT(*) FROM {table}{where}", params).fetchone()[0]
+        cur = con.execute(f"SELECT _raw FROM {table}{where} ORDER BY {', '.join(order)} LIMIT ? OFFSET ?",
+                          params + [limit, offset])
+        raws = [json.loads(r[0]) for r in cur]
+    finally:
+        con.close()
+    columns = fields or list(types)
+    return {"kind": kind, "version": meta["version"], "etag": meta["etag"], "total": total,
+            "limit": limit, "offset": offset, "columns": columns, "types": {c: types[c] for c in columns},
+            "raws": [{c: r.get(c, "") for c in columns} for r in raws]}
+
+
+# ============================================================
+# RECOMMANDATION CAMÉRAS (portage serveur du moteur de app.js)
+# ============================================================
+
+RULES_PATH = os.path.join(DATA_DIR, "rules.json")
+RECO_MEMO_SIZE = 4096  # réponses mémorisées par version de catalogue
+
+# Profils métier (identiques à CAMERA_PROFILES côté frontend)
+_CAMERA_PROFILES = {
+    "Tertiaire|interieur": {"preferred": ["turret", "dome", "fish-eye"], "penalized": ["ptz", "lpr"], "ptzMinDistance": 50},
+    "Tertiaire|exterieur": {"preferred": ["bullet", "dome"], "penalized": ["fish-eye", "lpr"], "ptzMinDistance": 35},
+    "Résidentiel|interieur": {"preferred": ["turret", "dome"], "penalized": ["ptz", "bullet", "lpr"], "ptzMinDistance": 999},
+    "Résidentiel|exterieur": {"preferred": ["bullet", "turret"], "penalized": ["ptz", "lpr", "fish-eye"], "ptzMinDistance": 60},
+    "Logement collectif|interieur": {"preferred": ["dome"], "penalized": ["ptz", "bullet", "lpr", "turret"], "ptzMinDistance": 999},
+    "Logement collectif|exterieur": {"preferred": ["bullet", "dome"], "penalized": ["lpr", "fish-eye", "turret"], "ptzMinDistance": 35},
+    "Parking|interieur": {"preferred": ["dome"], "penalized": ["turret", "ptz", "bullet", "fish-eye"], "ptzMinDistance": 999},
+    "Parking|exterieur": {"preferred": ["dome", "bullet", "lpr"], "penalized": ["turret", "fish-eye"], "ptzMinDistance": 40},
+}
+
+_DORI_KEYS = ("dori_detection_m", "dori_observation_m", "dori_recognition_m", "dori_identification_m")
+
+
+def _camera_profile(use_case: str, emplacement: str) -> dict:
+    p = _CAMERA_PROFILES.get(f"{use_case}|{emplacement}")
+    if p:
+        return p
+    if emplacement == "interieur":
+        return {"preferred": ["turret", "dome"], "penalized": ["ptz", "lpr"], "ptzMinDistance": 50}
+    if emplacement == "exterieur":
+        return {"preferred": ["bullet", "dome", "turret"], "penalized": [], "ptzMinDistance": 40}
+    return {"preferred": [], "penalized": [], "ptzMinDistance": 40}
+
+
+def _norm_emplacement(v) -> str:
+    s = str(v or "").strip().lower()
+    if s.startswith("ext"):
+        return "exterieur"
+    if s.startswith("int"):
+        return "interieur"
+    return s
+
+
+def _objective_dori_key(objective: str) -> str:
+    return {
+        "detection": "dori_detection_m",
+        "observation": "dori_observation_m",
+        "reconnaissance": "dori_recognition_m",
+    }.get(objective, "dori_identification_m")
+
+
+def _num(v, default=None):
+    if v is None or isinstance(v, bool):
+        return default
+    if isinstance(v, (int, float)):
+        return v
+    n = _to_number(str(v).strip()) if str(v).strip() else None
+    return default if n is None else n
+
+
+def _clamp(n, a, b):
+    return max(a, min(b, n))
+
+
+class RecommendEngine:
+    """
+    Catalogue caméras indexé pour la recommandation :
+    - ensembles par use case / emplacement / type,
+    - tableaux triés (DORI par objectif, focale, IP) interrogés par bisect,
+    - règles rules.json appliquées par intersections d'ensembles,
+    - résultats mémorisés par tuple de réponses normalisé.
+    """
+
+    def __init__(self, cameras: list[dict], rules: dict, version: str):
+        self.version = version
+        self.rules = rules or {}
+        self.weights = self.rules.get("scoringWeights") or {}
+        self.cams = [self._normalize(r) for r in cameras if r.get("id")]
+        self.all = frozenset(range(len(self.cams)))
+        self.by_use_case: dict[str, set[int]] = {}
+        self.by_type: dict[str, set[int]] = {}
+        self.indoor, self.outdoor = set(), set()
+        # valeur inconnue : la caméra n'est pas éliminée sur ce critère
+        self.unknown_focal, self.unknown_ip = set(), set()
+        for i, c in enumerate(self.cams):
+            for u in c["use_cases"]:
+                self.by_use_case.setdefault(u, set()).add(i)
+            self.by_type.setdefault(c["type"], set()).add(i)
+            if c["emplacement_interieur"]:
+                self.indoor.add(i)
+            if c["emplacement_exterieur"]:
+                self.outdoor.add(i)
+            if not c["focal_reach_mm"]:
+                self.unknown_focal.add(i)
+            if c["ip"] is None:
+                self.unknown_ip.add(i)
+        self.sorted = {k: self._sorted_index(k) for k in (*_DORI_KEYS, "focal_reach_mm", "ip")}
+        self._memo: dict[tuple, dict] = {}
+        self._memo_lock = threading.Lock()
+
+    @staticmethod
+    def _normalize(r: dict) -> dict:
+        mic = r.get("Microphone", r.get("microphone"))
+        c = {
+            "id": str(r.get("id") or "").strip(),
+            "name": r.get("name") or "",
+            "type": str(r.get("form_factor") or r.get("type") or "").lower().strip(),
+            "emplacement_interieur": r.get("Emplacement_Interieur") is True or str(r.get("Emplacement_Interieur")).lower() == "true",
+            "emplacement_exterieur": r.get("Emplacement_Exterieur") is True or str(r.get("Emplacement_Exterieur")).lower() == "true",
+            "resolution_mp": _num(r.get("resolution_mp"), 0),
+            "sensor_count": _num(r.get("sensor_count"), 0),
+            "focal_min_mm": _num(r.get("focal_min_mm")),
+            "focal_max_mm": _num(r.get("focal_max_mm")),
+            "ir_range_m": _num(r.get("ir_range_m"), 0),
+            "low_light": bool(str(r.get("low_light_mode") or "").strip()),
+            "ip": _num(r.get("ip")),
+            "ik": _num(r.get("ik")),
+            "microphone": mic is True or str(mic).lower() == "true",
+            "poe_w": _num(r.get("poe_w"), 0),
+            "use_cases": [str(u).strip() for u in (r.get("use_cases_01"), r.get("use_cases_02"), r.get("use_cases_03"))
+                          if u and str(u).strip().lower() != "false"],
+        }
+        for k in _DORI_KEYS:
+            c[k] = _num(r.get(k), 0)
+        # portée focale utile (varifocale : focale max)
+        c["focal_reach_mm"] = max(x for x in (c["focal_min_mm"], c["focal_max_mm"], 0) if x is not None)
+        return c
+
+    def _sorted_index(self, key: str) -> tuple[list, list]:
+        pairs = sorted((c[key], i) for i, c in enumerate(self.cams) if c[key] is not None)
+        return [v for v, _ in pairs], [i for _, i in pairs]
+
+    def _at_least(self, key: str, threshold: float) -> set[int]:
+        """Indices des caméras dont `key` >= threshold (recherche dichotomique)."""
+        values, idx = self.sorted[key]
+        return set(idx[bisect.bisect_left(values, threshold):])
+
+    # --- règles rules.json ---
+
+    def _eliminated(self, distance: float, emplacement: str) -> tuple[set[int], bool]:
+        """Caméras éliminées par rules.json + autorisation PTZ."""
+        min_focal = min_ip = 0
+        allow_ptz = None
+        for rule in self.rules.get("elimination") or []:
+            cond, then = rule.get("if") or {}, rule.get("then") or {}
+            if "distance_gt" in cond and not distance > cond["distance_gt"]:
+                continue
+            if "exterior" in cond and (emplacement == "exterieur") != bool(cond["exterior"]):
+                continue
+            min_focal = max(min_focal, then.get("min_focal_mm") or 0)
+            min_ip = max(min_ip, then.get("min_ip") or 0)
+            if "allow_ptz" in then:
+                allow_ptz = bool(then["allow_ptz"])
+        if allow_ptz is None:
+            # PTZ interdite tant qu'aucune règle déclenchée ne l'autorise (si les règles en parlent)
+            allow_ptz = not any("allow_ptz" in (r.get("then") or {}) for r in self.rules.get("elimination") or [])
+        out = set()
+        if min_focal:
+            out |= self.all - self._at_least("focal_reach_mm", min_focal) - self.unknown_focal
+        if min_ip:
+            out |= self.all - self._at_least("ip", min_ip) - self.unknown_ip
+        if not allow_ptz:
+            out |= self.by_type.get("ptz", set())
+        return out, allow_ptz
+
+    def _rules_score(self, c: dict, ctx: dict, from_use_case: bool) -> float:
+        """Bonus pondérés par scoringWeights (départage à score égal)."""
+        w = self.weights
+        dist, ext = ctx["distance"], ctx["emplacement"] == "exterieur"
+        dori = c[ctx["dori_key"]] or 0
+        checks = {
+            "match_site": from_use_case,
+            "objective_match": dist > 0 and dori >= dist,
+            "low_light": c["low_light"],
+            "vandalism_ik10": (c["ik"] or 0) >= 10,
+            "exterior_ip67": ext and (c["ip"] or 0) >= 67,
+            "high_resolution_8mp": c["resolution_mp"] >= 8,
+            "long_distance_margin": dist > 0 and dori >= 1.5 * dist,
+            "audio": c["microphone"],
+            "discreet_dome": c["type"] == "dome" and not ext,
+            "ptz_bonus": c["type"] == "ptz" and ctx["allow_ptz"],
+            "thermal_bonus": "therm" in c["type"],
+            "multisensor_bonus": c["sensor_count"] > 1,
+            "fisheye_bonus": c["type"] == "fish-eye",
+        }
+        return float(sum(w.get(k, 0) for k, ok in checks.items() if ok))
+
+    # --- scores (identiques à _scoreCamera / scoreCameraForBlock) ---
+
+    @staticmethod
+    def _score(c: dict, ctx: dict, from_use_case: bool) -> tuple[float, list[str]]:
+        emplacement, objective = ctx["emplacement"], ctx["objective"]
+        distance, use_case, profile = ctx["distance"], ctx["use_case"], ctx["profile"]
+        cam_type = c["type"]
+        dori = c[ctx["dori_key"]] or 0
+        score, reasons = 0.0, []
+
+        if from_use_case:
+            score += 2
+        else:
+            score -= 1
+            reasons.append("Hors gamme " + use_case)
+
+        if distance > 0:
+            ratio = dori / distance
+            if 0.95 <= ratio <= 1.5:
+                score += 5
+                reasons.append(f"DORI optimal (x{ratio:.1f})")
+            elif 1.5 < ratio <= 2.5:
+                score += 4
+                reasons.append("Bonne marge DORI")
+            elif 2.5 < ratio <= 5.0:
+                score += 2
+                reasons.append("Surdimensionné")
+            elif ratio > 5.0:
+                pass
+            elif ratio >= 0.7:
+                score += 3
+                reasons.append(f"DORI limite (x{ratio:.1f})")
+            else:
+                reasons.append("DORI insuffisant")
+            if ratio > 10.0:
+                score -= 3
+            elif ratio > 5.0:
+                score -= 2
+            elif ratio > 3.0:
+                score -= 1
+        else:
+            score += 1
+
+        mp = c["resolution_mp"]
+        if mp >= 8:
+            score += 1.5
+            reasons.append("8MP+")
+        elif mp >= 4:
+            score += 1
+
+        ir = c["ir_range_m"]
+        if emplacement == "exterieur" and ir >= 30:
+            score += 1
+            reasons.append("Bon IR")
+        elif ir >= 20:
+            score += 0.5
+
+        if c["low_light"]:
+            score += 0.5
+
+        if cam_type in profile["preferred"]:
+            score += 3
+            reasons.append(f"Type recommandé ({cam_type})")
+        elif cam_type in profile["penalized"]:
+            score -= 3
+            reasons.append(f"Type inadapté ({cam_type})")
+
+        if cam_type == "ptz":
+            min_dist = profile["ptzMinDistance"] or 40
+            if distance >= min_dist:
+                score += 2
+                reasons.append(f"PTZ justifiée ({distance:g}m)")
+            elif distance <= 0:
+                score -= 2
+            else:
+                score -= 4
+                reasons.append(f"PTZ injustifiée (< {min_dist}m)")
+
+        if cam_type == "lpr" and use_case != "Parking":
+            score -= 4
+
+        poe = c["poe_w"]
+        if poe > 30:
+            score -= 1
+        elif 0 < poe <= 8:
+            score += 0.5
+            reasons.append("PoE économe")
+
+        if (c["ik"] or 0) >= 10:
+            if use_case in ("Parking", "Logement collectif"):
+                score += 2
+                reasons.append("IK10")
+            elif emplacement == "exterieur":
+                score += 1
+        if (c["ip"] or 0) >= 67 and emplacement == "exterieur":
+            score += 0.5
+        if c["microphone"] and emplacement == "interieur":
+            score += 0.5
+
+        f = c["focal_min_mm"] or 0
+        if objective == "dissuasion" and 0 < f <= 2.8:
+            score += 1
+            reasons.append("Grand angle")
+        elif objective == "identification" and f >= 4.0 and cam_type != "ptz":
+            score += 0.5
+
+        return score, reasons
+
+    @staticmethod
+    def _fit(c: dict, ctx: dict) -> dict:
+        """Score 0-100 affiché sur la carte caméra (scoreCameraForBlock)."""
+        required, objective = ctx["distance"], ctx["objective"]
+        empl, use_case, profile = ctx["emplacement"], ctx["use_case"], ctx["profile"]
+        cam_type = c["type"]
+        dori_key = "dori_observation_m" if objective == "dissuasion" else (
+            _objective_dori_key(objective) if objective in ("detection", "observation", "reconnaissance", "identification") else None)
+        dori = c[dori_key] if dori_key else None
+
+        ratio = None
+        if required > 0 and dori and dori > 0:
+            r = ratio = dori / required
+            if r >= 1.3:
+                s = 60
+            elif r >= 1.0:
+                s = 52 + (r - 1.0) * (60 - 52) / 0.3
+            elif r >= 0.8:
+                s = 40 + (r - 0.8) * (52 - 40) / 0.2
+            elif r >= 0.6:
+                s = 25 + (r - 0.6) * (40 - 25) / 0.2
+            elif r >= 0.4:
+                s = 10 + (r - 0.4) * (25 - 10) / 0.2
+            else:
+                s = 6
+            score_dori = _clamp(int(s + 0.5), 0, 60)
+        else:
+            score_dori = 18
+
+        mp = c["resolution_mp"]
+        score_mp = 15 if mp >= 8 else 13 if mp >= 5 else 11 if mp >= 4 else 9 if mp >= 2 else 7
+        ir = c["ir_range_m"]
+        score_ir = 15 if ir >= 60 else 13 if ir >= 40 else 11 if ir >= 30 else 9 if ir >= 20 else 7
+
+        bonus = 0
+        if empl == "exterieur" and ir >= 30:
+            bonus += 3
+        if empl == "interieur" and mp >= 4:
+            bonus += 3
+        if ratio is not None and ratio >= 1.15:
+            bonus += 2
+        if cam_type in profile["preferred"]:
+            bonus += 5
+        elif cam_type in profile["penalized"]:
+            bonus -= 8
+        min_dist = profile["ptzMinDistance"] or 40
+        if cam_type == "ptz" and required < min_dist:
+            bonus -= 10
+        if cam_type == "lpr" and use_case and use_case != "Parking":
+            bonus -= 10
+        bonus = _clamp(bonus, -15, 10)
+
+        warning = ""
+        if cam_type in profile["penalized"]:
+            warning = f"{cam_type.upper()} inadaptée pour {use_case or 'ce contexte'} {empl}"
+        if cam_type == "ptz" and required < min_dist:
+            warning = f"PTZ injustifiée (distance < {min_dist}m)"
+        if cam_type == "lpr" and use_case and use_case != "Parking":
+            warning = "LPR inadaptée hors contexte parking"
+
+        return {
+            "score": _clamp(score_dori + score_mp + score_ir + bonus, 0, 100),
+            "ratio": round(ratio, 3) if ratio is not None else None,
+            "dori": dori,
+            "parts": {"dori": score_dori, "mp": score_mp, "ir": score_ir, "usage": _clamp(bonus, 0, 10)},
+            "typeWarning": warning,
+        }
+
+    # --- API ---
+
+    @staticmethod
+    def answers_key(ans: dict, use_rules: bool) -> tuple:
+        """Tuple normalisé servant de clé de mémoïsation."""
+        return (
+            str(ans.get("use_case") or "").strip(),
+            _norm_emplacement(ans.get("emplacement")),
+            str(ans.get("objective") or "").strip(),
+            round(float(_num(ans.get("distance_m"), 0) or 0), 2),
+            bool(use_rules),
+        )
+
+    def recommend(self, ans: dict, use_rules: bool = True) -> dict:
+        key = self.answers_key(ans, use_rules)
+        hit = self._memo.get(key)
+        if hit is not None:
+            return hit
+        res = self._recommend(*key)
+        with self._memo_lock:
+            if len(self._memo) >= RECO_MEMO_SIZE:
+                self._memo.pop(next(iter(self._memo)))
+            self._memo[key] = res
+        return res
+
+    def _recommend(self, use_case: str, emplacement: str, objective: str, distance: float, use_rules: bool) -> dict:
+        profile = _camera_profile(use_case, emplacement)
+        dori_key = _objective_dori_key(objective or "identification")
+        threshold = distance * 0.7 if distance > 0 else 0
+
+        base = set(self.all)
+        if emplacement == "interieur":
+            base &= self.indoor
+        elif emplacement == "exterieur":
+            base &= self.outdoor
+        if use_case != "Parking":
+            base -= self.by_type.get("lpr", set())
+        if threshold > 0:
+            base &= self._at_least(dori_key, threshold)
+        allow_ptz = True
+        if use_rules:
+            eliminated, allow_ptz = self._eliminated(distance, emplacement)
+            base -= eliminated
+
+        pool1 = base & self.by_use_case.get(use_case, set()) if use_case else base
+        pool2 = base - pool1
+        if not pool1 and not pool2:
+            return {
+                "primary": None, "alternatives": [], "error": "err_no_camera_match",
+                "reasons": ["Suggestions : réduire la distance, passer en détection/dissuasion, "
+                            "ou envisager un emplacement extérieur avec PTZ."],
+            }
+
+        ctx = {"use_case": use_case, "emplacement": emplacement, "objective": objective,
+               "distance": distance, "profile": profile, "dori_key": dori_key, "allow_ptz": allow_ptz}
+        scored = []
+        for from_uc, pool in ((True, pool1), (False, pool2)):
+            for i in sorted(pool):
+                c = self.cams[i]
+                score, reasons = self._score(c, ctx, from_uc)
+                scored.append({
+                    "id": c["id"], "name": c["name"], "type": c["type"],
+                    "score": score, "rules_score": self._rules_score(c, ctx, from_uc),
+                    "reasons": reasons, "fit": self._fit(c, ctx),
+                })
+        scored.sort(key=lambda s: (-s["score"], -s["rules_score"]))
+
+        primary = scored[0]
+        alternatives = []
+        for s in scored[1:]:
+            if len(alternatives) >= 2:
+                break
+            if s["type"] != primary["type"] and not any(a["type"] == s["type"] for a in alternatives):
+                alternatives.append(s)
+        for s in scored[1:]:
+            if len(alternatives) >= 2:
+                break
+            if s not in alternatives:
+                alternatives.append(s)
+
+        ptz_indoor = primary["type"] == "ptz" and emplacement == "interieur" and distance < (profile["ptzMinDistance"] or 40)
+        if (primary["type"] == "lpr" and use_case != "Parking") or ptz_indoor:
+            valid = next((a for a in alternatives
+                          if not (a["type"] == "lpr" and use_case != "Parking")
+                          and not (a["type"] == "ptz" and emplacement == "interieur")), None)
+            if valid:
+                return {"primary": valid, "alternatives": [a for a in alternatives if a is not valid],
+                        "reasons": valid["reasons"]}
+            return {
+                "primary": None, "alternatives": [], "error": "err_no_camera_adapted",
+                "reasons": [f"Aucune caméra adaptée pour {use_case or 'ce contexte'} {emplacement} à {distance:g}m "
+                            f"en {objective or 'identification'}."],
+            }
+        return {"primary": primary, "alternatives": alternatives, "reasons": primary["reasons"]}
+
+
+_RECO: dict = {}
+_RECO_LOCK = threading.Lock()
+
+
+def _reco_engine() -> RecommendEngine:
+    """Moteur courant ; reconstruit si cameras.csv ou rules.json a changé."""
+    cams = _catalog_load("cameras")
+    try:
+        rules_mtime = os.stat(RULES_PATH).st_mtime_ns
+    except FileNotFoundError:
+        rules_mtime = 0
+    version = f"{cams['etag'].strip(chr(34))}-{rules_mtime}"
+    eng = _RECO.get("engine")
+    if eng is not None and eng.version == version:
+        return eng
+    with _RECO_LOCK:
+        eng = _RECO.get("engine")
+        if eng is None or eng.version != version:
+            rules = {}
+            if rules_mtime:
+                with open(RULES_PATH, "r", encoding="utf-8") as f:
+                    rules = json.load(f)
+            eng = RecommendEngine(_typed_rows(cams["columns"], cams["rows"]), rules, version)
+            _RECO["engine"] = eng
+    return eng
+
+
+# ============================================================
+# DIMENSIONNEMENT PROJET (débits, stockage, NVR, disques, switches PoE)
+# ============================================================
+
+SIZING_MEMO_SIZE = 1024  # résultats mémorisés (clé = hash des paramètres + version catalogue)
+
+# Plan PoE générique si switches.csv est vide (identique au frontend)
+_GENERIC_SWITCHES = [
+    {"id": "SW-POE-24", "name": "Switch PoE 24 ports", "poe_ports": 24, "poe_budget_w": None},
+    {"id": "SW-POE-16", "name": "Switch PoE 16 ports", "poe_ports": 16, "poe_budget_w": None},
+    {"id": "SW-POE-08", "name": "Switch PoE 8 ports", "poe_ports": 8, "poe_budget_w": None},
+    {"id": "SW-POE-04", "name": "Switch PoE 4 ports", "poe_ports": 4, "poe_budget_w": None},
+]
+
+
+def _mbps_to_tb(mbps: float, hours_per_day: float, days: float, overhead_pct: float) -> float:
+    tb = mbps * 1_000_000 * hours_per_day * 3600 * days / 8 / 1_000_000_000_000
+    return tb * (1 + overhead_pct / 100)
+
+
+class SizingTables:
+    """
+    Tables dérivées des catalogues, calculées une fois par version :
+    caméras par id, NVR triés par (voies, débit), tailles HDD décroissantes,
+    switches PoE triés par nombre de ports.
+    """
+
+    def __init__(self, cameras: list[dict], nvrs: list[dict], hdds: list[dict], switches: list[dict], version: str):
+        self.version = version
+        self.cameras = {}
+        for r in cameras:
+            cid = str(r.get("id") or "").strip()
+            if not cid:
+                continue
+            self.cameras[cid] = {
+                "id": cid,
+                "name": r.get("name") or "",
+                "brand_range": r.get("brand_range") or "",
+                "resolution_mp": _num(r.get("resolution_mp"), 0),
+                "poe_w": _num(r.get("poe_w"), 0),
+                "bitrate_mbps_typical": _num(r.get("bitrate_mbps_typical")),
+            }
+        self.nvrs = sorted(
+            ({
+                "id": r["id"], "name": r.get("name") or "", "brand_range": r.get("brand_range") or "",
+                "channels": _num(r.get("channels"), 0), "max_in_mbps": _num(r.get("max_in_mbps"), 0),
+                "hdd_bays": _num(r.get("hdd_bays"), 0), "max_hdd_tb_per_bay": _num(r.get("max_hdd_tb_per_bay"), 0),
+                "poe_ports": _num(r.get("poe_ports"), 0), "poe_budget_w": _num(r.get("poe_budget_w"), 0),
+            } for r in nvrs if r.get("id")),
+            key=lambda n: (n["channels"], n["max_in_mbps"]),
+        )
+        self.nvr_channels = [n["channels"] for n in self.nvrs]
+        self.nvr_by_id = {n["id"]: n for n in self.nvrs}
+        self.hdd_by_size = {}
+        for r in hdds:
+            size = _num(r.get("capacity_tb"))
+            if r.get("id") and size is not None:
+                self.hdd_by_size.setdefault(size, {"id": r["id"], "name": r.get("name") or "", "capacity_tb": size})
+        self.hdd_sizes = sorted(self.hdd_by_size, reverse=True)
+        sw = [
+            {"id": r["id"], "name": r.get("name") or "", "poe_ports": _num(r.get("poe_ports"), 0),
+             "poe_budget_w": _num(r.get("poe_budget_w"))}
+            for r in switches if r.get("id")
+        ]
+        self.switches_loaded = bool(sw)
+        self.switches = sorted((s for s in sw if s["poe_ports"] > 0), key=lambda s: -s["poe_ports"]) if sw else _GENERIC_SWITCHES
+
+    def nvrs_with_channels(self, total_cameras: int) -> list[dict]:
+        """NVR ayant assez de voies, déjà triés (voies, débit)."""
+        return self.nvrs[bisect.bisect_left(self.nvr_channels, total_cameras):]
+
+    # --- sélection (identique à pickNvr / pickDisks / planPoESwitches) ---
+
+    def pick_nvr(self, lines: list[tuple[dict, int]], total_cameras: int, total_mbps: float, required_tb: float) -> dict:
+        range_counts: dict[str, int] = {}
+        for cam, qty in lines:
+            r = cam["brand_range"] or "NEXT"
+            range_counts[r] = range_counts.get(r, 0) + qty
+        dominant = max(range_counts.items(), key=lambda kv: kv[1])[0] if range_counts else "NEXT"
+
+        biggest = self.hdd_sizes[0] if self.hdd_sizes else 8
+        min_bays = math.ceil(required_tb / biggest) if required_tb > 0 else 1
+
+        scored = []
+        for nvr in self.nvrs_with_channels(total_cameras):
+            bays_ok = nvr["hdd_bays"] >= min_bays
+            mbps_ok = nvr["max_in_mbps"] >= total_mbps
+            same_range = nvr["brand_range"].upper() == dominant.upper()
+            score = (1000 if bays_ok else 0) + (100 if same_range else 0) + (10 if mbps_ok else 0)
+            scored.append((score, nvr, bays_ok, mbps_ok, same_range))
+        scored.sort(key=lambda s: (-s[0], s[1]["channels"]))
+        if not scored:
+            return {"nvr": None, "reason": "err_no_nvr_channels", "alternatives": []}
+
+        _, best, bays_ok, mbps_ok, same_range = scored[0]
+        reasons = []
+        if same_range:
+            reasons.append("Gamme " + best["brand_range"])
+        reasons.append("stockage couvert" if bays_ok else "⚠️ baies HDD insuffisantes")
+        reasons.append("débit OK" if mbps_ok else "débit à vérifier")
+        alternatives = [s[1] for s in scored if s[1]["id"] != best["id"]][:3]
+        return {"nvr": best, "reason": " — ".join(reasons), "alternatives": alternatives}
+
+    def pick_disks(self, required_tb: float, nvr: dict | None) -> dict | None:
+        if not nvr:
+            return None
+        bays, max_per_bay = nvr["hdd_bays"], nvr["max_hdd_tb_per_bay"]
+        sizes = self.hdd_sizes or [16, 12, 8, 4]
+        best = None
+        for size in sizes:
+            if size > max_per_bay:
+                continue
+            needed = math.ceil(required_tb / size)
+            if needed <= bays:
+                best = {"sizeTB": size, "count": needed, "totalTB": needed * size}
+                break
+        if best is None:
+            size = min(max_per_bay, sizes[0])
+            best = {"sizeTB": size, "count": bays, "totalTB": bays * size}
+        return {**best, "maxTotalTB": bays * max_per_bay, "hddRef": self.hdd_by_size.get(best["sizeTB"])}
+
+    def plan_switches(self, total_cameras: int, reserve_pct: float, nvr: dict | None) -> dict:
+        nvr_ports = (nvr or {}).get("poe_ports") or 0
+        needing = max(0, total_cameras - nvr_ports)
+        if needing <= 0:
+            return {"required": False, "portsNeeded": 0, "totalPorts": 0, "plan": [], "surplusPorts": 0,
+                    "nvrPoePorts": nvr_ports, "camerasOnNvr": total_cameras, "camerasOnSwitches": 0}
+
+        via_switch = needing if nvr_ports > 0 else total_cameras
+        ports_needed = math.ceil(via_switch * (1 + reserve_pct / 100))
+        plan, remaining = [], ports_needed
+        for sw in self.switches:
+            if remaining <= 0:
+                break
+            count = remaining // sw["poe_ports"]
+            if count > 0:
+                plan.append({"item": sw, "qty": count})
+                remaining -= count * sw["poe_ports"]
+        if remaining > 0:
+            fits = [sw for sw in self.switches if sw["poe_ports"] >= remaining]
+            if fits:
+                plan.append({"item": min(fits, key=lambda sw: (sw["poe_ports"] - remaining, sw["poe_ports"])), "qty": 1})
+
+        distribution, left = [], via_switch
+        for p in plan:
+            for _ in range(p["qty"]):
+                on_this = min(left, p["item"]["poe_ports"])
+                distribution.append({"switch": p["item"]["id"], "camerasConnected": on_this, "totalPorts": p["item"]["poe_ports"]})
+                left -= on_this
+        total_ports = sum(p["item"]["poe_ports"] * p["qty"] for p in plan)
+        return {
+            "required": True, "portsNeeded": ports_needed, "totalPorts": total_ports, "plan": plan,
+            "surplusPorts": total_ports - ports_needed, "nvrPoePorts": nvr_ports,
+            "camerasOnNvr": min(total_cameras, nvr_ports) if nvr_ports > 0 else 0,
+            "camerasOnSwitches": via_switch, "cameraDistribution": distribution,
+        }
+
+    # --- calcul complet (computeProject) ---
+
+    def compute(self, lines_in: list[dict], rec: dict, override_nvr_id: str | None = None) -> dict:
+        hours_per_day = _clamp(_num(rec.get("hoursPerDay"), 24), 1, 24)
+        days = _clamp(_num(rec.get("daysRetention"), 14), 1, 365)
+        overhead_pct = _clamp(_num(rec.get("overheadPct"), 15), 0, 100)
+        fps = _clamp(_num(rec.get("fps"), 12), 1, 60)
+        reserve_pct = _clamp(_num(rec.get("reservePortsPct"), 10), 0, 100)
+        codec = str(rec.get("codec") or "H.265")
+        mode = str(rec.get("mode") or "continuous")
+        is_265 = "265" in codec.upper()
+
+        alerts, per_camera, lines = [], [], []
+        total_poe_w = 0.0
+        total_cameras = 0
+        for line in lines_in:
+            qty = int(_num(line.get("qty"), 0) or 0)
+            cam = self.cameras.get(str(line.get("cameraId") or "").strip())
+            if not cam:
+                continue
+            total_cameras += qty
+            total_poe_w += qty * cam["poe_w"]
+            if not qty:
+                continue
+            lines.append((cam, qty))
+            cat = cam["bitrate_mbps_typical"]
+            if cat is not None and cat > 0:
+                # catalogue normé à 15 ips H.265 continu
+                adjusted = cat * fps / 15
+                if "264" in codec.upper():
+                    adjusted /= 0.65
+                if mode == "motion":
+                    adjusted *= 0.40
+                mbps = max(0.5, adjusted)
+            else:
+                mp = cam["resolution_mp"] if cam["resolution_mp"] > 0 else 4
+                mbps = _clamp(mp * 1.2 * fps / 12 * (0.65 if is_265 else 1.0), 0.6, 16)
+            per_camera.append({
+                "fromBlockId": line.get("fromBlockId"), "blockLabel": str(line.get("blockLabel") or ""),
+                "cameraId": cam["id"], "cameraName": cam["name"], "qty": qty, "codec": codec, "ips": fps,
+                "mbpsPerCam": mbps, "mbpsLine": mbps * qty,
+                "mbpsSource": "catalog" if cat is not None and cat > 0 else "estimate",
+            })
+
+        total_mbps = sum(r["mbpsLine"] for r in per_camera)
+        required_tb = _mbps_to_tb(total_mbps, hours_per_day, days, overhead_pct)
+
+        nvr_pick = self.pick_nvr(lines, total_cameras, total_mbps, required_tb)
+        override = self.nvr_by_id.get(override_nvr_id or "")
+        if override:
+            alts = [n for n in self.nvrs_with_channels(total_cameras) if n["id"] != override["id"]][:3]
+            nvr_pick = {"nvr": override, "reason": "Sélection manuelle — " + override["brand_range"], "alternatives": alts}
+        nvr = nvr_pick["nvr"]
+        disks = self.pick_disks(required_tb, nvr)
+        switches = self.plan_switches(total_cameras, reserve_pct, nvr)
+
+        sw_budget = sum((p["item"]["poe_budget_w"] or 0) * p["qty"] for p in switches["plan"])
+        if sw_budget > 0 and total_poe_w > sw_budget:
+            alerts.append({"level": "warn", "text": f"PoE total estimé {total_poe_w:.0f}W > budget switches {sw_budget:.0f}W (à vérifier)."})
+        if total_cameras <= 0:
+            alerts.append({"level": "danger", "text": "err_validate_camera"})
+        if not nvr:
+            alerts.append({"level": "danger", "text": "err_no_nvr_csv"})
+        elif total_mbps > nvr["max_in_mbps"]:
+            alerts.append({"level": "danger", "text": f"Débit total {total_mbps:.1f} Mbps > limite NVR ({nvr['max_in_mbps']:g} Mbps)."})
+        if switches["required"]:
+            if not self.switches_loaded:
+                alerts.append({"level": "warn", "text": "switches.csv non chargé : plan PoE généré avec valeurs génériques (4/8/16/24)."})
+            if switches["totalPorts"] < switches["portsNeeded"]:
+                alerts.append({"level": "danger", "text": "Plan switch PoE insuffisant (ports)."})
+        capped = bool(disks and required_tb > disks["maxTotalTB"])
+        if capped:
+            alerts.append({"level": "danger", "text": f"Stockage requis ~{required_tb:.1f} TB > capacité max NVR ({disks['maxTotalTB']:g} TB). "
+                                                      f"Le stockage est bridé à {disks['maxTotalTB']:g} TB."})
+
+        return {
+            "totalCameras": total_cameras,
+            "totalInMbps": total_mbps,
+            "totalPoeW": total_poe_w,
+            "nvrPick": nvr_pick,
+            "switches": switches,
+            "requiredTB": disks["maxTotalTB"] if capped else required_tb,
+            "rawRequiredTB": required_tb,
+            "storageCapped": capped,
+            "disks": disks,
+            "alerts": alerts,
+            "perCamera": per_camera,
+            "storageParams": {"daysRetention": days, "hoursPerDay": hours_per_day, "overheadPct": overhead_pct,
+                              "codec": codec, "ips": fps, "mode": mode},
+        }
+
+
+_SIZING: dict = {}
+_SIZING_LOCK = threading.Lock()
+_SIZING_MEMO: dict[str, dict] = {}
+
+
+def _sizing_tables() -> SizingTables:
+    """Tables courantes ; recalculées si un des catalogues concernés a changé."""
+    cats = {k: _catalog_load(k) for k in ("cameras", "nvrs", "hdds", "switches")}
+    version = hashlib.sha256("|".join(c["etag"] for c in cats.values()).encode()).hexdigest()[:16]
+    tables = _SIZING.get("tables")
+    if tables is not None and tables.version == version:
+        return tables
+    with _SIZING_LOCK:
+        tables = _SIZING.get("tables")
+        if tables is None or tables.version != version:
+            typed = {k: _typed_rows(c["columns"], c["rows"]) for k, c in cats.items()}
+            tables = SizingTables(typed["cameras"], typed["nvrs"], typed["hdds"], typed["switches"], version)
+            _SIZING["tables"] = tables
+            _SIZING_MEMO.clear()
+    return tables
+
+
+def _sizing_compute(lines: list[dict], rec: dict, override_nvr_id: str | None) -> tuple[dict, str]:
+    """Calcul mémorisé par hash (version catalogue + paramètres). Retourne (résultat, clé)."""
+    tables = _sizing_tables()
+    payload = json.dumps([tables.version, lines, rec, override_nvr_id], sort_keys=True, separators=(",", ":"), default=str)
+    key = hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+    hit = _SIZING_MEMO.get(key)
+    if hit is not None:
+        return hit, key
+    res = tables.compute(lines, rec, override_nvr_id)
+    with _SIZING_LOCK:
+        if len(_SIZING_MEMO) >= SIZING_MEMO_SIZE:
+            _SIZING_MEMO.pop(next(iter(_SIZING_MEMO)))
+        _SIZING_MEMO[key] = res
+    return res, key
+
+
+# ============================================================
+# CACHE MÉDIAS (proxy fiches techniques / images, adressé par contenu)
+# ============================================================
+
+class _AllowListRedirect(urllib.request.HTTPRedirectHandler):
+    """Redirections suivies seulement vers un hôte autorisé (sinon la liste serait contournable)."""
+
+    def __init__(self, allowed):
+        self.allowed = allowed
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        if not self.allowed(newurl):
+            raise urllib.error.HTTPError(newurl, code, "Redirection vers un hôte non autorisé", headers, fp)
+        return super().redirect_request(req, fp, code, msg, headers, newurl)
+
+
+class MediaCache:
+    """
+    Cache disque des médias distants (hôtes autorisés uniquement) :
+    - clé = sha256(locale | url), fichier <dir>/<2 car.>/<clé> + métadonnées <clé>.json,
+    - éviction LRU sous un budget d'octets,
+    - un seul téléchargement amont par clé (les requêtes concurrentes attendent),
+    - revalidation conditionnelle (If-None-Match / If-Modified-Since) passé le TTL.
+    """
+
+    def __init__(self, root: str, max_bytes: int, ttl_s: float, hosts: set[str]):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.ttl_s = ttl_s
+        self.hosts = hosts
+        self._opener = urllib.request.build_opener(_AllowListRedirect(self.allowed))
+        self.stats = {"hits": 0, "misses": 0, "revalidated": 0, "collapsed": 0, "evictions": 0, "errors": 0, "stale": 0}
+        self._lru: "OrderedDict[str, int]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._inflight: dict[str, threading.Event] = {}
+        self._loaded = False
+
+    def allowed(self, url: str) -> bool:
+        p = urlparse(url)
+        return p.scheme in ("http", "https") and p.hostname in self.hosts
+
+    @staticmethod
+    def key(url: str, locale: str = "") -> str:
+        return hashlib.sha256(f"{locale}|{url}".encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], key)
+
+    def _load(self):
+        """Reconstruit l'ordre LRU depuis le disque (date d'accès) au premier usage."""
+        if self._loaded:
+            return
+        entries = []
+        if os.path.isdir(self.root):
+            for sub in os.scandir(self.root):
+                if not sub.is_dir():
+                    continue
+                for f in os.scandir(sub.path):
+                    if f.name.endswith((".json", ".part")) or not os.path.exists(f.path + ".json"):
+                        continue
+                    st = f.stat()
+                    entries.append((st.st_atime, f.name, st.st_size))
+        for _, key, size in sorted(entries):
+            self._lru[key] = size
+            self._bytes += size
+        self._loaded = True
+
+    def _meta(self, key: str) -> dict | None:
+        try:
+            with open(self._path(key) + ".json", "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _touch(self, key: str):
+        with self._lock:
+            if key in self._lru:
+                self._lru.move_to_end(key)
+
+    def _remove(self, key: str):
+        for p in (self._path(key), self._path(key) + ".json"):
+            try:
+                os.remove(p)
+            except FileNotFoundError:
+                pass
+
+    def _admit(self, key: str, size: int):
+        """Enregistre une entrée puis évince les plus anciennes au-delà du budget."""
+        with self._lock:
+            self._bytes += size - self._lru.pop(key, 0)
+            self._lru[key] = size
+            while self._bytes > self.max_bytes and len(self._lru) > 1:
+                old, old_size = self._lru.popitem(last=False)
+                self._bytes -= old_size
+                self._remove(old)
+                self.stats["evictions"] += 1
+
+    def _fetch(self, key: str, url: str, locale: str, meta: dict | None) -> dict | None:
+        """Téléchargement (ou revalidation si meta) vers un fichier temporaire puis renommage."""
+        headers = {"User-Agent": "Mozilla/5.0", "Accept": "*/*"}
+        if meta:
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{secrets.token_hex(4)}.part"
+        try:
+            req = urllib.request.Request(url, headers=headers)
+            try:
+                resp = self._opener.open(req, timeout=MEDIA_TIMEOUT_S)
+            except urllib.error.HTTPError as e:
+                if e.code == 304 and meta:
+                    meta["fetched_at"] = time.time()
+                    self._write_meta(key, meta)
+                    self.stats["revalidated"] += 1
+                    return meta
+                raise
+            with resp, open(tmp, "wb") as f:
+                size = 0
+                while True:
+                    chunk = resp.read(64 * 1024)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    if size > MEDIA_MAX_OBJECT_BYTES:
+                        raise ValueError("objet trop volumineux")
+                    f.write(chunk)
+                new_meta = {
+                    "url": url, "locale": locale, "size": size, "fetched_at": time.time(),
+                    "content_type": resp.headers.get("Content-Type") or "application/octet-stream",
+                    "etag": resp.headers.get("ETag") or "", "last_modified": resp.headers.get("Last-Modified") or "",
+                }
+            os.replace(tmp, path)
+            self._write_meta(key, new_meta)
+            self._admit(key, new_meta["size"])
+            return new_meta
+        except (OSError, ValueError):
+            self.stats["errors"] += 1
+            if meta:
+                self.stats["stale"] += 1  # amont indisponible : on sert la copie existante
+                return meta
+            return None
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    def _write_meta(self, key: str, meta: dict):
+        tmp = f"{self._path(key)}.json.part"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(tmp, self._path(key) + ".json")
+
+    def get(self, url: str, locale: str = "") -> tuple[str, dict] | None:
+        """(chemin, métadonnées) de l'objet en cache, téléchargé au besoin ; None si indisponible."""
+        if not self.allowed(url):
+            return None
+        key = self.key(url, locale)
+        with self._lock:
+            self._load()
+        while True:
+            meta = self._meta(key) if os.path.exists(self._path(key)) else None
+            if meta and time.time() - meta.get("fetched_at", 0) < self.ttl_s:
+                self.stats["hits"] += 1
+                self._touch(key)
+                return self._path(key), meta
+            with self._lock:
+                ev = self._inflight.get(key)
+                leader = ev is None
+                if leader:
+                    ev = self._inflight[key] = threading.Event()
+            if not leader:
+                # même objet déjà en cours de téléchargement : on attend son résultat
+                self.stats["collapsed"] += 1
+                ev.wait(MEDIA_TIMEOUT_S * 2)
+                meta = self._meta(key) if os.path.exists(self._path(key)) else None
+                return (self._path(key), meta) if meta else None
+            try:
+                if meta:
+                    self.stats["hits"] += 1
+                else:
+                    self.stats["misses"] += 1
+                meta = self._fetch(key, url, locale, meta)
+                if meta:
+                    self._touch(key)
+                return (self._path(key), meta) if meta else None
+            finally:
+                with self._lock:
+                    self._inflight.pop(key, None)
+                ev.set()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            self._load()
+            return {**self.stats, "entries": len(self._lru), "bytes": self._bytes, "max_bytes": self.max_bytes}
+
+
+MEDIA_CACHE = MediaCache(MEDIA_CACHE_DIR, MEDIA_CACHE_MAX_BYTES, MEDIA_CACHE_TTL_S, MEDIA_ALLOWED_HOSTS)
+
+
+# ============================================================
+# IMAGES PRODUITS (miniatures + variantes WebP/AVIF, cache disque)
+# ============================================================
+
+_IMAGE_EXTS = (".png", ".jpg", ".jpeg", ".webp")
+_IMAGE_HASHES: dict[str, tuple[tuple, str]] = {}   # chemin -> ((mtime_ns, taille), hash)
+_IMAGE_MANIFEST: dict = {}
+_IMAGE_LOCKS: dict[str, threading.Lock] = {}
+_IMAGE_LOCKS_GUARD = threading.Lock()
+
+
+def _image_formats() -> tuple[str, ...]:
+    """Formats de sortie disponibles, du plus compact au plus compatible."""
+    if Image is None:
+        return ()
+    # WebP d'abord : plus compact que l'AVIF sur ces visuels produits et bien plus rapide à encoder
+    return tuple(f for f in ("webp", "avif") if _pil_features.check(f)) + ("png",)
+
+
+def _negotiate_image_format(accept: str | None) -> str:
+    accept = (accept or "").lower()
+    for fmt in _image_formats():
+        if fmt == "png" or f"image/{fmt}" in accept:
+            return fmt
+    return "png"
+
+
+def _image_source(family: str, ref: str) -> str | None:
+    """Fichier original data/Images/<famille>/<ID>.<ext> (ID tel quel puis en majuscules)."""
+    family, ref = os.path.basename(family), os.path.basename(ref)
+    if not family or not ref or family.startswith("."):
+        return None
+    stem = os.path.splitext(ref)[0] if ref.lower().endswith(_IMAGE_EXTS) else ref
+    for name in dict.fromkeys((stem, stem.upper())):
+        for ext in _IMAGE_EXTS:
+            path = os.path.join(IMAGES_DIR, family, name + ext)
+            if os.path.isfile(path):
+                return path
+    return None
+
+
+def _image_hash(path: str) -> str:
+    """Hash du contenu (16 car.), recalculé seulement si mtime/taille changent."""
+    st = os.stat(path)
+    stamp = (st.st_mtime_ns, st.st_size)
+    cached = _IMAGE_HASHES.get(path)
+    if cached and cached[0] == stamp:
+        return cached[1]
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    digest = h.hexdigest()[:16]
+    _IMAGE_HASHES[path] = (stamp, digest)
+    return digest
+
+
+def _image_manifest() -> dict:
+    """{"famille/ID": hash} pour toutes les images (URLs versionnées côté frontend)."""
+    images = {}
+    if os.path.isdir(IMAGES_DIR):
+        for fam in sorted(os.scandir(IMAGES_DIR), key=lambda e: e.name):
+            if not fam.is_dir():
+                continue
+            for f in sorted(os.scandir(fam.path), key=lambda e: e.name):
+                stem, ext = os.path.splitext(f.name)
+                if ext.lower() in _IMAGE_EXTS and f.is_file():
+                    images.setdefault(f"{fam.name}/{stem}", _image_hash(f.path))
+    etag = '"' + hashlib.sha256(json.dumps(images, sort_keys=True).encode()).hexdigest()[:32] + '"'
+    if _IMAGE_MANIFEST.get("etag") != etag:
+        body = json.dumps({"version": etag.strip('"'), "widths": IMAGE_WIDTHS, "images": images},
+                          ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        _IMAGE_MANIFEST.update(etag=etag, json=body, images=images)
+    return _IMAGE_MANIFEST
+
+
+def _image_derivative(src: str, digest: str, width: int, fmt: str) -> str:
+    """Chemin de la variante (générée au premier appel, écriture atomique)."""
+    out = os.path.join(IMAGE_CACHE_DIR, digest[:2], f"{digest}-{width}.{fmt}")
+    if os.path.exists(out):
+        return out
+    with _IMAGE_LOCKS_GUARD:
+        lock = _IMAGE_LOCKS.setdefault(out, threading.Lock())
+    with lock:
+        if not os.path.exists(out):
+            os.makedirs(os.path.dirname(out), exist_ok=True)
+            tmp = f"{out}.{secrets.token_hex(4)}.part"
+            try:
+                with Image.open(src) as im:
+                    im = im.convert("RGBA") if im.mode in ("P", "LA", "RGBA") else im.convert("RGB")
+                    im.thumbnail((width, width), Image.LANCZOS)  # jamais d'agrandissement
+                    if fmt == "png":
+                        im.save(tmp, "PNG", optimize=True)
+                    else:
+                        im.save(tmp, fmt.upper(), quality=IMAGE_QUALITY)
+                os.replace(tmp, out)
+            finally:
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+    with _IMAGE_LOCKS_GUARD:
+        _IMAGE_LOCKS.pop(out, None)
+    return out
+
+
+def _image_warm() -> int:
+    """Pré-génère toutes les variantes (tailles x formats) ; retourne le nombre de fichiers."""
+    n = 0
+    for key in _image_manifest()["images"]:
+        fam, ref = key.split("/", 1)
+        src = _image_source(fam, ref)
+        if not src:
+            continue
+        digest = _image_hash(src)
+        for fmt in _image_formats():
+            for w in IMAGE_WIDTHS:
+                try:
+                    _image_derivative(src, digest, w, fmt)
+                    n += 1
+                except OSError as e:
+                    print(f"⚠️ image {key} ({w}px {fmt}) : {e}")
+    return n
+
+
+# ============================================================
+# FICHES TECHNIQUES (arborescence locale puis cache médias)
+# ============================================================
+
+_DATASHEET_LOCALES = {"fr": "fr_FR", "en": "en_GB", "it": "it_IT", "es": "es_ES", "de": "de_DE"}
+_ZIP_FOLDERS = {"nvrs": "nvr", "hdds": "hdd"}  # même arborescence que l'ancien pack navigateur
+_ACCESSORY_SLOTS = ("junction_box", "wall_mount", "ceiling_mount")
+_DATASHEET_INDEX: dict = {}
+
+
+def _safe_filename(name: str) -> str:
+    s = re.sub(r'[\\/?%*:|"<>\x00-\x1f]', "_", str(name or "file"))
+    return re.sub(r"\s+", " ", s).strip() or "file"
+
+
+def _safe_archive_name(name: str, ext: str) -> str:
+    """Nom de fichier assaini, sans chemin ni point initial, extension imposée, 120 caractères max."""
+    base = _safe_filename(os.path.basename(str(name or "").replace("\\", "/"))).lstrip(". ")
+    if base.lower().endswith(ext):
+        base = base[: -len(ext)]
+    return (base[:120].rstrip(" .") or "export") + ext
+
+
+def _content_disposition(disposition: str, filename: str) -> str:
+    """En-tête Content-Disposition (repli ASCII + filename* UTF-8, RFC 6266)."""
+    ascii_name = filename.encode("ascii", "replace").decode("ascii").replace("?", "_")
+    return f"{disposition}; filename=\"{ascii_name}\"; filename*=UTF-8''{quote(filename)}"
+
+
+def _datasheet_index() -> dict[str, tuple[str, str]]:
+    """ID produit (majuscules) -> (famille, datasheet_url), recalculé si un catalogue change."""
+    cats = {k: _catalog_load(k) for k in ALLOWED_CATALOGS}
+    version = "|".join(c["etag"] for c in cats.values())
+    if _DATASHEET_INDEX.get("version") == version:
+        return _DATASHEET_INDEX["index"]
+    index: dict[str, tuple[str, str]] = {}
+    for kind, cat in cats.items():
+        for row in cat["rows"]:
+            if kind == "accessories":
+                pairs = [(row.get(f"{slot}_id"), row.get(f"datasheet_url_{slot}")) for slot in _ACCESSORY_SLOTS]
+            else:
+                pairs = [(row.get("id"), row.get("datasheet_url"))]
+            for pid, url in pairs:
+                pid = str(pid or "").strip().upper()
+                if pid and pid.lower() != "false" and pid not in index:
+                    url = str(url or "").strip()
+                    index[pid] = (kind, "" if url.lower() in ("", "false") else url)
+    _DATASHEET_INDEX.update(version=version, index=index)
+    return index
+
+
+def _datasheet_urls(url: str, lang: str) -> list[str]:
+    """URL localisée puis repli fr_FR (comme localizedDatasheetUrl + fallback du frontend)."""
+    if not url:
+        return []
+    loc = _DATASHEET_LOCALES.get(lang, "fr_FR")
+    localized = url.replace("/fr_FR/", f"/{loc}/").replace("/fr-fr/", f"/{loc.lower().replace('_', '-')}/")
+    fr = re.sub(r"/(en_GB|it_IT|es_ES|de_DE)/", "/fr_FR/", localized)
+    fr = re.sub(r"/(en-gb|it-it|es-es|de-de)/", "/fr-fr/", fr)
+    return [localized] if fr == localized else [localized, fr]
+
+
+def _is_pdf(path: str) -> bool:
+    try:
+        with open(path, "rb") as f:
+            return f.read(5) == b"%PDF-" and os.path.getsize(path) > 2000
+    except OSError:
+        return False
+
+
+def _resolve_datasheet(pid: str, lang: str) -> tuple[str | None, str | None, str]:
+    """
+    Chemin local d'une fiche technique : data/Fiche_tech/<famille>/<ID>.pdf,
+    sinon cache médias (URL localisée puis repli fr_FR).
+    Retourne (famille, chemin ou None, url de référence).
+    """
+    entry = _datasheet_index().get(pid.upper())
+    if not entry:
+        return None, None, ""
+    kind, url = entry
+    name = f"{_safe_filename(pid.upper())}.pdf"
+    local = os.path.join(DATASHEET_DIR, kind, name)
+    if _is_pdf(local):
+        return kind, local, url
+    urls = _datasheet_urls(url, lang)
+    for u in urls:
+        got = MEDIA_CACHE.get(u, lang)
+        if got and _is_pdf(got[0]):
+            return kind, got[0], url
+    return kind, None, urls[0] if urls else ""
+
+
+class _ZipSink:
+    """Flux d'écriture non positionnable : zipfile y écrit, le générateur vide les morceaux."""
+
+    def __init__(self):
+        self.chunks: list[bytes] = []
+
+    def write(self, b) -> int:
+        self.chunks.append(bytes(b))
+        return len(b)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        out, self.chunks = b"".join(self.chunks), []
+        return out
+
+
+def _zip_stream(entries):
+    """
+    ZIP produit au fil de l'eau. `entries` itère des (nom, bytes | chemin | fichier, compresser).
+    Les PDF sont stockés tels quels (déjà compressés).
+    """
+    sink = _ZipSink()
+    with zipfile.ZipFile(sink, "w", zipfile.ZIP_STORED) as zf:
+        for name, src, compress in entries:
+            info = zipfile.ZipInfo(name, date_time=time.localtime()[:6])
+            info.compress_type = zipfile.ZIP_DEFLATED if compress else zipfile.ZIP_STORED
+            with zf.open(info, "w") as dst:
+                if isinstance(src, bytes):
+                    dst.write(src)
+                else:
+                    if not isinstance(src, str):
+                        src.seek(0)
+                    with open(src, "rb") if isinstance(src, str) else nullcontext(src) as f:
+                        while True:
+                            chunk = f.read(256 * 1024)
+                            if not chunk:
+                                break
+                            dst.write(chunk)
+                            if sink.chunks:
+                                yield sink.drain()
+            if sink.chunks:
+                yield sink.drain()
+    yield sink.drain()
+
+
+def _datasheet_pack_entries(pdf, pdf_name: str, product_ids: list[str], lang: str):
+    """Rapport puis fiches techniques, résolues en parallèle et ajoutées dans l'ordre demandé."""
+    if pdf:
+        yield pdf_name, pdf, False
+    seen, ids = set(), []
+    for pid in product_ids:
+        pid = str(pid or "").strip().upper()
+        if pid and pid not in seen:
+            seen.add(pid)
+            ids.append(pid)
+    missing = []
+    with ThreadPoolExecutor(max_workers=DATASHEET_WORKERS) as pool:
+        futures = [(pid, pool.submit(_resolve_datasheet, pid, lang)) for pid in ids]
+        for pid, fut in futures:
+            kind, path, url = fut.result()
+            if path:
+                folder = _ZIP_FOLDERS.get(kind, kind)
+                yield f"datasheets/{folder}/{_safe_filename(pid)}.pdf", path, False
+            elif kind:
+                missing.append(url or pid)
+    if missing:
+        lines = "\n".join(f"{i}. {u}" for i, u in enumerate(missing, 1))
+        yield "datasheets_links.txt", ("DATASHEETS\n" + "=" * 50 + "\n\n" + lines).encode("utf-8"), True
+
+
+# ============================================================
+# RAPPORT PDF (rendu serveur, pool de processus, cache par contenu)
+# ============================================================
+
+REPORT_RENDERER_VERSION = 1  # à incrémenter quand la mise en page change (invalide le cache)
+_REPORT_FONT_CANDIDATES = (
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
+    "/usr/share/fonts/dejavu/DejaVuSans.ttf",
+)
+_REPORT_GREEN = (0, 188, 112)
+_REPORT_DARK = (28, 31, 42)
+_REPORT_MUTED = (100, 116, 139)
+_REPORT_FILL = (241, 245, 249)
+_REPORT_LEVELS = {"danger": (220, 38, 38), "warn": (217, 119, 6)}
+_REPORT_RES: dict = {}
+_REPORT_PRODUCTS: dict = {}
+_REPORT_POOL = None
+_REPORT_POOL_LOCK = threading.Lock()
+_REPORT_INFLIGHT: dict = {}
+
+
+def _report_resources() -> dict:
+    """
+    Ressources communes à tous les rapports, préparées une fois (rechargées si un
+    fichier change) : libellés de toutes les langues, logo pré-rastérisé, police.
+    """
+    logo = next((p for p in REPORT_LOGO_CANDIDATES if os.path.isfile(p)), None)
+    font = next((p for p in (REPORT_FONT, *_REPORT_FONT_CANDIDATES) if p and os.path.isfile(p)), None)
+    stamp = tuple((p, os.stat(p).st_mtime_ns) if p and os.path.exists(p) else (p, 0) for p in (REPORT_I18N, logo, font))
+    if _REPORT_RES.get("stamp") == stamp:
+        return _REPORT_RES
+    labels = {}
+    if os.path.isfile(REPORT_I18N):
+        with open(REPORT_I18N, encoding="utf-8") as f:
+            labels = json.load(f)
+    logo_png = None
+    if logo:
+        with open(logo, "rb") as f:
+            digest = hashlib.sha256(f.read()).hexdigest()[:16]
+        logo_png = os.path.join(REPORT_CACHE_DIR, "res", f"logo-{digest}.png")
+        if not os.path.exists(logo_png):
+            os.makedirs(os.path.dirname(logo_png), exist_ok=True)
+            if Image is not None:
+                tmp = f"{logo_png}.{secrets.token_hex(4)}.part"
+                with Image.open(logo) as im:
+                    im = im.convert("RGBA")
+                    im.thumbnail((600, 200), Image.LANCZOS)
+                    im.save(tmp, "PNG", optimize=True)
+                os.replace(tmp, logo_png)
+            else:
+                logo_png = logo
+    bold = None
+    if font:
+        cand = font[:-4] + "-Bold.ttf" if font.lower().endswith(".ttf") else ""
+        bold = cand if os.path.isfile(cand) else font
+    _REPORT_RES.clear()
+    _REPORT_RES.update(stamp=stamp, labels=labels, logo=logo_png, font=font, font_bold=bold)
+    return _REPORT_RES
+
+
+def _report_products() -> dict[str, dict]:
+    """ID (majuscules) -> {famille, nom, noms traduits} pour tous les catalogues, par version."""
+    cats = {k: _catalog_load(k) for k in ALLOWED_CATALOGS}
+    version = "|".join(c["etag"] for c in cats.values())
+    if _REPORT_PRODUCTS.get("version") == version:
+        return _REPORT_PRODUCTS["index"]
+    index: dict[str, dict] = {}
+    for kind, cat in cats.items():
+        for row in cat["rows"]:
+            if kind == "accessories":
+                items = [(row.get(f"{slot}_id"), {"name": row.get(f"{slot}_name")}) for slot in _ACCESSORY_SLOTS]
+            else:
+                items = [(row.get("id"), {"name": row.get("name"), **{f"name_{l}": row.get(f"name_{l}") for l in _LOCALES}})]
+            for pid, names in items:
+                pid = str(pid or "").strip()
+                if pid and pid.lower() != "false" and pid.upper() not in index:
+                    names = {k: str(v).strip() for k, v in names.items() if v and str(v).strip().lower() != "false"}
+                    index[pid.upper()] = {"id": pid, "family": kind, **names}
+    _REPORT_PRODUCTS.update(version=version, index=index)
+    return index
+
+
+def _report_thumb(family: str, ref: str) -> str | None:
+    """Miniature PNG pré-rastérisée (même cache disque que /api/img)."""
+    if Image is None or not ref:
+        return None
+    src = _image_source(family, ref)
+    if not src:
+        return None
+    try:
+        return _image_derivative(src, _image_hash(src), REPORT_THUMB_PX, "png")
+    except OSError:
+        return None
+
+
+def _report_pool():
+    """Pool de processus (spawn : pas de fork d'un process multi-threadé), créé au 1er rendu."""
+    global _REPORT_POOL
+    with _REPORT_POOL_LOCK:
+        if _REPORT_POOL is None and REPORT_WORKERS > 0:
+            _REPORT_POOL = ProcessPoolExecutor(max_workers=REPORT_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return _REPORT_POOL
+
+
+def _report_pool_shutdown():
+    global _REPORT_POOL
+    with _REPORT_POOL_LOCK:
+        if _REPORT_POOL is not None:
+            _REPORT_POOL.shutdown(wait=False, cancel_futures=True)
+            _REPORT_POOL = None
+
+
+def _report_store(path: str, pdf: bytes):
+    """Écriture atomique puis purge des PDF les moins récemment servis au-delà de REPORT_CACHE_KEEP."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    _atomic_write(path, pdf)
+    files = []
+    for sub in os.scandir(REPORT_CACHE_DIR):
+        if sub.is_dir() and sub.name != "res":
+            files += [(e.stat().st_mtime, e.path) for e in os.scandir(sub.path) if e.name.endswith(".pdf")]
+    if len(files) > REPORT_CACHE_KEEP:
+        for _, old in sorted(files)[: len(files) - REPORT_CACHE_KEEP]:
+            try:
+                os.remove(old)
+            except OSError:
+                pass
+
+
+def _report_latin1(s) -> str:
+    """Texte pour les polices PDF de base (Helvetica, latin-1) quand aucune TTF n'est disponible."""
+    s = str(s)
+    for a, b in (("—", "-"), ("–", "-"), ("’", "'"), ("‘", "'"), ("“", '"'), ("”", '"'), ("…", "..."), ("≥", ">="), ("≤", "<="), ("€", "EUR")):
+        s = s.replace(a, b)
+    return s.encode("latin-1", "replace").decode("latin-1")
+
+
+def _report_render(doc: dict) -> bytes:
+    """
+    Met en page le document résolu (aucun accès aux catalogues : exécuté dans le pool
+    de processus) : synthèse, caméras par zone, équipements, annexe stockage.
+    """
+    L = doc["labels"]
+    pdf = FPDF(orientation="P", unit="mm", format="A4")
+    pdf.set_auto_page_break(False)
+    pdf.set_margins(15, 15, 15)
+    pdf.alias_nb_pages()
+    pdf.set_title(doc["title"])
+    pdf.set_creator("Configurateur Comelit")
+    font, text = "Helvetica", _report_latin1
+    if doc["font"]:
+        pdf.add_font("Report", "", doc["font"])
+        pdf.add_font("Report", "B", doc["font_bold"] or doc["font"])
+        font, text = "Report", str
+    width = pdf.w - pdf.l_margin - pdf.r_margin
+    bottom = pdf.h - 18
+
+    def style(size: float, bold: bool = False, color=_REPORT_DARK):
+        pdf.set_font(font, "B" if bold else "", size)
+        pdf.set_text_color(*color)
+
+    def fit(s, w: float) -> str:
+        s = text(s)
+        if pdf.get_string_width(s) <= w - 2:
+            return s
+        while s and pdf.get_string_width(s + "...") > w - 2:
+            s = s[:-1]
+        return s + "..."
+
+    def new_page():
+        pdf.add_page()
+        if doc["logo"]:
+            pdf.image(doc["logo"], x=pdf.l_margin, y=8, h=9, keep_aspect_ratio=True)
+        style(8, color=_REPORT_MUTED)
+        pdf.set_xy(pdf.l_margin, 10)
+        pdf.cell(width, 5, fit(f"{doc['title']} — {doc['project']}", width * 0.6), align="R")
+        pdf.set_draw_color(*_REPORT_GREEN)
+        pdf.set_line_width(0.6)
+        pdf.line(pdf.l_margin, 19, pdf.w - pdf.r_margin, 19)
+        pdf.set_xy(pdf.l_margin, pdf.h - 12)
+        pdf.cell(width / 2, 5, text(f"{L['pdf_generated']} {doc['date']}"))
+        pdf.cell(width / 2, 5, text(f"{L['pdf_page']} {pdf.page_no()}/{{nb}}"), align="R")
+        pdf.set_xy(pdf.l_margin, 24)
+
+    def ensure(h: float):
+        if pdf.get_y() + h > bottom:
+            new_page()
+
+    def section(title: str):
+        ensure(22)
+        pdf.ln(3)
+        style(13, True, _REPORT_GREEN)
+        pdf.cell(width, 8, text(title), new_x="LMARGIN", new_y="NEXT")
+        pdf.ln(1)
+
+    def table(cols: list[tuple], rows: list[dict], group_label: str | None = None):
+        """cols = [(libellé, largeur relative, alignement, clé)] ; clé "image" = miniature."""
+        total = sum(c[1] for c in cols)
+        widths = [width * c[1] / total for c in cols]
+        with_img = any(c[3] == "image" for c in cols)
+        row_h = 15 if with_img else 6.5
+
+        def header():
+            style(8.5, True)
+            pdf.set_fill_color(*_REPORT_FILL)
+            for (label, _, align, _), w in zip(cols, widths):
+                pdf.cell(w, 7, fit(label, w), border="B", align=align, fill=True)
+            pdf.ln()
+
+        ensure(7 + row_h + (7 if group_label else 0))
+        pdf.set_draw_color(226, 232, 240)
+        pdf.set_line_width(0.2)
+        if group_label:
+            style(10, True)
+            pdf.cell(width, 7, fit(group_label, width), new_x="LMARGIN", new_y="NEXT")
+        header()
+        for r in rows:
+            if pdf.get_y() + row_h > bottom:
+                new_page()
+                header()
+            y = pdf.get_y()
+            style(8.5, bool(r.get("_bold")))
+            for (_, _, align, key), w in zip(cols, widths):
+                x = pdf.get_x()
+                if key == "image":
+                    if r.get("image"):
+                        pdf.image(r["image"], x=x + 1, y=y + 1, w=w - 2, h=row_h - 2, keep_aspect_ratio=True)
+                    pdf.set_xy(x, y)
+                    pdf.cell(w, row_h, "", border="B")
+                else:
+                    pdf.cell(w, row_h, fit(r.get(key, ""), w), border="B", align=align)
+            pdf.ln()
+
+    def kv(rows: list[tuple]):
+        table([(L["pdf_param"], 3, "L", "k"), (L["pdf_value"], 2, "R", "v")], [{"k": k, "v": v} for k, v in rows])
 
-# Frontend : cherche dans plusieurs endroits (portable)
-FRONTEND_CANDIDATES = [
-    os.path.join(BASE_DIR, "frontend", "dist"),
-    os.path.join(BASE_DIR, "dist"),
-    os.path.join(APP_ROOT, "dist"),
-]
-FRONTEND_DIST = next((p for p in FRONTEND_CANDIDATES if os.path.isdir(p)), FRONTEND_CANDIDATES[0])
+    # --- Page 1 : synthèse ---
+    new_page()
+    style(22, True)
+    pdf.cell(width, 11, text(L["pdf_report_title"]), new_x="LMARGIN", new_y="NEXT")
+    style(13, color=_REPORT_MUTED)
+    pdf.cell(width, 7, text(L["pdf_report_subtitle"]), new_x="LMARGIN", new_y="NEXT")
+    pdf.ln(3)
+    style(10)
+    pdf.cell(width, 6, fit(f"{L['pdf_project_name']} : {doc['project']}", width), new_x="LMARGIN", new_y="NEXT")
+    pdf.cell(width, 6, text(f"{L['pdf_date']} : {doc['date']}"), new_x="LMARGIN", new_y="NEXT")
 
-# Data : idem
-DATA_CANDIDATES = [
-    os.path.join(BASE_DIR, "data"),
-    os.path.join(APP_ROOT, "data"),
-    os.path.join(APP_ROOT, "..", "data"),
-]
-DATA_DIR = next((p for p in DATA_CANDIDATES if os.path.isdir(p)), DATA_CANDIDATES[0])
+    section(L["pdf_project_summary"])
+    gap, n = 3, len(doc["kpis"])
+    box_w = (width - gap * (n - 1)) / n
+    y = pdf.get_y()
+    pdf.set_fill_color(*_REPORT_FILL)
+    for i, (label, value) in enumerate(doc["kpis"]):
+        x = pdf.l_margin + i * (box_w + gap)
+        pdf.rect(x, y, box_w, 20, style="F")
+        pdf.set_xy(x, y + 3)
+        size = 12
+        style(size, True)
+        while size > 7 and pdf.get_string_width(text(value)) > box_w - 3:
+            size -= 0.5
+            style(size, True)
+        pdf.cell(box_w, 7, fit(value, box_w), align="C")
+        pdf.set_xy(x, y + 11)
+        style(7.5, color=_REPORT_MUTED)
+        pdf.cell(box_w, 5, fit(label, box_w), align="C")
+    pdf.set_xy(pdf.l_margin, y + 24)
 
-# Admin password depuis variable d'environnement
-ADMIN_PASSWORD = os.getenv("CONFIG_ADMIN_PASSWORD", "admin")
-if ADMIN_PASSWORD == "admin":
-    print("⚠️  ATTENTION: Mot de passe admin par défaut! Définissez CONFIG_ADMIN_PASSWORD")
+    section(L["pdf_rec_params"])
+    kv(doc["recording"])
 
-# Tokens en mémoire (en prod, utiliser Redis)
-TOKENS: dict[str, float] = {}
+    if doc["alerts"]:
+        section(L["pdf_alerts"])
+        for level, msg in doc["alerts"]:
+            ensure(12)
+            style(9, level == "danger", _REPORT_LEVELS.get(level, _REPORT_DARK))
+            pdf.multi_cell(width, 5, text(f"• {msg}"), new_x="LMARGIN", new_y="NEXT")
 
-# Catalogues autorisés
-ALLOWED_CATALOGS = {
-    "cameras": "cameras.csv",
-    "nvrs": "nvrs.csv",
-    "hdds": "hdds.csv",
-    "switches": "switches.csv",
-    "accessories": "accessories.csv",
-    "screens": "screens.csv",
-    "enclosures": "enclosures.csv",
-    "signage": "signage.csv",
-}
+    # --- Caméras par zone ---
+    new_page()
+    section(L["pdf_cameras_accessories"])
+    product_cols = [(L["pdf_image"], 2, "C", "image"), (L["pdf_qty"], 1, "C", "qty"),
+                    (L["pdf_ref"], 3, "L", "ref"), (L["pdf_designation"], 8, "L", "name")]
+    for zone in doc["zones"]:
+        table(product_cols, zone["cameras"] + zone["accessories"], zone["label"])
+        pdf.ln(3)
 
-# Base KPI
-KPI_DB = os.path.join(APP_ROOT, "kpi.sqlite3")
+    # --- Équipements ---
+    section(L["pdf_equipment"])
+    for group in doc["equipment"]:
+        if group["rows"]:
+            table(product_cols, group["rows"], group["title"])
+            pdf.ln(3)
 
-# ============================================================
-# DATABASE KPI
-# ============================================================
+    # --- Annexe 1 : stockage ---
+    new_page()
+    section(L["pdf_annex1"])
+    style(10, True)
+    pdf.cell(width, 7, text(L["pdf_hypotheses"]), new_x="LMARGIN", new_y="NEXT")
+    kv(doc["storage"])
+    pdf.ln(3)
+    style(10, True)
+    pdf.cell(width, 7, text(L["pdf_formula"]), new_x="LMARGIN", new_y="NEXT")
+    style(9)
+    pdf.multi_cell(width, 5, text(doc["formula"]), new_x="LMARGIN", new_y="NEXT")
+    pdf.ln(2)
+    style(10, True)
+    pdf.cell(width, 7, text(L["pdf_bitrate_detail"]), new_x="LMARGIN", new_y="NEXT")
+    table([(L["pdf_ref"], 3, "L", "ref"), (L["pdf_designation"], 6, "L", "name"), (L["pdf_qty"], 1, "C", "qty"),
+           (L["pdf_mbps_cam"], 2, "R", "mbps_cam"), (L["pdf_mbps_total"], 2, "R", "mbps_line")], doc["bitrate"])
+    style(7.5, color=_REPORT_MUTED)
+    pdf.cell(width, 6, text(f"{L['pdf_source_catalog']} ({L['pdf_source_estimation']})"), new_x="LMARGIN", new_y="NEXT")
+    return bytes(pdf.output())
 
-def _db():
-    con = sqlite3.connect(KPI_DB)
-    con.execute("""
-        CREATE TABLE IF NOT EXISTS kpi_events(
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            ts_utc TEXT NOT NULL,
-            session_id TEXT,
-            event TEXT NOT NULL,
-            payload_json TEXT,
-            path TEXT,
-            ua TEXT,
-            ip TEXT
-        );
-    """)
-    con.execute("CREATE INDEX IF NOT EXISTS idx_kpi_ts ON kpi_events(ts_utc);")
-    con.execute("CREATE INDEX IF NOT EXISTS idx_kpi_event ON kpi_events(event);")
-    con.commit()
-    return con
 
-# Init DB au démarrage
-_db().close()
+def _report_document(data) -> dict:
+    """
+    Projet -> document entièrement résolu (libellés, noms, chemins des miniatures) :
+    c'est ce dict qui est haché pour le cache et envoyé au pool de rendu.
+    """
+    res = _report_resources()
+    lang = data.lang if data.lang in res["labels"] else "fr"
+    L = {**res["labels"].get("fr", {}), **res["labels"].get(lang, {})}
+    blocks = {b.id: b.label for b in data.cameraBlocks}
+    lines = [l.model_dump() for l in data.cameraLines]
+    for l in lines:
+        l["blockLabel"] = l["blockLabel"] or blocks.get(l["fromBlockId"] or "", "")
+    proj, _ = _sizing_compute(lines, data.recording.model_dump(exclude_none=True), data.overrideNvrId)
+    products = _report_products()
 
-# ============================================================
-# APP FASTAPI
-# ============================================================
+    def product(pid, qty, fallback_name: str = "") -> dict:
+        pid = str(pid or "").strip()
+        p = products.get(pid.upper(), {})
+        name = p.get(f"name_{lang}") or p.get("name") or fallback_name or pid
+        return {"qty": str(qty), "ref": p.get("id", pid), "name": name,
+                "image": _report_thumb(p.get("family", ""), p.get("id", pid))}
 
-app = FastAPI(
-    title="Configurateur Comelit",
-    version="1.0.0",
-    docs_url="/api/docs",
-    redoc_url="/api/redoc",
-)
+    zones: dict[str, dict] = {}
+    for c in proj["perCamera"]:
+        z = zones.setdefault(c["fromBlockId"] or "", {"label": c["blockLabel"] or L["pdf_no_zone"], "cameras": [], "accessories": []})
+        z["cameras"].append(product(c["cameraId"], c["qty"], c["cameraName"]))
+    for a in data.accessoryLines:
+        if a.qty > 0 and str(a.accessoryId or "").strip().lower() not in ("", "false"):
+            z = zones.setdefault(a.fromBlockId or "", {"label": blocks.get(a.fromBlockId or "") or L["pdf_no_zone"], "cameras": [], "accessories": []})
+            z["accessories"].append(product(a.accessoryId, a.qty))
 
-# Middleware Gzip : compresse automatiquement les réponses > 500 bytes
-app.add_middleware(GZipMiddleware, minimum_size=500)
+    nvr = (proj["nvrPick"] or {}).get("nvr")
+    disks = proj["disks"]
+    disk_rows = []
+    if disks and disks["count"]:
+        ref = (disks.get("hddRef") or {}).get("id")
+        disk_rows.append(product(ref, disks["count"], f"HDD {disks['sizeTB']:g} TB") if ref
+                         else {"qty": str(disks["count"]), "ref": f"HDD {disks['sizeTB']:g} TB", "name": "", "image": None})
+    equipment = [
+        {"title": L["pdf_nvr"], "rows": [product(nvr["id"], 1, nvr.get("name", ""))] if nvr else []},
+        {"title": L["pdf_disks"], "rows": disk_rows},
+        {"title": L["pdf_switches"], "rows": [product(p["item"]["id"], p["qty"], p["item"].get("name", ""))
+                                             for p in proj["switches"].get("plan", [])]},
+        {"title": L["pdf_complements"], "rows": [product(e.id, e.qty) for e in data.extras if e.qty > 0]},
+    ]
+    sp = proj["storageParams"]
+    mode = L["pdf_motion"] if sp["mode"] == "motion" else L["pdf_continuous"]
+    recording = [(L["pdf_codec"], sp["codec"].upper()), (L["pdf_fps"], f"{sp['ips']:g}"), (L["pdf_mode"], mode),
+                 (L["pdf_hours_day"], f"{sp['hoursPerDay']:g}"), (L["pdf_days_retention"], f"{sp['daysRetention']:g}"),
+                 (L["pdf_margin"], f"{sp['overheadPct']:g} %")]
+    date = data.date or datetime.now(timezone.utc).strftime("%Y-%m-%d")
+    return {
+        "renderer": REPORT_RENDERER_VERSION,
+        "labels": L, "font": res["font"], "font_bold": res["font_bold"], "logo": res["logo"],
+        "title": L["pdf_report_title"], "project": data.projectName.strip() or "-", "date": date,
+        "kpis": [(L["pdf_cameras"], str(proj["totalCameras"])), (L["pdf_zones"], str(len(zones))),
+                 (L["pdf_total_bitrate"], f"{proj['totalInMbps']:.1f} Mbps"),
+                 (L["pdf_required_storage"], f"{proj['requiredTB']:.1f} TB"), (L["pdf_nvr"], nvr["id"] if nvr else "-")],
+        "recording": recording,
+        "alerts": [(a["level"], L.get(a["text"], a["text"])) for a in proj["alerts"]],
+        "zones": list(zones.values()),
+        "equipment": equipment,
+        "storage": recording + [(L["pdf_total_bitrate"], f"{proj['totalInMbps']:.2f} Mbps"),
+                                (L["pdf_required_storage"], f"{proj['requiredTB']:.2f} TB")],
+        "formula": (f"TB = {L['pdf_total_bitrate']} (Mbps) × 3600 × {L['pdf_hours_day']} × {L['pdf_days_retention']}"
+                    f" ÷ 8 ÷ 1 000 000 × (1 + {L['pdf_margin']})"),
+        "bitrate": [{"ref": c["cameraId"], "name": c["cameraName"], "qty": str(c["qty"]),
+                     "mbps_cam": f"{c['mbpsPerCam']:.2f}", "mbps_line": f"{c['mbpsLine']:.2f}"} for c in proj["perCamera"]]
+                   + [{"ref": "", "name": L["pdf_total_bitrate"], "qty": str(proj["totalCameras"]), "mbps_cam": "",
+                       "mbps_line": f"{proj['totalInMbps']:.2f}", "_bold": True}],
+    }
+
+
+async def _report_build(doc: dict, path: str):
+    """Rendu dans le pool de processus (ou thread si REPORT_WORKERS=0) puis stockage."""
+    with METRICS.timed("report_render"):
+        pool = _report_pool()
+        if pool is not None:
+            pdf = await asyncio.get_running_loop().run_in_executor(pool, _report_render, doc)
+        else:
+            pdf = await run_in_threadpool(_report_render, doc)
+    await run_in_threadpool(_report_store, path, pdf)
 
-# CORS
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
 
 # ============================================================
-# HELPERS
+# PARTAGE DE PROJETS (instantanés canoniques, id court par hash de contenu)
 # ============================================================
 
-def require_auth(auth: str | None):
-    """Vérifie le token d'authentification."""
-    if not auth or not auth.lower().startswith("bearer "):
-        raise HTTPException(status_code=401, detail="Missing token")
-    token = auth.split(" ", 1)[1].strip()
-    exp = TOKENS.get(token)
-    if not exp or exp < time.time():
-        raise HTTPException(status_code=401, detail="Invalid or expired token")
+_SHARE_ID_LEN = 11         # 66 bits du hash en base64url, allongé seulement en cas de collision
+_SHARE_TOUCH_S = 3600      # dernier accès (LRU) réécrit au plus une fois par heure et par lien
+_SHARE_ID_RE = re.compile(r"^[A-Za-z0-9_-]{8,43}$")
 
 
-def _csv_path(kind: str) -> str:
-    """Retourne le chemin du fichier CSV."""
-    fn = ALLOWED_CATALOGS.get(kind)
-    if not fn:
-        raise HTTPException(status_code=404, detail="Unknown catalog")
-    p = os.path.abspath(os.path.join(DATA_DIR, fn))
-    if not p.startswith(os.path.abspath(DATA_DIR)):
-        raise HTTPException(status_code=400, detail="Bad path")
-    return p
+def _share_db():
+    """Connexion à la table des instantanés (WAL, une par appel)."""
+    con = _sqlite_connect(SHARE_DB, timeout=10, isolation_level=None)
+    con.execute("PRAGMA journal_mode=WAL;")
+    con.execute("PRAGMA synchronous=NORMAL;")
+    con.execute("""
+        CREATE TABLE IF NOT EXISTS shares (
+            id TEXT PRIMARY KEY,
+            digest TEXT NOT NULL UNIQUE,
+            data BLOB NOT NULL,
+            size INTEGER NOT NULL,
+            created REAL NOT NULL,
+            accessed REAL NOT NULL
+        )""")
+    con.execute("CREATE INDEX IF NOT EXISTS ix_shares_accessed ON shares(accessed)")
+    return con
 
 
-def _read_csv(path: str):
-    """Lit un fichier CSV et retourne colonnes + lignes."""
-    if not os.path.exists(path):
-        return [], []
-    with open(path, "r", encoding="utf-8-sig", newline="") as f:
-        reader = csv.DictReader(f)
-        return reader.fieldnames or [], list(reader)
+def _share_canonical(value):
+    """Forme canonique : sans valeurs vides, entiers déguisés en float ramenés à int."""
+    if isinstance(value, dict):
+        out = {k: _share_canonical(v) for k, v in value.items()}
+        return {k: v for k, v in out.items() if v is not None and v != {}}
+    if isinstance(value, list):
+        return [_share_canonical(v) for v in value]
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
 
 
-def _write_csv(path: str, columns: list[str], rows: list[dict]):
-    """Écrit un fichier CSV."""
-    os.makedirs(os.path.dirname(path), exist_ok=True)
-    with open(path, "w", encoding="utf-8", newline="") as f:
-        w = csv.DictWriter(f, fieldnames=columns, extrasaction="ignore")
-        w.writeheader()
-        for r in rows:
-            w.writerow({c: str(r.get(c) or "") for c in columns})
+def _share_encode(snap: dict) -> tuple[str, bytes]:
+    """Instantané -> (digest sha256, JSON canonique à clés triées)."""
+    body = json.dumps(_share_canonical(snap), ensure_ascii=False, sort_keys=True, separators=(",", ":")).encode("utf-8")
+    return hashlib.sha256(body).hexdigest(), body
 
 
-def cached_response(content: bytes, media_type: str, max_age: int = 3600) -> Response:
-    """Retourne une réponse avec headers de cache."""
-    return Response(
-        content=content,
-        media_type=media_type,
-        headers={"Cache-Control": f"public, max-age={max_age}"}
-    )
+def _share_evict(con: sqlite3.Connection, now: float) -> int:
+    """Expire les liens non consultés depuis SHARE_TTL_S, puis les moins récents au-delà du budget."""
+    n = con.execute("DELETE FROM shares WHERE accessed < ?", (now - SHARE_TTL_S,)).rowcount
+    total = con.execute("SELECT total(size) FROM shares").fetchone()[0]
+    if total > SHARE_MAX_BYTES:
+        n += con.execute("""
+            DELETE FROM shares WHERE id IN (
+                SELECT id FROM (SELECT id, SUM(size) OVER (ORDER BY accessed DESC, id) AS cum FROM shares)
+                WHERE cum > ?
+            )""", (SHARE_MAX_BYTES,)).rowcount
+    return n
+
+
+def _share_put(digest: str, body: bytes) -> tuple[str, bool]:
+    """Enregistre un instantané (dédupliqué par digest) ; renvoie (id, créé)."""
+    now = time.time()
+    con = _share_db()
+    try:
+        con.execute("BEGIN IMMEDIATE")
+        try:
+            row = con.execute("SELECT id FROM shares WHERE digest = ?", (digest,)).fetchone()
+            if row:
+                con.execute("UPDATE shares SET accessed = ? WHERE id = ?", (now, row[0]))
+                con.execute("COMMIT")
+                return row[0], False
+            full = _b64url(bytes.fromhex(digest))
+            sid = next(full[:n] for n in range(_SHARE_ID_LEN, len(full) + 1)
+                       if not con.execute("SELECT 1 FROM shares WHERE id = ?", (full[:n],)).fetchone())
+            data = b"".join(_gzip_chunks([body], level=9))
+            con.execute("INSERT INTO shares (id, digest, data, size, created, accessed) VALUES (?, ?, ?, ?, ?, ?)",
+                        (sid, digest, data, len(data), now, now))
+            _share_evict(con, now)
+            con.execute("COMMIT")
+        except BaseException:
+            con.execute("ROLLBACK")
+            raise
+    finally:
+        con.close()
+    return sid, True
+
+
+def _share_get(sid: str) -> tuple[str, bytes] | None:
+    """(digest, JSON gzip) d'un lien encore valide, None sinon ; rafraîchit le dernier accès."""
+    now = time.time()
+    con = _share_db()
+    try:
+        row = con.execute("SELECT digest, data, accessed FROM shares WHERE id = ?", (sid,)).fetchone()
+        if not row or row[2] < now - SHARE_TTL_S:
+            return None
+        if now - row[2] > _SHARE_TOUCH_S:
+            con.execute("UPDATE shares SET accessed = ? WHERE id = ?", (now, sid))
+    finally:
+        con.close()
+    return row[0], row[1]
+
 
 # ============================================================
 # ROUTES API
 # ============================================================
 
 @app.get("/health")
+@app.get("/health/live")
 def health():
-    """Health check pour les load balancers."""
+    """Liveness : le process répond (aucune dépendance vérifiée)."""
     return {"ok": True, "ts": datetime.now(timezone.utc).isoformat()}
 
+@app.get("/metrics")
+def metrics(authorization: str | None = Header(default=None)):
+    """Métriques au format texte Prometheus, agrégées sur tous les workers."""
+    if METRICS_TOKEN and not hmac.compare_digest(authorization or "", f"Bearer {METRICS_TOKEN}"):
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
+    if not METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Metrics disabled")
+    return Response(content=_metrics_render(_metrics_collect()),
+                    media_type="text/plain; version=0.0.4; charset=utf-8",
+                    headers={"Cache-Control": "no-store"})
+
+@app.get("/health/ready")
+def health_ready():
+    """Readiness : warm-up terminé, écrivain KPI actif, données présentes (503 sinon)."""
+    checks = {
+        "warmup": _READY.is_set(),
+        "kpi_writer": KPI_WRITER.alive(),
+        "data_dir": os.path.isdir(DATA_DIR),
+        "catalogs": "catalogs" not in _WARMUP["errors"],
+    }
+    ok = all(checks.values())
+    body = {"ok": ok, "pid": os.getpid(), "checks": checks, "warmup_ms": _WARMUP["steps"],
+            "warmup_errors": _WARMUP["errors"]}
+    return Response(content=json.dumps(body), status_code=200 if ok else 503,
+                    media_type="application/json", headers={"Cache-Control": "no-store"})
+
 
 # --- Auth ---
 
@@ -180,9 +3693,13 @@ class LoginIn(BaseModel):
 def login(data: LoginIn):
     if data.password != ADMIN_PASSWORD:
         raise HTTPException(status_code=403, detail="Bad password")
-    token = secrets.token_urlsafe(24)
-    TOKENS[token] = time.time() + 24 * 3600  # 24h
-    return {"token": token, "expires_in": 86400}
+    return {"token": _sessions().issue(SESSION_TTL_S), "expires_in": SESSION_TTL_S}
+
+@app.post("/api/logout")
+def logout(authorization: str | None = Header(default=None)):
+    """Révoque la session (backend sqlite ; un jeton signé expire simplement)."""
+    _sessions().revoke(_bearer(authorization))
+    return {"ok": True}
 
 
 # --- Catalog CRUD ---
@@ -190,29 +3707,388 @@ def login(data: LoginIn):
 class CatalogOut(BaseModel):
     kind: str
     filename: str
+    version: int = 0
     columns: list[str]
     rows: list[dict]
 
 class CatalogIn(BaseModel):
     columns: list[str]
     rows: list[dict]
+    base_version: int | None = None  # 409 si le catalogue a changé depuis
+
+class CatalogPatchIn(BaseModel):
+    upsert: list[dict] = Field(default_factory=list, max_length=5000)
+    delete: list[str] = Field(default_factory=list, max_length=5000)
+    base_version: int | None = None
+
+class CatalogRollbackIn(BaseModel):
+    version: int
 
 @app.get("/api/admin/catalog/{kind}", response_model=CatalogOut)
-def get_catalog(kind: str, authorization: str | None = Header(default=None)):
+def get_catalog(kind: str, request: Request, response: Response, authorization: str | None = Header(default=None)):
     require_auth(authorization)
-    path = _csv_path(kind)
-    cols, rows = _read_csv(path)
-    return {"kind": kind, "filename": os.path.basename(path), "columns": cols, "rows": rows}
+    entry = _catalog_load(kind)
+    if _etag_match(request.headers.get("if-none-match"), entry["etag"]):
+        return _not_modified(entry["etag"], "private, no-cache")
+    response.headers["ETag"] = entry["etag"]
+    response.headers["Cache-Control"] = "private, no-cache"
+    response.headers["X-Catalog-Version"] = str(entry["version"])
+    return {"kind": kind, "filename": os.path.basename(entry["path"]), "version": entry["version"],
+            "columns": entry["columns"], "rows": entry["rows"]}
 
 @app.put("/api/admin/catalog/{kind}")
 def put_catalog(kind: str, data: CatalogIn, authorization: str | None = Header(default=None)):
+    """Remplacement complet (validé, atomique, versionné)."""
     require_auth(authorization)
-    path = _csv_path(kind)
-    cols = [c.strip() for c in data.columns if c.strip()]
-    if not cols:
+    if not [c for c in data.columns if c.strip()]:
         raise HTTPException(status_code=400, detail="Empty columns")
-    _write_csv(path, cols, data.rows)
-    return {"ok": True, "rows": len(data.rows)}
+    entry = _catalog_write(kind, "put", lambda cur: (data.columns, data.rows), data.base_version)
+    return {"ok": True, "rows": len(entry["rows"]), "etag": entry["etag"], "version": entry["version"]}
+
+@app.patch("/api/admin/catalog/{kind}")
+def patch_catalog(kind: str, data: CatalogPatchIn, authorization: str | None = Header(default=None)):
+    """Modifications ligne à ligne par clé (id / camera_id) : upsert partiel et suppressions."""
+    require_auth(authorization)
+    stats = {"updated": 0, "inserted": 0, "deleted": 0}
+    entry = _catalog_write(kind, "patch", lambda cur: _catalog_patch_rows(kind, cur, data.upsert, data.delete, stats),
+                           data.base_version)
+    return {"ok": True, "rows": len(entry["rows"]), "etag": entry["etag"], "version": entry["version"], "changed": stats}
+
+@app.get("/api/admin/catalog/{kind}/history")
+def catalog_history(kind: str, authorization: str | None = Header(default=None)):
+    require_auth(authorization)
+    entry = _catalog_load(kind)
+    return {"kind": kind, "version": entry["version"], "history": _catalog_history(kind)}
+
+@app.post("/api/admin/catalog/{kind}/rollback")
+def catalog_rollback(kind: str, data: CatalogRollbackIn, authorization: str | None = Header(default=None)):
+    """Republie une version de l'historique (sous un nouveau numéro de version)."""
+    require_auth(authorization)
+    _csv_path(kind)
+    snap = os.path.join(_catalog_history_dir(kind), f"{data.version:06d}.csv")
+    if not os.path.isfile(snap):
+        raise HTTPException(404, "Version absente de l'historique")
+    snap_cols, snap_rows = _read_csv(snap)
+    entry = _catalog_write(kind, f"rollback:{data.version}", lambda cur: (snap_cols, snap_rows))
+    return {"ok": True, "rows": len(entry["rows"]), "etag": entry["etag"], "version": entry["version"]}
+
+@app.get("/api/catalog/{kind}/query")
+def catalog_query(
+    kind: str,
+    request: Request,
+    fields: str = "",
+    f: list[str] = Query(default_factory=list),
+    sort: str = "",
+    limit: int = Query(100, ge=1, le=QUERY_MAX_LIMIT),
+    offset: int = Query(0, ge=0),
+    format: str = "json",
+):
+    """
+    Requête sur le store SQLite : projection (fields=a,b), filtres typés répétables
+    (f=colonne:op:valeur), tri (sort=-col,col2) et pagination ; format=csv pour un export.
+    """
+    _csv_path(kind)
+    res = _store_query(kind, [x for x in fields.split(",") if x], f, [x for x in sort.split(",") if x], limit, offset)
+    etag = '"' + hashlib.sha256(f"{res['etag']}|{request.url.query}".encode()).hexdigest()[:32] + '"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache", "X-Catalog-Version": str(res["version"]),
+               "X-Total-Count": str(res["total"])}
+    if _etag_match(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    if format == "csv":
+        return Response(content=_csv_bytes(res["columns"], res["raws"]), media_type="text/csv; charset=utf-8", headers=headers)
+    rows = _typed_rows(res["columns"], res["raws"], res["types"])
+    body = {k: res[k] for k in ("kind", "version", "total", "limit", "offset", "columns")}
+    body["rows"] = rows
+    return Response(content=json.dumps(body, ensure_ascii=False, separators=(",", ":")).encode("utf-8"),
+                    media_type="application/json", headers=headers)
+
+@app.get("/api/catalog/versions")
+def catalog_versions():
+    """Numéro de version de chaque catalogue (invalidation côté client sans retéléchargement)."""
+    return {kind: _catalog_load(kind)["version"] for kind in ALLOWED_CATALOGS}
+
+
+@app.get("/api/catalog/bundle")
+def catalog_bundle(request: Request):
+    """Tous les catalogues en un seul JSON typé (gzip pré-calculé, ETag, 304)."""
+    b = _bundle_get()
+    headers = {"ETag": b["etag"], "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+    if _etag_match(request.headers.get("if-none-match"), b["etag"]):
+        return Response(status_code=304, headers=headers)
+    if "gzip" in _accepted_encodings(request.headers.get("accept-encoding")):
+        headers["Content-Encoding"] = "gzip"
+        return Response(content=b["gzip"], media_type="application/json", headers=headers)
+    return Response(content=b["json"], media_type="application/json", headers=headers)
+
+
+@app.get("/data/{name}.csv")
+def data_csv(name: str, request: Request):
+    """CSV catalogues servis depuis le cache mémoire, avec ETag fort et 304."""
+    kind = _CATALOG_BY_FILE.get(name + ".csv")
+    if not kind:
+        path = os.path.join(DATA_DIR, os.path.basename(name) + ".csv")
+        if os.path.isfile(path):
+            return FileResponse(path)
+        raise HTTPException(404)
+    entry = _catalog_load(kind)
+    if entry["stamp"] is None:
+        raise HTTPException(404)
+    if _etag_match(request.headers.get("if-none-match"), entry["etag"]):
+        return _not_modified(entry["etag"], "no-cache")
+    headers = {"ETag": entry["etag"], "Cache-Control": "no-cache", "Vary": "Accept-Encoding",
+               "X-Catalog-Version": str(entry["version"])}
+    body = entry["raw"]
+    if "gzip" in _accepted_encodings(request.headers.get("accept-encoding")):
+        # compressé une fois par version du CSV (et non à chaque réponse par GZipMiddleware)
+        if "gzip" not in entry:
+            entry["gzip"] = b"".join(_gzip_chunks([entry["raw"]], level=9))
+        body = entry["gzip"]
+        headers["Content-Encoding"] = "gzip"
+    return Response(content=body, media_type="text/csv; charset=utf-8", headers=headers)
+
+
+# --- Images produits ---
+
+@app.get("/api/img/manifest")
+def image_manifest(request: Request):
+    """Hash de contenu de chaque image (famille/ID) pour construire des URLs immuables."""
+    m = _image_manifest()
+    if _etag_match(request.headers.get("if-none-match"), m["etag"]):
+        return _not_modified(m["etag"], "no-cache")
+    return Response(content=m["json"], media_type="application/json",
+                    headers={"ETag": m["etag"], "Cache-Control": "no-cache"})
+
+@app.post("/api/img/warm")
+def image_warm(authorization: str | None = Header(default=None)):
+    """Pré-génère toutes les variantes en tâche de fond."""
+    require_auth(authorization)
+    if Image is None:
+        raise HTTPException(501, "Pillow non installé")
+    threading.Thread(target=_image_warm, name="image-warm", daemon=True).start()
+    return {"ok": True, "images": len(_image_manifest()["images"]), "formats": _image_formats(), "widths": IMAGE_WIDTHS}
+
+@app.get("/api/img/{family}/{ref}")
+def image(family: str, ref: str, request: Request, w: int = 256, v: str = ""):
+    """
+    Miniature d'une image produit : largeur arrondie à IMAGE_WIDTHS, format négocié
+    sur Accept (WebP > AVIF > PNG). Immuable si l'URL porte le hash courant (?v=).
+    """
+    src = _image_source(family, ref)
+    if not src:
+        raise HTTPException(404)
+    digest = _image_hash(src)
+    width = next((x for x in IMAGE_WIDTHS if x >= w), IMAGE_WIDTHS[-1])
+    if Image is None:
+        path, fmt = src, os.path.splitext(src)[1].lstrip(".").lower().replace("jpg", "jpeg")
+    else:
+        fmt = _negotiate_image_format(request.headers.get("accept"))
+        path = _image_derivative(src, digest, width, fmt)
+    etag = f'"{digest}-{width}-{fmt}"'
+    cache_control = "public, max-age=31536000, immutable" if v == digest else "public, max-age=3600"
+    if _etag_match(request.headers.get("if-none-match"), etag):
+        return _not_modified(etag, cache_control)
+    return FileResponse(path, media_type=f"image/{fmt}",
+                        headers={"ETag": etag, "Cache-Control": cache_control, "Vary": "Accept"})
+
+
+# --- Recommandation ---
+
+class RecommendBlockIn(BaseModel):
+    id: str | None = None
+    answers: dict = Field(default_factory=dict)
+
+class RecommendIn(BaseModel):
+    blocks: list[RecommendBlockIn] = Field(..., max_length=200)
+    rules: bool = True
+
+@app.post("/api/recommend")
+def recommend(data: RecommendIn):
+    """Recommandation caméra pour plusieurs blocs en un appel (résultats mémorisés)."""
+    eng = _reco_engine()
+    results = [{"id": b.id, **eng.recommend(b.answers, data.rules)} for b in data.blocks]
+    return {"version": eng.version, "results": results}
+
+
+# --- Dimensionnement projet ---
+
+class ProjectLineIn(BaseModel):
+    cameraId: str
+    qty: int = Field(0, ge=0, le=10000)
+    fromBlockId: str | None = None
+    blockLabel: str | None = None
+
+class RecordingIn(BaseModel):
+    fps: float | None = None
+    codec: str | None = None
+    hoursPerDay: float | None = None
+    daysRetention: float | None = None
+    overheadPct: float | None = None
+    reservePortsPct: float | None = None
+    mode: str | None = None
+
+class ProjectComputeIn(BaseModel):
+    cameraLines: list[ProjectLineIn] = Field(default_factory=list, max_length=500)
+    recording: RecordingIn = Field(default_factory=RecordingIn)
+    overrideNvrId: str | None = None
+
+@app.post("/api/project/compute")
+def project_compute(data: ProjectComputeIn):
+    """Débits par caméra, stockage, NVR, disques, switches PoE et alertes (résultat mémorisé)."""
+    lines = [l.model_dump() for l in data.cameraLines]
+    rec = data.recording.model_dump(exclude_none=True)
+    result, key = _sizing_compute(lines, rec, data.overrideNvrId)
+    return {"version": _SIZING["tables"].version, "key": key, **result}
+
+
+# --- Rapport PDF ---
+
+class ReportBlockIn(BaseModel):
+    id: str
+    label: str = Field("", max_length=200)
+
+class ReportAccessoryIn(BaseModel):
+    accessoryId: str | None = None
+    fromBlockId: str | None = None
+    qty: int = Field(0, ge=0, le=10000)
+
+class ReportExtraIn(BaseModel):
+    id: str
+    qty: int = Field(1, ge=0, le=10000)
+
+class ReportIn(ProjectComputeIn):
+    projectName: str = Field("", max_length=200)
+    lang: str = "fr"
+    date: str | None = Field(None, max_length=32)
+    cameraBlocks: list[ReportBlockIn] = Field(default_factory=list, max_length=200)
+    accessoryLines: list[ReportAccessoryIn] = Field(default_factory=list, max_length=1000)
+    extras: list[ReportExtraIn] = Field(default_factory=list, max_length=100)
+
+@app.post("/api/report/pdf")
+async def report_pdf(data: ReportIn, request: Request):
+    """
+    Rapport PDF du projet rendu côté serveur. Le document résolu est haché :
+    un projet identique (même catalogue, mêmes images) renvoie le PDF déjà produit,
+    et les demandes simultanées d'un même document partagent un seul rendu.
+    """
+    if FPDF is None:
+        raise HTTPException(503, "Rendu PDF serveur indisponible (fpdf2 non installé)")
+    doc = await run_in_threadpool(_report_document, data)
+    key = hashlib.sha256(json.dumps(doc, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+    path = os.path.join(REPORT_CACHE_DIR, key[:2], key + ".pdf")
+    etag = f'"{key[:32]}"'
+    headers = {"ETag": etag, "Cache-Control": "private, max-age=3600",
+               "Content-Disposition": _content_disposition("inline", _safe_archive_name(doc["project"], ".pdf"))}
+    if _etag_match(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    if os.path.exists(path):
+        headers["X-Report-Cache"] = "hit"
+        os.utime(path)  # récence pour la purge
+    else:
+        task = _REPORT_INFLIGHT.get(key)
+        headers["X-Report-Cache"] = "shared" if task else "miss"
+        if task is None:
+            task = _REPORT_INFLIGHT[key] = asyncio.ensure_future(_report_build(doc, path))
+            task.add_done_callback(lambda _: _REPORT_INFLIGHT.pop(key, None))
+        await asyncio.shield(task)
+    return FileResponse(path, media_type="application/pdf", headers=headers)
+
+
+# --- Proxy médias ---
+
+@app.get("/api/media")
+def media_proxy(request: Request, url: str, lang: str = ""):
+    """Image / PDF distant servi depuis le cache disque (lang : URL localisée puis repli fr_FR)."""
+    if not MEDIA_CACHE.allowed(url):
+        raise HTTPException(403, "Hôte non autorisé")
+    got = None
+    for u in (_datasheet_urls(url, lang) if lang else [url]):
+        got = MEDIA_CACHE.get(u, lang)
+        if got:
+            break
+    if not got:
+        raise HTTPException(502, "Média indisponible")
+    path, meta = got
+    etag = '"' + hashlib.sha256(f"{path}|{meta['size']}|{meta.get('etag')}|{meta.get('last_modified')}".encode()).hexdigest()[:32] + '"'
+    cache_control = "public, max-age=86400"
+    if _etag_match(request.headers.get("if-none-match"), etag):
+        return _not_modified(etag, cache_control)
+    return FileResponse(path, media_type=meta.get("content_type"), headers={"ETag": etag, "Cache-Control": cache_control})
+
+@app.get("/api/media/stats")
+def media_stats(authorization: str | None = Header(default=None)):
+    """Compteurs du cache médias (hits / misses / évictions...)."""
+    require_auth(authorization)
+    return MEDIA_CACHE.snapshot()
+
+
+# --- Liens de partage ---
+
+def _catalog_ref(v):
+    """Référence catalogue : un objet embarqué ({"id": ..., ...}) est réduit à son id."""
+    return v.get("id") if isinstance(v, dict) else v
+
+CatalogRef = Annotated[str | None, BeforeValidator(_catalog_ref), Field(None, max_length=64)]
+
+class ShareBlockIn(BaseModel):
+    id: str = Field(max_length=64)
+    label: str | None = Field(None, max_length=200)
+    validated: bool | None = None
+    selectedCameraId: CatalogRef = None
+    qty: int | None = Field(None, ge=0, le=10000)
+    answers: dict = Field(default_factory=dict)
+
+class ShareLineIn(BaseModel):
+    cameraId: CatalogRef = None
+    fromBlockId: str | None = Field(None, max_length=64)
+    qty: int | None = Field(None, ge=0, le=10000)
+
+class ShareAccessoryIn(BaseModel):
+    accessoryId: CatalogRef = None
+    fromBlockId: str | None = Field(None, max_length=64)
+    qty: int | None = Field(None, ge=0, le=10000)
+    type: str | None = Field(None, max_length=64)
+
+class ShareIn(BaseModel):
+    """Instantané de snapshotForSave() ; les champs inconnus (savedAt, objets dérivés) sont ignorés."""
+    projectName: str | None = Field(None, max_length=200)
+    projectUseCase: str | None = Field(None, max_length=200)
+    cameraBlocks: list[ShareBlockIn] = Field(default_factory=list, max_length=200)
+    cameraLines: list[ShareLineIn] = Field(default_factory=list, max_length=500)
+    accessoryLines: list[ShareAccessoryIn] = Field(default_factory=list, max_length=1000)
+    recording: dict = Field(default_factory=dict)
+    complements: dict = Field(default_factory=dict)
+    overrideNvrId: CatalogRef = None
+
+@app.post("/api/share")
+def share_create(data: ShareIn):
+    """
+    Enregistre un instantané de projet et renvoie un id court. Le JSON canonique
+    (clés triées, ids catalogue) est haché : un même projet renvoie toujours le même id.
+    """
+    digest, body = _share_encode(data.model_dump(exclude_none=True))
+    if len(body) > SHARE_MAX_SNAPSHOT_BYTES:
+        raise HTTPException(413, f"Instantané trop volumineux (max {SHARE_MAX_SNAPSHOT_BYTES // 1024} Ko)")
+    sid, created = _share_put(digest, body)
+    METRICS.inc("share_snapshots_total", (("result", "created" if created else "dedup"),))
+    return {"ok": True, "id": sid, "path": f"/?s={sid}", "created": created, "bytes": len(body)}
+
+
+@app.get("/api/share/{sid}")
+def share_get(sid: str, request: Request):
+    """Instantané partagé : contenu immuable pour un id donné (cache long, ETag, gzip pré-calculé)."""
+    found = _share_get(sid) if _SHARE_ID_RE.match(sid) else None
+    if not found:
+        raise HTTPException(404, "Lien de partage inconnu ou expiré")
+    digest, data = found
+    etag = f'"{digest[:32]}"'
+    cache = "public, max-age=31536000, immutable"
+    if _etag_match(request.headers.get("if-none-match"), etag):
+        return _not_modified(etag, cache)
+    headers = {"ETag": etag, "Cache-Control": cache, "Vary": "Accept-Encoding"}
+    if "gzip" in _accepted_encodings(request.headers.get("accept-encoding")):
+        headers["Content-Encoding"] = "gzip"
+        return Response(content=data, media_type="application/json", headers=headers)
+    return Response(content=zlib.decompress(data, 31), media_type="application/json", headers=headers)
 
 
 # --- KPI ---
@@ -222,67 +4098,295 @@ class KpiIn(BaseModel):
     event: str = Field(..., min_length=1, max_length=80)
     payload: dict = Field(default_factory=dict)
 
-@app.post("/api/kpi/collect")
-async def kpi_collect(data: KpiIn, request: Request):
-    ts = datetime.now(timezone.utc).isoformat()
-    con = _db()
-    con.execute(
-        "INSERT INTO kpi_events(ts_utc, session_id, event, payload_json, path, ua, ip) VALUES(?,?,?,?,?,?,?)",
-        (ts, data.session_id, data.event, json.dumps(data.payload, ensure_ascii=False),
-         request.headers.get("referer", ""), request.headers.get("user-agent", ""),
-         request.client.host if request.client else "")
+def _kpi_row(data: KpiIn, request: Request, ts: str) -> tuple:
+    """Convertit un event validé en ligne kpi_events."""
+    return (
+        ts, data.session_id, data.event, json.dumps(data.payload, ensure_ascii=False),
+        request.headers.get("referer", ""), request.headers.get("user-agent", ""),
+        request.client.host if request.client else "",
     )
-    con.commit()
-    con.close()
-    return {"ok": True}
+
+class KpiBatchIn(BaseModel):
+    session_id: str | None = None
+    events: list[KpiIn] = Field(..., max_length=KPI_BATCH_MAX_EVENTS)
+
+async def _kpi_read(request: Request, model: type[BaseModel]):
+    """Corps JSON lu avec plafond (Content-Length puis flux, 413) avant validation par `model`."""
+    length = request.headers.get("content-length", "")
+    too_large = length.isdigit() and int(length) > KPI_MAX_BODY_BYTES
+    body = bytearray()
+    if not too_large:
+        async for chunk in request.stream():
+            body += chunk
+            if len(body) > KPI_MAX_BODY_BYTES:
+                too_large = True
+                break
+    if too_large:
+        KPI_GUARD.count("body_too_large")
+        raise HTTPException(413, f"Corps KPI > {KPI_MAX_BODY_BYTES // 1024} Ko")
+    try:
+        return model.model_validate_json(bytes(body))
+    except ValidationError as e:
+        raise RequestValidationError(e.errors(include_url=False))
+
+def _kpi_ingest(request: Request, session_id: str | None, events: list[KpiIn]):
+    """
+    Garde (taille, doublons, débit) puis file bornée de l'écrivain.
+    200 : tout est traité (doublons / payloads trop gros ignorés, sans retry) ;
+    429 + Retry-After : débit du client dépassé ; 202 : serveur saturé, events délestés.
+    """
+    ts = datetime.now(timezone.utc).isoformat()
+    rows = [_kpi_row(ev, request, ts) for ev in events]
+    admitted, retry_after = KPI_GUARD.admit(request.client.host if request.client else "", session_id, rows)
+    accepted = KPI_WRITER.put_many(admitted)
+    KPI_GUARD.count("accepted", accepted)
+    KPI_GUARD.count("shed", len(admitted) - accepted)
+    body = {"ok": True, "accepted": accepted, "dropped": len(rows) - accepted}
+    if retry_after:
+        return JSONResponse(body, status_code=429, headers={"Retry-After": str(max(1, math.ceil(retry_after)))})
+    if accepted < len(admitted):
+        return JSONResponse(body, status_code=202)
+    return body
+
+@app.post("/api/kpi/collect")
+async def kpi_collect(request: Request):
+    data = await _kpi_read(request, KpiIn)
+    return _kpi_ingest(request, data.session_id, [data])
 
 @app.post("/api/kpi/event")
-async def kpi_event(data: KpiIn, request: Request):
-    return await kpi_collect(data, request)
+async def kpi_event(request: Request):
+    return await kpi_collect(request)
+
+@app.post("/api/kpi/batch")
+async def kpi_batch(request: Request):
+    """Reçoit un lot d'events (file côté client) : 1 requête, 1 transaction."""
+    data = await _kpi_read(request, KpiBatchIn)
+    for ev in data.events:
+        if ev.session_id is None:
+            ev.session_id = data.session_id
+    return _kpi_ingest(request, data.session_id, data.events)
+
+@app.get("/api/kpi/ingest-stats")
+def kpi_ingest_stats(authorization: str | None = Header(default=None)):
+    """Profondeur de file et latences de flush de l'écrivain KPI, compteurs de la garde d'ingestion."""
+    require_auth(authorization)
+    return {**KPI_WRITER.snapshot(), "guard": KPI_GUARD.snapshot()}
 
 @app.get("/api/kpi/summary")
 def kpi_summary(authorization: str | None = Header(default=None)):
+    """Synthèse lue uniquement dans les rollups (coût en O(jours), pas en O(events))."""
     require_auth(authorization)
     con = _db()
     cur = con.cursor()
-    cur.execute("SELECT COUNT(*) FROM kpi_events")
+    cur.execute("SELECT COALESCE(SUM(count), 0) FROM kpi_daily")
     total = cur.fetchone()[0]
-    cur.execute("SELECT event, COUNT(*) c FROM kpi_events GROUP BY event ORDER BY c DESC LIMIT 20")
+    cur.execute("SELECT event, SUM(count) c FROM kpi_daily GROUP BY event ORDER BY c DESC LIMIT 20")
     top = [{"event": e, "count": c} for e, c in cur.fetchall()]
-    cur.execute("SELECT substr(ts_utc,1,10) d, COUNT(*) c FROM kpi_events GROUP BY d ORDER BY d DESC LIMIT 90")
-    by_day = [{"date": d, "count": c} for d, c in cur.fetchall()][::-1]
+    cur.execute("""
+        SELECT d.day, d.c, (SELECT COUNT(*) FROM kpi_daily_sessions s WHERE s.day = d.day)
+        FROM (SELECT day, SUM(count) c FROM kpi_daily GROUP BY day ORDER BY day DESC LIMIT 90) d
+    """)
+    by_day = [{"date": d, "count": c, "sessions": n} for d, c, n in cur.fetchall()][::-1]
+    cur.execute("SELECT key, SUM(count) c FROM kpi_daily_keys GROUP BY key ORDER BY c DESC LIMIT 20")
+    top_keys = [{"key": k, "count": c} for k, c in cur.fetchall()]
     con.close()
-    return {"total": total, "top": top, "by_day": by_day}
+    return {"total": total, "top": top, "by_day": by_day, "top_keys": top_keys}
 
-@app.get("/api/kpi/events")
-def kpi_events(limit: int = 200, event: str = None, authorization: str | None = Header(default=None)):
+@app.post("/api/kpi/rollups/rebuild")
+def kpi_rollups_rebuild(authorization: str | None = Header(default=None)):
+    """Reconstruit les rollups depuis les events bruts (après import/réparation manuelle)."""
     require_auth(authorization)
-    limit = max(1, min(limit, 5000))
+    KPI_WRITER.flush()
+    t0 = time.perf_counter()
     con = _db()
-    cur = con.cursor()
-    if event:
-        cur.execute("SELECT ts_utc, session_id, event, payload_json, path, ip FROM kpi_events WHERE event=? ORDER BY id DESC LIMIT ?", (event, limit))
-    else:
-        cur.execute("SELECT ts_utc, session_id, event, payload_json, path, ip FROM kpi_events ORDER BY id DESC LIMIT ?", (limit,))
-    rows = [{"ts_utc": r[0], "session_id": r[1], "event": r[2], "payload": json.loads(r[3]) if r[3] else {}, "path": r[4], "ip": r[5]} for r in cur.fetchall()]
+    _kpi_rebuild_rollups(con)
     con.close()
-    return {"rows": rows}
+    return {"ok": True, "ms": round((time.perf_counter() - t0) * 1000, 1)}
 
-@app.get("/api/kpi/export.csv")
-def kpi_export(authorization: str | None = Header(default=None)):
+def _kpi_where(start: str | None = None, end: str | None = None,
+               event: str | None = None, session_id: str | None = None,
+               event_prefix: str | None = None, path: str | None = None) -> tuple[str, list]:
+    """
+    Construit la clause WHERE commune (start inclus, end exclu, comparaison ISO).
+    Les préfixes sont traduits en intervalles pour rester indexables.
+    """
+    conds, args = [], []
+    if start:
+        conds.append("ts_utc >= ?")
+        args.append(start)
+    if end:
+        conds.append("ts_utc < ?")
+        args.append(end)
+    if event:
+        conds.append("event = ?")
+        args.append(event)
+    if event_prefix:
+        conds.append("event >= ? AND event < ?")
+        args += [event_prefix, event_prefix + "\U0010ffff"]
+    if session_id:
+        conds.append("session_id = ?")
+        args.append(session_id)
+    if path:
+        conds.append("path >= ? AND path < ?")
+        args += [path, path + "\U0010ffff"]
+    return (" WHERE " + " AND ".join(conds) if conds else ""), args
+
+
+def _encode_cursor(key: str, value: int) -> str:
+    return base64.urlsafe_b64encode(json.dumps({key: value}).encode()).decode().rstrip("=")
+
+
+def _decode_cursor(token: str) -> dict:
+    try:
+        data = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+        return {k: int(v) for k, v in data.items() if k in ("before_id", "after_id")}
+    except Exception:
+        raise HTTPException(400, "Invalid cursor")
+
+
+@app.get("/api/kpi/events")
+def kpi_events(
+    limit: int = 200,
+    event: str = None,
+    event_prefix: str | None = None,
+    session_id: str | None = None,
+    path: str | None = None,
+    start: str | None = None,
+    end: str | None = None,
+    before_id: int | None = None,
+    after_id: int | None = None,
+    cursor: str | None = None,
+    raw: bool = False,
+    authorization: str | None = Header(default=None),
+):
+    """
+    Events paginés par curseur (id) : coût constant par page quelle que soit la profondeur.
+    Ordre : id décroissant. next_cursor → page plus ancienne, prev_cursor → plus récente.
+    raw=1 : payload JSON recopié tel quel (pas de json.loads / json.dumps).
+    """
     require_auth(authorization)
-    con = _db()
-    cur = con.cursor()
-    cur.execute("SELECT ts_utc, session_id, event, payload_json, path, ua, ip FROM kpi_events ORDER BY id DESC")
+    limit = max(1, min(limit, 5000))
+    if cursor:
+        c = _decode_cursor(cursor)
+        before_id, after_id = c.get("before_id"), c.get("after_id")
+    where, args = _kpi_where(start, end, event, session_id, event_prefix, path)
+    order = "DESC"
+    if before_id is not None:
+        where += (" AND" if where else " WHERE") + " id < ?"
+        args.append(before_id)
+    elif after_id is not None:
+        where += (" AND" if where else " WHERE") + " id > ?"
+        args.append(after_id)
+        order = "ASC"
+    # Fan-out : seules les partitions compatibles avec les dates et le curseur sont lues
+    months = _kpi_months(start, end)
+    if before_id is not None:
+        months = [m for m in months if m <= _kpi_id_month(before_id)]
+    elif after_id is not None:
+        months = [m for m in months if m >= _kpi_id_month(after_id)]
+    if order == "DESC":
+        months.reverse()
+    fetched = []
+    for month in months:
+        con = _kpi_part_db(month)
+        if con is None:
+            continue
+        cur = con.execute(
+            f"SELECT id, ts_utc, session_id, event, payload_json, path, ip FROM kpi_events{where} "
+            f"ORDER BY id {order} LIMIT ?", args + [limit - len(fetched)])
+        fetched += cur.fetchall()
+        con.close()
+        if len(fetched) >= limit:
+            break
+    if order == "ASC":
+        fetched.reverse()
+
+    more = len(fetched) == limit
+    next_cursor = prev_cursor = None
+    if fetched:
+        if more or after_id is not None:
+            next_cursor = _encode_cursor("before_id", fetched[-1][0])
+        if before_id is not None or (after_id is not None and more):
+            prev_cursor = _encode_cursor("after_id", fetched[0][0])
+
+    if not raw:
+        rows = [{"id": r[0], "ts_utc": r[1], "session_id": r[2], "event": r[3],
+                 "payload": json.loads(r[4]) if r[4] else {}, "path": r[5], "ip": r[6]} for r in fetched]
+        return {"rows": rows, "next_cursor": next_cursor, "prev_cursor": prev_cursor}
+
+    parts = []
+    for r in fetched:
+        head = json.dumps({"id": r[0], "ts_utc": r[1], "session_id": r[2], "event": r[3],
+                           "path": r[5], "ip": r[6]}, ensure_ascii=False)
+        parts.append(head[:-1] + ', "payload": ' + (r[4] or "{}") + "}")
+    body = '{"rows": [%s], "next_cursor": %s, "prev_cursor": %s}' % (
+        ", ".join(parts), json.dumps(next_cursor), json.dumps(prev_cursor))
+    return Response(content=body.encode("utf-8"), media_type="application/json")
+
+
+_KPI_EXPORT_COLS = ["ts_utc", "session_id", "event", "payload_json", "path", "ua", "ip"]
+
+
+def _kpi_export_chunks(fmt: str, where: str, args: list, months: list[str]):
+    """Parcourt les partitions (plus récente d'abord) et produit le fichier par morceaux."""
     out = io.StringIO()
     w = csv.writer(out, delimiter=";")
-    w.writerow(["ts_utc", "session_id", "event", "payload_json", "path", "ua", "ip"])
-    w.writerows(cur.fetchall())
-    con.close()
-    return Response(
-        content=out.getvalue().encode("utf-8"),
-        media_type="text/csv; charset=utf-8",
-        headers={"Content-Disposition": 'attachment; filename="kpi_export.csv"'}
+    if fmt == "csv":
+        w.writerow(_KPI_EXPORT_COLS)
+    for month in reversed(months):
+        # Générateur consommé via le threadpool : next() peut changer de thread
+        con = _kpi_part_db(month, check_same_thread=False)
+        if con is None:
+            continue
+        try:
+            cur = con.execute(f"SELECT {_KPI_COLS} FROM kpi_events{where} ORDER BY id DESC", args)
+            while True:
+                rows = cur.fetchmany(KPI_EXPORT_CHUNK)
+                if not rows:
+                    break
+                if fmt == "csv":
+                    w.writerows(rows)
+                else:
+                    out.write("".join(_kpi_ndjson_line(r) for r in rows))
+                yield out.getvalue().encode("utf-8")
+                out.seek(0)
+                out.truncate()
+        finally:
+            con.close()
+    if out.tell():
+        yield out.getvalue().encode("utf-8")
+
+
+@app.get("/api/kpi/export")
+@app.get("/api/kpi/export.csv")
+def kpi_export(
+    format: str = "csv",
+    gzip: bool = False,
+    start: str | None = None,
+    end: str | None = None,
+    event: str | None = None,
+    session_id: str | None = None,
+    event_prefix: str | None = None,
+    path: str | None = None,
+    authorization: str | None = Header(default=None),
+):
+    """Export KPI en streaming (CSV ou NDJSON, gzip optionnel), filtré côté serveur."""
+    require_auth(authorization)
+    if format not in ("csv", "ndjson"):
+        raise HTTPException(400, "format: csv | ndjson")
+    KPI_WRITER.flush()
+    where, args = _kpi_where(start, end, event, session_id, event_prefix, path)
+    chunks = _kpi_export_chunks(format, where, args, _kpi_months(start, end))
+    filename = "kpi_export." + format
+    media_type = "text/csv; charset=utf-8" if format == "csv" else "application/x-ndjson"
+    if gzip:
+        chunks = _gzip_chunks(chunks)
+        filename += ".gz"
+        media_type = "application/gzip"
+    return StreamingResponse(
+        METRICS.timed_iter(chunks, "kpi_export"),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
     )
 
 class ResetMonthIn(BaseModel):
@@ -296,39 +4400,171 @@ def kpi_reset_month(data: ResetMonthIn, authorization: str | None = Header(defau
         assert 2020 <= year <= 2100 and 1 <= month <= 12
     except:
         raise HTTPException(400, "Format: YYYY-MM")
-    start = f"{year}-{month:02d}-01"
-    end = f"{year}-{month+1:02d}-01" if month < 12 else f"{year+1}-01-01"
+    month_str = f"{year}-{month:02d}"
+    start, end = month_str + "-01", _next_month(month_str) + "-01"
+    KPI_WRITER.flush()  # les events encore en file doivent être supprimés aussi
     con = _db()
     cur = con.cursor()
-    cur.execute("SELECT COUNT(*) FROM kpi_events WHERE ts_utc >= ? AND ts_utc < ?", (start, end))
+    # Le compte vient des rollups (les mois archivés n'ont plus de partition)
+    cur.execute("SELECT COALESCE(SUM(count), 0) FROM kpi_daily WHERE day >= ? AND day < ?", (start, end))
     count = cur.fetchone()[0]
-    cur.execute("DELETE FROM kpi_events WHERE ts_utc >= ? AND ts_utc < ?", (start, end))
+    KPI_WRITER.release(month_str)
+    _kpi_drop_partition(month_str)  # coordonné avec les écrivains des autres workers
+    try:
+        os.remove(_kpi_archive_path(month_str))
+    except FileNotFoundError:
+        pass
+    for t in _KPI_ROLLUP_TABLES:
+        cur.execute(f"DELETE FROM {t} WHERE day >= ? AND day < ?", (start, end))
     con.commit()
+    # Events écrits depuis par d'autres workers (partition recréée) : rollups recalculés
+    _kpi_rebuild_rollups(con, [month_str])
     con.close()
     return {"success": True, "deleted": count}
 
 
+@app.get("/api/kpi/partitions")
+def kpi_partitions(authorization: str | None = Header(default=None)):
+    """Partitions mensuelles actives et archives, avec leur taille."""
+    require_auth(authorization)
+    parts = [{"month": m, "bytes": os.path.getsize(_kpi_part_path(m))} for m in _kpi_months()]
+    archives = []
+    if os.path.isdir(KPI_ARCHIVE_DIR):
+        for n in sorted(os.listdir(KPI_ARCHIVE_DIR)):
+            if n.startswith("kpi_") and n.endswith(".ndjson.gz"):
+                archives.append({"month": n[4:11], "bytes": os.path.getsize(os.path.join(KPI_ARCHIVE_DIR, n))})
+    return {"partitions": parts, "archives": archives, "retention_months": KPI_RETENTION_MONTHS}
+
+@app.post("/api/kpi/compact")
+def kpi_compact(authorization: str | None = Header(default=None)):
+    """Lance immédiatement l'archivage des mois hors rétention."""
+    require_auth(authorization)
+    return {"ok": True, "archived": _kpi_compact()}
+
+
 # --- Export ZIP ---
 
 class ExportZipIn(BaseModel):
-    pdf_base64: str
-    product_ids: list[str] = []
+    pdf_base64: str = ""
+    pdf_name: str = "rapport.pdf"
+    product_ids: list[str] = Field(default_factory=list, max_length=500)
     zip_name: str = "export.zip"
+    lang: str = "fr"
 
 @app.post("/export/localzip")
-async def export_zip(data: ExportZipIn):
+def export_zip(data: ExportZipIn):
+    """Pack ZIP : rapport PDF + fiches techniques des produits, envoyé au fil de l'eau."""
     try:
-        pdf = base64.b64decode(data.pdf_base64)
-    except:
+        pdf = base64.b64decode(data.pdf_base64, validate=True) if data.pdf_base64 else None
+    except ValueError:
         raise HTTPException(400, "Invalid PDF")
-    buf = io.BytesIO()
-    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as zf:
-        zf.writestr("rapport.pdf", pdf)
-    buf.seek(0)
-    return Response(
-        content=buf.getvalue(),
+    entries = _datasheet_pack_entries(pdf, _safe_archive_name(data.pdf_name, ".pdf"), data.product_ids, data.lang)
+    return StreamingResponse(
+        METRICS.timed_iter(_zip_stream(entries), "export_zip"),
+        media_type="application/zip",
+        headers={"Content-Disposition": _content_disposition("attachment", _safe_archive_name(data.zip_name, ".zip"))}
+    )
+
+
+async def _capped_stream(request: Request, limit: int):
+    """Flux du corps de requête, 413 dès que `limit` octets sont dépassés (Content-Length absent ou faux)."""
+    size = 0
+    async for chunk in request.stream():
+        size += len(chunk)
+        if size > limit:
+            raise HTTPException(413, f"PDF > {EXPORT_MAX_UPLOAD_BYTES // (1024 * 1024)} Mo")
+        yield chunk
+
+
+async def _spool_body(request: Request):
+    """Corps brut -> fichier temporaire (mémoire bornée), 413 dès que le plafond est dépassé."""
+    spool = tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_BYTES)
+    size = 0
+    try:
+        async for chunk in _capped_stream(request, EXPORT_MAX_UPLOAD_BYTES):
+            size += len(chunk)
+            await run_in_threadpool(spool.write, chunk)
+    except BaseException:
+        spool.close()
+        raise
+    return spool, size
+
+
+async def _capped_form(request: Request):
+    """
+    Formulaire multipart lu via _capped_stream : le plafond s'applique pendant la
+    lecture, pas seulement sur l'en-tête Content-Length (uploads chunked).
+    """
+    parser = MultiPartParser(
+        request.headers, _capped_stream(request, EXPORT_MAX_UPLOAD_BYTES + 64 * 1024),
+        max_files=1, max_fields=1000,
+    )
+    try:
+        return await parser.parse()
+    except MultiPartException as e:
+        raise HTTPException(400, e.message)
+
+
+def _upload_is_pdf(f) -> bool:
+    f.seek(0)
+    return f.read(5) == b"%PDF-"
+
+
+def _split_ids(values: list[str]) -> list[str]:
+    """product_ids répétés et/ou séparés par des virgules."""
+    return [x for v in values for x in str(v).split(",") if x.strip()]
+
+
+@app.post("/export/localzip/upload")
+async def export_zip_upload(
+    request: Request,
+    product_ids: list[str] = Query(default_factory=list),
+    pdf_name: str = "rapport.pdf",
+    zip_name: str = "export.zip",
+    lang: str = "fr",
+):
+    """
+    Pack ZIP à partir d'un rapport PDF envoyé en binaire : corps brut (application/pdf,
+    options en query string) ou multipart (champ fichier "pdf" + mêmes champs de formulaire).
+    Le rapport est gardé en fichier temporaire ; le ZIP est produit hors boucle d'événements.
+    """
+    length = request.headers.get("content-length", "")
+    if length.isdigit() and int(length) > EXPORT_MAX_UPLOAD_BYTES + 64 * 1024:
+        raise HTTPException(413, f"PDF > {EXPORT_MAX_UPLOAD_BYTES // (1024 * 1024)} Mo")
+    cleanup = None
+    if request.headers.get("content-type", "").startswith("multipart/form-data"):
+        form = await _capped_form(request)
+        cleanup = form.close
+        upload = form.get("pdf")
+        pdf = upload.file if isinstance(upload, UploadFile) and upload.size else None
+        size = upload.size if pdf else 0
+        product_ids = _split_ids(form.getlist("product_ids")) or _split_ids(product_ids)
+        pdf_name = str(form.get("pdf_name") or pdf_name)
+        zip_name = str(form.get("zip_name") or zip_name)
+        lang = str(form.get("lang") or lang)
+    else:
+        pdf, size = await _spool_body(request)
+        cleanup = pdf.close
+        product_ids = _split_ids(product_ids)
+    try:
+        if size > EXPORT_MAX_UPLOAD_BYTES:
+            raise HTTPException(413, f"PDF > {EXPORT_MAX_UPLOAD_BYTES // (1024 * 1024)} Mo")
+        if len(product_ids) > 500:
+            raise HTTPException(422, "500 produits max")
+        if size:
+            if not await run_in_threadpool(_upload_is_pdf, pdf):
+                raise HTTPException(400, "Invalid PDF")
+        else:
+            pdf = None
+    except BaseException:
+        await BackgroundTask(cleanup)()
+        raise
+    entries = _datasheet_pack_entries(pdf, _safe_archive_name(pdf_name, ".pdf"), product_ids, lang)
+    return StreamingResponse(
+        METRICS.timed_iter(_zip_stream(entries), "export_zip"),
         media_type="application/zip",
-        headers={"Content-Disposition": f'attachment; filename="{data.zip_name}"'}
+        headers={"Content-Disposition": _content_disposition("attachment", _safe_archive_name(zip_name, ".zip"))},
+        background=BackgroundTask(cleanup),
     )
 
 @app.get("/export/test")
@@ -337,60 +4573,165 @@ def export_test():
 
 
 # ============================================================
-# STATIC FILES
+# STATIC FILES (index en mémoire, variantes br/gzip, politique de cache)
 # ============================================================
 
+STATIC_PRECOMPRESS_MAX = 8 * 1024 * 1024  # au-delà : servi tel quel (sauf .br/.gz voisins)
+_COMPRESSIBLE_EXTS = (".js", ".mjs", ".css", ".html", ".svg", ".json", ".webmanifest", ".map", ".txt", ".csv", ".xml", ".ico")
+# Assets Vite : nom-<hash>.ext -> contenu immuable pour une URL donnée
+_HASHED_ASSET = re.compile(r"[-.][A-Za-z0-9_-]{8,}\.[A-Za-z0-9]+$")
+_NO_CACHE_FILES = {"sw.js", "manifest.json", "manifest.webmanifest"}
+
+
+def _static_cache_control(rel: str) -> str:
+    if rel.startswith("assets/") and _HASHED_ASSET.search(rel):
+        return "public, max-age=31536000, immutable"
+    if rel.endswith(".html") or rel in _NO_CACHE_FILES:
+        return "no-cache"
+    return "public, max-age=300"
+
+
+def _accepted_encodings(header: str | None) -> set[str]:
+    """Encodages acceptés (q=0 exclu) d'un en-tête Accept-Encoding."""
+    out = set()
+    for part in (header or "").split(","):
+        name, _, params = part.strip().partition(";")
+        if "q=0" in params.replace(" ", "") and not re.search(r"q=0\.\d*[1-9]", params):
+            continue
+        if name:
+            out.add(name.strip().lower())
+    return out
+
+
+class StaticIndex:
+    """
+    Fichiers du frontend indexés au démarrage (aucun accès disque pour router) :
+    ETag de contenu, variantes brotli/gzip (fichiers .br/.gz voisins issus du build,
+    sinon générées en mémoire), politique Cache-Control par chemin.
+    """
+
+    def __init__(self, root: str, extra: dict[str, str] | None = None):
+        self.root = root
+        self.extra = extra or {}
+        self.files: dict[str, dict] = {}
+        self.loaded = False
+        self._lock = threading.Lock()
+
+    def load(self):
+        """Indexe et précompresse (warm-up du lifespan, ou 1re requête à défaut)."""
+        with self._lock:
+            if self.loaded:
+                return
+            files = {}
+            if os.path.isdir(self.root):
+                for dirpath, _, names in os.walk(self.root):
+                    for name in names:
+                        if name.endswith((".br", ".gz")):
+                            continue
+                        path = os.path.join(dirpath, name)
+                        rel = os.path.relpath(path, self.root).replace(os.sep, "/")
+                        files[rel] = self._entry(path, rel)
+            for rel, path in self.extra.items():
+                if rel not in files and os.path.isfile(path):
+                    files[rel] = self._entry(path, rel)
+            self.files = files
+            self.loaded = True
+
+    @staticmethod
+    def _entry(path: str, rel: str) -> dict:
+        st = os.stat(path)
+        media_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        data = None
+        if path.lower().endswith(_COMPRESSIBLE_EXTS) and st.st_size <= STATIC_PRECOMPRESS_MAX:
+            with open(path, "rb") as f:
+                data = f.read()
+        etag = ('"' + hashlib.sha256(data).hexdigest()[:32] + '"') if data is not None else f'"{st.st_mtime_ns:x}-{st.st_size:x}"'
+        variants: dict[str, bytes | str] = {}
+        for enc, ext in (("br", ".br"), ("gzip", ".gz")):
+            sibling = path + ext
+            if os.path.isfile(sibling) and os.stat(sibling).st_mtime_ns >= st.st_mtime_ns:
+                variants[enc] = sibling  # précompressé au build
+        if data is not None and len(data) >= 500:
+            if "br" not in variants and brotli is not None:
+                variants["br"] = brotli.compress(data, quality=11)
+            if "gzip" not in variants:
+                variants["gzip"] = b"".join(_gzip_chunks([data], level=9))
+        return {"path": path, "media_type": media_type, "etag": etag,
+                "cache_control": _static_cache_control(rel), "variants": variants}
+
+    def response(self, rel: str, request: Request) -> Response | None:
+        if not self.loaded:
+            self.load()
+        entry = self.files.get(rel)
+        if entry is None:
+            return None
+        headers = {"ETag": entry["etag"], "Cache-Control": entry["cache_control"]}
+        if entry["variants"]:
+            headers["Vary"] = "Accept-Encoding"
+        if _etag_match(request.headers.get("if-none-match"), entry["etag"]):
+            return Response(status_code=304, headers=headers)
+        accepted = _accepted_encodings(request.headers.get("accept-encoding"))
+        for enc in ("br", "gzip"):
+            body = entry["variants"].get(enc)
+            if body is None or enc not in accepted:
+                continue
+            headers["Content-Encoding"] = enc  # GZipMiddleware laisse passer
+            if isinstance(body, bytes):
+                return Response(content=body, media_type=entry["media_type"], headers=headers)
+            return FileResponse(body, media_type=entry["media_type"], headers=headers)
+        return FileResponse(entry["path"], media_type=entry["media_type"], headers=headers)
+
+
+class DataStaticFiles(StaticFiles):
+    """/data : revalidation systématique des fichiers de données, cache court des médias."""
+
+    def file_response(self, full_path, stat_result, scope, status_code: int = 200) -> Response:
+        response = super().file_response(full_path, stat_result, scope, status_code)
+        media = str(full_path).lower().endswith((".png", ".jpg", ".jpeg", ".webp", ".pdf"))
+        response.headers["Cache-Control"] = "public, max-age=86400" if media else "no-cache"
+        return response
+
+
 # Data CSV avec cache
 if os.path.isdir(DATA_DIR):
-    app.mount("/data", StaticFiles(directory=DATA_DIR), name="data")
-    print(f"✅ /data -> {DATA_DIR}")
+    app.mount("/data", DataStaticFiles(directory=DATA_DIR), name="data")
 
-# Frontend
+# Frontend (index construit au warm-up, cf. lifespan)
+STATIC: StaticIndex | None = None
 if os.path.isdir(FRONTEND_DIST):
-    assets = os.path.join(FRONTEND_DIST, "assets")
-    if os.path.isdir(assets):
-        app.mount("/assets", StaticFiles(directory=assets), name="assets")
-        print(f"✅ /assets -> {assets}")
+    STATIC = StaticIndex(FRONTEND_DIST, extra={"admin.html": os.path.join(BASE_DIR, "frontend", "public", "admin.html")})
+
+    @app.get("/assets/{path:path}")
+    async def assets(path: str, request: Request):
+        resp = STATIC.response("assets/" + path, request)
+        if resp is None:
+            raise HTTPException(404)
+        return resp
 
     @app.get("/admin")
-    async def admin():
-        for p in [os.path.join(FRONTEND_DIST, "admin.html"), os.path.join(BASE_DIR, "frontend", "public", "admin.html")]:
-            if os.path.isfile(p):
-                return FileResponse(p)
-        raise HTTPException(404, "admin.html not found")
+    async def admin(request: Request):
+        resp = STATIC.response("admin.html", request)
+        if resp is None:
+            raise HTTPException(404, "admin.html not found")
+        return resp
 
     @app.get("/")
-    async def root():
-        index = os.path.join(FRONTEND_DIST, "index.html")
-        if os.path.isfile(index):
-            return FileResponse(index)
-        raise HTTPException(404, "index.html not found")
+    async def root(request: Request):
+        resp = STATIC.response("index.html", request)
+        if resp is None:
+            raise HTTPException(404, "index.html not found")
+        return resp
 
     @app.get("/{path:path}")
-    async def spa(path: str):
+    async def spa(path: str, request: Request):
         if path.startswith(("api/", "data/", "export/", "health", "assets/")):
             raise HTTPException(404)
-        file = os.path.join(FRONTEND_DIST, path)
-        if os.path.isfile(file):
-            return FileResponse(file)
-        index = os.path.join(FRONTEND_DIST, "index.html")
-        return FileResponse(index) if os.path.isfile(index) else HTTPException(404)
+        resp = STATIC.response(path, request) or STATIC.response("index.html", request)
+        if resp is None:
+            raise HTTPException(404)
+        return resp
 
-    print(f"✅ Frontend -> {FRONTEND_DIST}")
 else:
     @app.get("/")
     def no_frontend():
         return {"error": "Frontend not found", "expected": FRONTEND_DIST}
-
-# ============================================================
-# STARTUP
-# ============================================================
-
-print(f"""
-╔══════════════════════════════════════════════════════════╗
-║  🚀 Configurateur Comelit - Ready                        ║
-╠══════════════════════════════════════════════════════════╣
-║  Frontend: {str(os.path.isdir(FRONTEND_DIST)):5} | Data: {str(os.path.isdir(DATA_DIR)):5}              ║
-║  Gzip: ON | Cache: ON                                    ║
-╚══════════════════════════════════════════════════════════╝
-""")
\ No newline at end of file
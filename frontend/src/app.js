@@ -32,9 +32,19 @@
    KPI (tracking) — envoi côté backend
    - Stockage local: session_id
    - Envoi best-effort (pas bloquant)
+   - Events mis en file puis envoyés par lots sur /api/kpi/batch
+     (timer, file pleine, onglet masqué / fermeture via sendBeacon)
    ============================================================ */
 const KPI = (() => {
   const SESSION_KEY = "cfg_session_id";
+  const BATCH_URL = "/api/kpi/batch";
+  const FLUSH_DELAY_MS = 5000; // regroupe les events d'une même interaction
+  const MAX_QUEUE = 25;        // flush immédiat au-delà (body keepalive/beacon < 64 Ko)
+  const MAX_PENDING = 200;     // events gardés pendant une pause 429 (les plus anciens sont abandonnés)
+
+  let queue = [];
+  let timer = null;
+  let pausedUntil = 0;         // Retry-After renvoyé par le backend (limite de débit)
 
   function getSessionId() {
     let sid = localStorage.getItem(SESSION_KEY);
@@ -47,35 +57,71 @@ const KPI = (() => {
     return sid;
   }
 
-  async function send(event, payload = {}) {
+  function _post(events, useBeacon) {
+    const body = JSON.stringify({ session_id: getSessionId(), events });
+    if (useBeacon && navigator.sendBeacon) {
+      try {
+        if (navigator.sendBeacon(BATCH_URL, new Blob([body], { type: "application/json" }))) return;
+      } catch {}
+    }
+    fetch(BATCH_URL, {
+      method: "POST",
+      headers: {
+        "Content-Type": "application/json",
+        "x-page-path": location.pathname + location.search + location.hash,
+      },
+      body,
+      keepalive: true,
+    }).then((r) => {
+      if (r.status === 429) pausedUntil = Date.now() + (Number(r.headers.get("Retry-After")) || 5) * 1000;
+    }).catch(() => {});
+  }
+
+  // Vide la file (par paquets de MAX_QUEUE)
+  function flush(opts = {}) {
+    try {
+      if (timer) { clearTimeout(timer); timer = null; }
+      const wait = pausedUntil - Date.now();
+      if (wait > 0 && !opts.beacon) {
+        timer = setTimeout(flush, wait);
+        return;
+      }
+      while (queue.length) _post(queue.splice(0, MAX_QUEUE), !!opts.beacon);
+    } catch (e) {
+      // jamais casser l'app pour un KPI
+    }
+  }
+
+  function enqueue(event, payload = {}) {
     try {
-      const body = {
-        session_id: getSessionId(),
+      queue.push({
         event: String(event || "").slice(0, 80),
         payload: payload && typeof payload === "object" ? payload : { value: payload },
-      };
-
-      await fetch("/api/kpi/collect", {
-        method: "POST",
-        headers: {
-          "Content-Type": "application/json",
-          "x-page-path": location.pathname + location.search + location.hash,
-        },
-        body: JSON.stringify(body),
-        keepalive: true,
       });
+      if (queue.length > MAX_PENDING) queue.splice(0, queue.length - MAX_PENDING);
+      if (queue.length >= MAX_QUEUE) flush();
+      else if (!timer) timer = setTimeout(flush, FLUSH_DELAY_MS);
     } catch (e) {
       // jamais casser l'app pour un KPI
     }
   }
 
+  // signature conservée : ne fait plus d'aller-retour réseau par event
+  async function send(event, payload = {}) {
+    enqueue(event, payload);
+  }
+
   // ✅ compat : si ton code appelle KPI.sendNowait(...)
   function sendNowait(event, payload = {}) {
-    // "fire & forget" : on ne await pas
-    try { send(event, payload); } catch {}
+    enqueue(event, payload);
   }
 
-  return { send, sendNowait, getSessionId };
+  document.addEventListener("visibilitychange", () => {
+    if (document.visibilityState === "hidden") flush({ beacon: true });
+  });
+  window.addEventListener("pagehide", () => flush({ beacon: true }));
+
+  return { send, sendNowait, flush, getSessionId };
 })();
 
 // ✅ IMPORTANT : rend KPI accessible partout (handlers inclus)
@@ -273,17 +319,10 @@ function getSessionId() {
   return v;
 }
 
-async function track(event, payload = {}) {
+// ancien endpoint /api/track (inexistant) : passe par la file KPI groupée
+function track(event, payload = {}) {
   try {
-    await fetch("/api/track", {
-      method: "POST",
-      headers: { "Content-Type": "application/json" },
-      body: JSON.stringify({
-        session_id: getSessionId(),
-        event,
-        payload
-      })
-    });
+    window.KPI?.sendNowait?.(event, payload);
   } catch (e) {
     // silent
   }
@@ -1186,8 +1225,21 @@ const CONFIG = Object.freeze({
 const CLR = CONFIG.colors;
 const LIM = CONFIG.limits;
 
+  // Bundle typé de tous les catalogues (1 requête, pas de parsing CSV) ; null si indisponible
+  async function loadCatalogBundle() {
+    try {
+      const res = await fetch("/api/catalog/bundle", { cache: "no-cache" });
+      if (!res.ok) return null;
+      const b = await res.json();
+      return b && b.catalogs ? b : null;
+    } catch {
+      return null;
+    }
+  }
+
   async function loadCsv(url) {
-    const res = await fetch(url, { cache: "no-store" });
+    // "no-cache" : revalidation If-None-Match (304 si le catalogue n'a pas changé)
+    const res = await fetch(url, { cache: "no-cache" });
     if (!res.ok) throw new Error(`Impossible de charger ${url} (${res.status})`);
     return parseCsv(await res.text());
   }
@@ -1265,47 +1317,14 @@ const KPI = (() => {
     return sid;
   }
 
-  function _buildBody(event, payload) {
-    return {
-      session_id: getSessionId(),
-      event: String(event || "").slice(0, 80),
-      payload: payload && typeof payload === "object" ? payload : { value: payload },
-    };
-  }
-
-  // ✅ Ton send "attendu" (garde la signature) — mais on ne veut pas bloquer l'app
+  // ✅ Délègue à la file KPI globale (envoi groupé sur /api/kpi/batch)
   async function send(event, payload = {}) {
-    try {
-      const body = _buildBody(event, payload);
-
-      await fetch("/api/kpi/collect", {
-        method: "POST",
-        headers: {
-          "Content-Type": "application/json",
-          "x-page-path": location.pathname + location.search + location.hash,
-        },
-        body: JSON.stringify(body),
-        keepalive: true,
-      });
-    } catch (e) {
-      // ne casse jamais l'app
-    }
+    try { window.KPI?.sendNowait?.(event, payload); } catch (e) {}
   }
 
   // ✅ Fire-and-forget : recommandé pour tous les events UI (aucune latence)
   function sendNowait(event, payload = {}) {
-    try {
-      const body = _buildBody(event, payload);
-      fetch("/api/kpi/collect", {
-        method: "POST",
-        headers: {
-          "Content-Type": "application/json",
-          "x-page-path": location.pathname + location.search + location.hash,
-        },
-        body: JSON.stringify(body),
-        keepalive: true,
-      }).catch(() => {});
-    } catch (e) {}
+    try { window.KPI?.sendNowait?.(event, payload); } catch (e) {}
   }
 
   // ------------------------------------------------------------
@@ -1544,7 +1563,8 @@ function localizedName(raw, field) {
   field = field || "name";
   const lang = (typeof _currentLang !== "undefined") ? _currentLang : "fr";
   if (lang !== "fr") {
-    const localized = raw[field + "_" + lang];
+    // bundle /api/catalog/bundle : traductions regroupées sous raw.i18n[field][lang]
+    const localized = raw.i18n?.[field]?.[lang] ?? raw[field + "_" + lang];
     if (localized && localized !== "false" && localized.trim()) return localized.trim();
   }
   return (raw[field] ?? "").toString().trim();
@@ -1570,6 +1590,7 @@ function safeNum(v) {
 
 /** "A|B|C|" => ["A","B","C"] */
 function parsePipeList(v) {
+  if (Array.isArray(v)) return v.map(s => safeStr(s)).filter(Boolean); // déjà découpé (bundle)
   return safeStr(v)
     .split("|")
     .map(s => s.trim())
@@ -3358,6 +3379,19 @@ function setFinalContent(proj) {
 const LOCAL_IMG_ROOT = "/data/Images";
 const IMG_EXTS = ["png", "jpg", "jpeg", "webp"];
 const __thumbCache = new Map();
+const THUMB_WIDTH = 256; // cartes + PDF (affichage <= 128px, x2 pour les écrans denses)
+let IMAGE_VERSIONS = null; // {"famille/ID": hash} depuis /api/img/manifest ; null = PNG originaux
+
+async function loadImageManifest() {
+  try {
+    const res = await fetch("/api/img/manifest", { cache: "no-cache" });
+    if (!res.ok) return;
+    IMAGE_VERSIONS = (await res.json())?.images || null;
+    __thumbCache.clear();
+  } catch {
+    /* serveur statique seul : images originales */
+  }
+}
 
 function getThumbSrc(family, id) {
   try {
@@ -3369,7 +3403,11 @@ function getThumbSrc(family, id) {
     if (__thumbCache.has(key)) return __thumbCache.get(key);
 
     // 👉 Convention projet : 1 image = <ID>.png dans /data/Images/<family>/
-    const url = `${LOCAL_IMG_ROOT}/${fam}/${encodeURIComponent(ref)}.png`;
+    // Avec le backend : miniature WebP/AVIF, URL versionnée par hash (cache immuable)
+    const hash = IMAGE_VERSIONS?.[`${fam}/${ref}`] ?? IMAGE_VERSIONS?.[`${fam}/${ref.toUpperCase()}`];
+    const url = hash
+      ? `/api/img/${fam}/${encodeURIComponent(ref)}?w=${THUMB_WIDTH}&v=${hash}`
+      : `${LOCAL_IMG_ROOT}/${fam}/${encodeURIComponent(ref)}.png`;
 
     __thumbCache.set(key, url);
     return url;
@@ -6706,8 +6744,8 @@ function loadConfigFromLocalStorage() {
   catch { return null; }
 }
 
-function shareConfigUrl() {
-  const url = generateShareUrl();
+async function shareConfigUrl() {
+  const url = (await createServerShareUrl()) || generateShareUrl();
   if (!url) {
     const snap = snapshotForSave();
     if (snap) navigator.clipboard.writeText(JSON.stringify(snap))
@@ -6754,8 +6792,8 @@ function requestQuote() {
   showToast("📨 Email pré-rempli ouvert vers devis@comelit.fr", "ok");
 }
 
-function sendToDistributor() {
-  const url = generateShareUrl();
+async function sendToDistributor() {
+  const url = (await createServerShareUrl()) || generateShareUrl();
   if (navigator.share) {
     navigator.share({ title: "Configuration Comelit — " + (MODEL.projectName || ""), url: url || window.location.href })
       .then(() => showToast("✅ Partagé !", "ok")).catch(() => {});
@@ -6789,6 +6827,29 @@ function showToast(message, type) {
 (function autoRestoreFromUrl() {
   try {
     const params = new URLSearchParams(window.location.search);
+    const shareId = params.get("s");
+    if (shareId) {
+      fetch(`/api/share/${encodeURIComponent(shareId)}`)
+        .then(r => { if (!r.ok) throw new Error(`HTTP ${r.status}`); return r.json(); })
+        .then(snap => {
+          const waitAndRestore = () => {
+            if (typeof MODEL !== "undefined" && typeof render === "function") {
+              restoreFromSnapshot(snap);
+              if (snap.overrideNvrId) MODEL.overrideNvrId = snap.overrideNvrId;
+              render();
+              showToast("📥 Configuration restaurée depuis le lien !", "ok");
+              const clean = new URL(window.location.href); clean.searchParams.delete("s");
+              window.history.replaceState({}, "", clean.toString());
+            } else setTimeout(waitAndRestore, 200);
+          };
+          waitAndRestore();
+        })
+        .catch(e => {
+          console.warn("[Share] Restore failed:", e);
+          showToast("⚠️ Lien de partage expiré ou introuvable.", "warn");
+        });
+      return;
+    }
     const cfg = params.get("cfg");
     if (!cfg) return;
     const json = decodeURIComponent(escape(atob(cfg)));
@@ -6909,6 +6970,8 @@ function generateQRDataUrl(text, size = 150) {
 function generateShareUrl() {
   try {
     const snap = typeof snapshotForSave === "function" ? snapshotForSave() : null;
+    const shortUrl = snap ? cachedServerShareUrl(sharePayload(snap)) : null;
+    if (shortUrl) return shortUrl;
     if (!snap && typeof MODEL !== "undefined") {
       // Fallback: construire un snapshot minimal
       const bl = (MODEL.cameraBlocks || []).map(b => ({
@@ -6942,6 +7005,45 @@ function generateShareUrl() {
   }
 }
 
+// ==========================================================
+// SHARE SERVEUR — instantané stocké côté backend, lien court /?s=<id>
+// ==========================================================
+// Le backend déduplique par contenu : même projet => même id. On mémorise le
+// dernier lien obtenu pour que generateShareUrl() (synchrone, QR du PDF) le réutilise.
+let _serverShare = { key: "", url: "" };
+
+function sharePayload(snap) {
+  const { savedAt, ...rest } = snap || {};
+  return { ...rest, overrideNvrId: MODEL?.overrideNvrId || null };
+}
+
+function cachedServerShareUrl(payload) {
+  return _serverShare.url && _serverShare.key === JSON.stringify(payload) ? _serverShare.url : null;
+}
+
+async function createServerShareUrl() {
+  const snap = snapshotForSave();
+  if (!snap) return null;
+  const payload = sharePayload(snap);
+  const cached = cachedServerShareUrl(payload);
+  if (cached) return cached;
+  try {
+    const resp = await fetch("/api/share", {
+      method: "POST",
+      headers: { "Content-Type": "application/json" },
+      body: JSON.stringify(payload),
+    });
+    if (!resp.ok) throw new Error(`HTTP ${resp.status}`);
+    const data = await resp.json();
+    const url = new URL(data.path, window.location.origin).toString();
+    _serverShare = { key: JSON.stringify(payload), url };
+    return url;
+  } catch (e) {
+    console.warn("[Share] Lien serveur indisponible, lien local:", e);
+    return null;
+  }
+}
+
 // ==========================================================
 // APERÇU PDF — Preview HTML dans une modale
 // ==========================================================
@@ -7139,6 +7241,9 @@ async function buildPdfBlobProFromProject(proj) {
     throw new Error(T("err_project_unavailable"));
   }
 
+  // Lien court pour le QR code (repli sur le lien ?cfg= si le backend est injoignable)
+  await createServerShareUrl();
+
   // 1) Créer le container offscreen
   const host = document.createElement("div");
   host.id = "pdfHost";
@@ -7179,9 +7284,12 @@ async function buildPdfBlobProFromProject(proj) {
   const inlineLocalImage = async (url) => {
     const u = String(url || "").trim();
     if (!u || /^data:/i.test(u)) return u;
-    if (/^https?:\/\//i.test(u) && !u.includes(window.location.host)) return null;
+    // Images distantes : via le cache médias du backend (hôtes autorisés uniquement)
+    const src = (/^https?:\/\//i.test(u) && !u.includes(window.location.host))
+      ? `/api/media?url=${encodeURIComponent(u)}`
+      : u;
     try {
-      const res = await fetch(u, { mode: "cors", cache: "force-cache" });
+      const res = await fetch(src);
       if (!res.ok) return null;
       const blob = await res.blob();
       return await blobToDataURL(blob);
@@ -7347,9 +7455,54 @@ async function buildPdfBlobProFromProject(proj) {
   }
 }
 
-// Alias
+// PDF rendu côté serveur (/api/report/pdf) : même projet, rendu fpdf2 mis en cache
+// par contenu. Utilisé d'office sur les petits appareils, sinon en secours du rendu client.
+function reportExtrasForServer(proj) {
+  const extras = [];
+  const push = (item, qty) => { if (item?.id) extras.push({ id: String(item.id), qty: clampInt(qty ?? 1, 1, 99) }); };
+  try {
+    const screen = getSelectedOrRecommendedScreen(proj).selected;
+    push(screen, MODEL.complements.screen.qty);
+    push(getSelectedOrRecommendedEnclosure(proj).selected, MODEL.complements.enclosure.qty);
+    push(getSelectedOrRecommendedSign().sign, MODEL.complements.signage?.qty);
+  } catch (e) { console.warn("[PDF] Extras serveur:", e); }
+  return extras;
+}
+
+async function buildPdfBlobServer(proj) {
+  const snap = snapshotForSave();
+  if (!snap) throw new Error(T("err_project_unavailable"));
+  const resp = await fetch("/api/report/pdf", {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify({
+      ...snap,
+      lang: (typeof _currentLang !== "undefined") ? _currentLang : "fr",
+      overrideNvrId: MODEL?.overrideNvrId || null,
+      extras: reportExtrasForServer(proj),
+    }),
+  });
+  if (!resp.ok) throw new Error(`HTTP ${resp.status}`);
+  return await resp.blob();
+}
+
+function preferServerPdf() {
+  const cores = navigator.hardwareConcurrency || 8;
+  const mem = navigator.deviceMemory || 8;
+  return cores <= 4 || mem <= 4 || typeof window.html2canvas !== "function";
+}
+
 async function buildPdfBlobFromProject(proj) {
-  return await buildPdfBlobProFromProject(proj);
+  if (preferServerPdf()) {
+    try { return await buildPdfBlobServer(proj); }
+    catch (e) { console.warn("[PDF] Rendu serveur indisponible, rendu local:", e); }
+  }
+  try {
+    return await buildPdfBlobProFromProject(proj);
+  } catch (e) {
+    console.warn("[PDF] Rendu local échoué, rendu serveur:", e);
+    return await buildPdfBlobServer(proj);
+  }
 }
 
 function renderCameraPickCard(cam, blk, sc, mainReason) {
@@ -7962,14 +8115,8 @@ async function exportProjectPdfPro(proj) {
     }
   } catch {}
 
-  // Vérifier les libs
-  if (typeof window.html2canvas !== "function") {
-    alert("Export PDF impossible : html2canvas non chargé.");
-    return;
-  }
-
   try {
-    const blob = await buildPdfBlobProFromProject(proj);
+    const blob = await buildPdfBlobFromProject(proj);
     
     if (!blob || blob.size < 1000) {
       throw new Error("PDF blob invalide");
@@ -8301,7 +8448,7 @@ async function exportProjectPdfWithLocalDatasheetsZip() {
   // Générer le PDF
   let pdfBlob;
   try {
-    pdfBlob = await buildPdfBlobProFromProject(proj);
+    pdfBlob = await buildPdfBlobFromProject(proj);
     if (!pdfBlob || pdfBlob.size < 5000) {
       throw new Error("PDF invalide");
     }
@@ -8311,17 +8458,6 @@ async function exportProjectPdfWithLocalDatasheetsZip() {
     return;
   }
 
-  // Convertir PDF en base64
-  const pdf_base64 = await new Promise((resolve, reject) => {
-    const reader = new FileReader();
-    reader.onload = () => {
-      const result = String(reader.result || "");
-      resolve(result.includes(",") ? result.split(",")[1] : result);
-    };
-    reader.onerror = reject;
-    reader.readAsDataURL(pdfBlob);
-  });
-
   // Collecter les URLs de fiches techniques (localisées selon la langue)
   const datasheet_items = collectDatasheetUrlsFromProject(proj);
 
@@ -8333,7 +8469,7 @@ async function exportProjectPdfWithLocalDatasheetsZip() {
 
   const zipName = `${projectSlugZip}_${day}.zip`;
 
-  // ======== BUILD ZIP CLIENT-SIDE via proxy PDF ========
+  // ======== BUILD ZIP CÔTÉ SERVEUR (/export/localzip) ========
   
   // Créer la barre de progression
   let progressOverlay = document.getElementById("zipProgressOverlay");
@@ -8368,85 +8504,38 @@ async function exportProjectPdfWithLocalDatasheetsZip() {
   setProgress(5, "PDF...");
   
   try {
-    // Charger JSZip
-    if (typeof JSZip === "undefined") {
-      setProgress(8, "Loading JSZip...");
-      await new Promise((resolve, reject) => {
-        const s = document.createElement("script");
-        s.src = "https://cdnjs.cloudflare.com/ajax/libs/jszip/3.10.1/jszip.min.js";
-        s.onload = resolve;
-        s.onerror = () => reject(new Error("JSZip load failed"));
-        document.head.appendChild(s);
-      });
-    }
-
-    const zip = new JSZip();
-
-    // 1) PDF principal
-    const pdfBytes = Uint8Array.from(atob(pdf_base64), c => c.charCodeAt(0));
-    zip.file(`${projectSlugZip}_${day}.pdf`, pdfBytes);
-    setProgress(15, `PDF ✅ (${(pdfBytes.length / 1024).toFixed(0)} KB)`);
-    console.log(`[ZIP] ✅ PDF (${(pdfBytes.length / 1024).toFixed(0)} KB)`);
-
-    // 2) Fiches techniques via proxy (avec fallback FR si la langue cible n'existe pas)
-    let fetchedCount = 0;
-    const failedLinks = [];
-    const total = datasheet_items.length;
-
-    const fetchPdf = async (item, idx) => {
-      // URL localisée (ex: /de_DE/)
-      const localizedUrl = item.url;
-      // URL fallback FR (remplacer la locale par fr_FR)
-      const frUrl = localizedUrl
-        .replace(/\/(en_GB|it_IT|es_ES|de_DE)\//g, "/fr_FR/")
-        .replace(/\/(en-gb|it-it|es-es|de-de)\//g, "/fr-fr/");
-      
-      const urlsToTry = [localizedUrl];
-      if (frUrl !== localizedUrl) urlsToTry.push(frUrl);
-
-      for (const url of urlsToTry) {
-        try {
-          const proxyUrl = `/proxy-pdf?url=${encodeURIComponent(url)}`;
-          const resp = await fetch(proxyUrl);
-          if (!resp.ok) continue;
-          const blob = await resp.blob();
-          if (blob.size > 2000) {
-            const header = await blob.slice(0, 5).text();
-            if (header.startsWith("%PDF")) {
-              zip.file(item.path, blob);
-              fetchedCount++;
-              const lang = url === localizedUrl ? "" : " (FR)";
-              console.log(`[ZIP] ✅ ${item.path}${lang} (${(blob.size / 1024).toFixed(0)} KB)`);
-              return;
-            }
-          }
-        } catch (e) { /* try next */ }
-      }
-      console.warn(`[ZIP] ❌ ${item.path}`);
-      failedLinks.push(localizedUrl);
-    };
-
-    // Télécharger par batch de 4 avec progression
-    for (let i = 0; i < total; i += 4) {
-      const batch = datasheet_items.slice(i, i + 4);
-      await Promise.allSettled(batch.map((item, j) => fetchPdf(item, i + j)));
-      const done = Math.min(i + 4, total);
-      const pct = 15 + (done / total) * 70;
-      setProgress(pct, `${T("btn_datasheet")} ${done}/${total}...`);
-    }
+    // Pack construit côté serveur (fiches locales / cache serveur, repli fr_FR), reçu en flux
+    const product_ids = datasheet_items.map((item) => item.path.split("/").pop().replace(/\.pdf$/i, ""));
+    const total = product_ids.length;
+    setProgress(15, `${T("btn_datasheet")} 0/${total}...`);
+
+    // PDF envoyé en binaire (pas de base64), options en query string
+    const params = new URLSearchParams({
+      pdf_name: `${projectSlugZip}_${day}.pdf`,
+      zip_name: zipName,
+      lang: (typeof _currentLang !== "undefined") ? _currentLang : "fr",
+    });
+    product_ids.forEach((id) => params.append("product_ids", id));
+    const resp = await fetch(`/export/localzip/upload?${params}`, {
+      method: "POST",
+      headers: { "Content-Type": "application/pdf" },
+      body: pdfBlob,
+    });
+    if (!resp.ok || !resp.body) throw new Error("HTTP " + resp.status);
 
-    // 3) Fichier liens pour les échouées
-    if (failedLinks.length > 0) {
-      zip.file("datasheets_links.txt",
-        "DATASHEETS\n" + "=".repeat(50) + "\n\n"
-        + failedLinks.map((u, i) => `${i + 1}. ${u}`).join("\n"));
+    // Lecture progressive (progression à la taille reçue)
+    const reader = resp.body.getReader();
+    const parts = [];
+    let received = 0;
+    for (;;) {
+      const { done, value } = await reader.read();
+      if (done) break;
+      parts.push(value);
+      received += value.length;
+      setProgress(Math.min(95, 15 + received / 200000), `${(received / 1024).toFixed(0)} KB...`);
     }
 
-    console.log(`[ZIP] Result: ${fetchedCount}/${total} datasheets`);
-    setProgress(90, "ZIP...");
-
-    // 4) Générer le ZIP
-    const finalZip = await zip.generateAsync({ type: "blob" });
+    const finalZip = new Blob(parts, { type: "application/zip" });
     setProgress(98, `${(finalZip.size / 1024).toFixed(0)} KB`);
 
     const dlUrl = URL.createObjectURL(finalZip);
@@ -8458,8 +8547,8 @@ async function exportProjectPdfWithLocalDatasheetsZip() {
     a.remove();
     setTimeout(() => URL.revokeObjectURL(dlUrl), 2000);
 
-    console.log(`[ZIP] ✅ Export: ${(finalZip.size / 1024).toFixed(0)} KB, ${fetchedCount}/${total} datasheets`);
-    setProgress(100, `✅ ${fetchedCount}/${total} ${T("btn_datasheet")}`);
+    console.log(`[ZIP] ✅ Export: ${(finalZip.size / 1024).toFixed(0)} KB, ${total} datasheets demandées`);
+    setProgress(100, `✅ ${total} ${T("btn_datasheet")}`);
     
     setTimeout(() => { if (progressOverlay) progressOverlay.style.display = "none"; }, 1500);
 
@@ -8981,6 +9070,8 @@ bind(DOM.stepsEl, "input", onStepsInput);
         }
       };
 
+      // ✅ Bundle backend en priorité, CSV en secours (ex: serveur statique seul)
+      const [bundle] = await Promise.all([loadCatalogBundle(), loadImageManifest()]);
       const [
         camsRaw,
         nvrsRaw,
@@ -8990,16 +9081,27 @@ bind(DOM.stepsEl, "input", onStepsInput);
         screensRaw,
         enclosuresRaw,
         signageRaw
-      ] = await Promise.all([
-        loadCsvSafe("cameras", true),
-        loadCsvSafe("nvrs", true),
-        loadCsvSafe("hdds", true),
-        loadCsvSafe("switches", true),
-        loadCsvSafe("accessories", true),
-        loadCsvSafe("screens"),
-        loadCsvSafe("enclosures"),
-        loadCsvSafe("signage"),
-      ]);
+      ] = bundle
+        ? [
+            bundle.catalogs.cameras || [],
+            bundle.catalogs.nvrs || [],
+            bundle.catalogs.hdds || [],
+            bundle.catalogs.switches || [],
+            Object.values(bundle.accessories || {}),
+            bundle.catalogs.screens || [],
+            bundle.catalogs.enclosures || [],
+            bundle.catalogs.signage || [],
+          ]
+        : await Promise.all([
+            loadCsvSafe("cameras", true),
+            loadCsvSafe("nvrs", true),
+            loadCsvSafe("hdds", true),
+            loadCsvSafe("switches", true),
+            loadCsvSafe("accessories", true),
+            loadCsvSafe("screens"),
+            loadCsvSafe("enclosures"),
+            loadCsvSafe("signage"),
+          ]);
 
 
       CATALOG.CAMERAS = camsRaw.map(normalizeCamera).filter((c) => c.id);
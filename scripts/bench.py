@@ -0,0 +1,598 @@
+"""
+Banc de performance reproductible du backend (backend/app.py), 100 % hors ligne.
+
+    python scripts/bench.py run --out bench.json                        # client ASGI in-process
+    python scripts/bench.py run --server uvicorn --workers 2 --out bench.json
+    python scripts/bench.py run --profile quick --baseline base.json    # exit 3 si régression
+    python scripts/bench.py compare base.json bench.json
+
+Chaque exécution travaille dans un bac à sable temporaire : copie de backend/app.py,
+catalogues mis à l'échelle, N events KPI synthétiques, fiches techniques factices et
+frontend servi comme un build. Le dépôt n'est jamais modifié. Générateurs et
+requêtes sont dérivés d'une graine fixe (--seed).
+
+Dépendances : httpx (client ASGI / HTTP), uvicorn pour --server uvicorn.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import base64
+import csv
+import importlib.util
+import json
+import math
+import os
+import platform
+import random
+import shutil
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Callable
+
+import httpx
+
+
+# =========================
+# CONFIG
+# =========================
+BASE_DIR = Path(os.getenv("CONFIGURATEUR_BASE_DIR") or Path(__file__).resolve().parent.parent)
+THRESHOLDS_PATH = Path(__file__).resolve().parent / "bench_thresholds.json"
+
+ADMIN_PASSWORD = "bench"
+SEED = 1234
+KPI_EPOCH = datetime(2026, 1, 1, tzinfo=timezone.utc)  # date fixe : mêmes partitions à chaque run
+KPI_SPAN_DAYS = 120
+READY_TIMEOUT_S = 120
+
+# Profils : taille des données et multiplicateur du nombre de requêtes par scénario
+PROFILES = {
+    "quick": {"cameras": 500, "kpi_events": 50_000, "pdf_mb": 5, "datasheets": 10, "scale": 0.2},
+    "full": {"cameras": 3000, "kpi_events": 1_000_000, "pdf_mb": 40, "datasheets": 20, "scale": 1.0},
+}
+
+# Environnement du backend sous test : déterministe, sans réseau ni tâches de fond parasites
+SERVER_ENV = {
+    "CONFIG_ADMIN_PASSWORD": ADMIN_PASSWORD,
+    "MEDIA_ALLOWED_HOSTS": "",        # aucune URL distante autorisée
+    "KPI_RETENTION_MONTHS": "0",      # pas de compaction pendant la mesure
+    "KPI_RATE_IP_PER_S": "0",         # un seul client (loopback) : on mesure l'ingestion, pas la limite
+    "KPI_RATE_SESSION_PER_S": "0",
+    "REPORT_WORKERS": "0",
+    "SQL_SLOW_MS": "100000",
+}
+
+KPI_EVENTS = [("page_view", 30), ("step_view", 25), ("camera_validated", 12), ("answer_changed", 15),
+              ("export_pdf_click", 5), ("export_zip_click", 3), ("share_click", 2), ("nvr_override", 1),
+              ("kpi_error", 1)]
+KPI_STEPS = ["project", "cameras", "mounts", "nvr_network", "storage", "complements", "summary"]
+KPI_LANGS = ["fr", "fr", "fr", "en", "it", "es", "de"]
+
+
+# =========================
+# BAC À SABLE + GÉNÉRATEURS
+# =========================
+def _read_csv(path: Path) -> tuple[list[str], list[dict]]:
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        reader = csv.DictReader(f)
+        return reader.fieldnames or [], list(reader)
+
+
+def _write_csv(path: Path, columns: list[str], rows: list[dict]) -> None:
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        w = csv.DictWriter(f, fieldnames=columns, extrasaction="ignore")
+        w.writeheader()
+        w.writerows(rows)
+
+
+def scale_catalogs(data: Path, cameras: int, rng: random.Random) -> int:
+    """Clone les caméras (et leur ligne d'accessoires) jusqu'à `cameras` lignes ; renvoie le total."""
+    cols, rows = _read_csv(data / "cameras.csv")
+    acc_cols, acc_rows = _read_csv(data / "accessories.csv")
+    acc_by_cam = {r.get("camera_id"): r for r in acc_rows}
+    base = list(rows)
+    k = 0
+    while len(rows) < cameras:
+        src = base[k % len(base)]
+        k += 1
+        clone = dict(src, id=f"{src['id']}X{k:05d}")
+        for col in ("bitrate_mbps_typical", "poe_w"):
+            try:
+                clone[col] = f"{float(src[col]) * rng.uniform(0.8, 1.2):.2f}"
+            except (KeyError, ValueError):
+                pass
+        rows.append(clone)
+        acc = acc_by_cam.get(src["id"])
+        if acc:
+            acc_rows.append(dict(acc, camera_id=clone["id"]))
+    _write_csv(data / "cameras.csv", cols, rows)
+    _write_csv(data / "accessories.csv", acc_cols, acc_rows)
+    return len(rows)
+
+
+def fake_pdf(size: int, rng: random.Random) -> bytes:
+    """PDF factice (en-tête valide, contenu pseudo-aléatoire incompressible)."""
+    head = b"%PDF-1.7\n% bench\n"
+    return head + rng.randbytes(max(0, size - len(head) - 6)) + b"\n%%EOF"
+
+
+def write_datasheets(data: Path, count: int, rng: random.Random) -> list[str]:
+    """Fiches locales data/Fiche_tech/<famille>/<ID>.pdf pour les premiers produits ; renvoie leurs ids."""
+    ids = []
+    for kind, fn in (("cameras", "cameras.csv"), ("nvrs", "nvrs.csv"), ("hdds", "hdds.csv"), ("switches", "switches.csv")):
+        _, rows = _read_csv(data / fn)
+        for r in rows[: max(1, count // 4)]:
+            pid = str(r.get("id") or "").strip().upper()
+            if not pid:
+                continue
+            folder = data / "Fiche_tech" / kind
+            folder.mkdir(parents=True, exist_ok=True)
+            (folder / f"{pid}.pdf").write_bytes(fake_pdf(rng.randint(300_000, 900_000), rng))
+            ids.append(pid)
+    return ids
+
+
+def build_sandbox(root: Path, profile: dict, seed: int) -> dict:
+    """Arborescence backend/ + data/ + frontend/dist/ calquée sur le dépôt."""
+    rng = random.Random(seed)
+    (root / "backend").mkdir(parents=True)
+    shutil.copy2(BASE_DIR / "backend" / "app.py", root / "backend" / "app.py")
+
+    data = root / "data"
+    data.mkdir()
+    for p in (BASE_DIR / "data").iterdir():
+        if p.is_file() and p.suffix in (".csv", ".json"):
+            shutil.copy2(p, data / p.name)
+    n_cameras = scale_catalogs(data, profile["cameras"], rng)
+    datasheet_ids = write_datasheets(data, profile["datasheets"], rng)
+
+    # Frontend : sources réelles servies comme un build (index.html + assets/)
+    dist = root / "frontend" / "dist"
+    (dist / "assets").mkdir(parents=True)
+    shutil.copy2(BASE_DIR / "frontend" / "index.html", dist / "index.html")
+    for p in (BASE_DIR / "frontend" / "src").iterdir():
+        if p.suffix in (".js", ".css"):
+            shutil.copy2(p, dist / "assets" / p.name)
+    public = root / "frontend" / "public"
+    public.mkdir()
+    shutil.copy2(BASE_DIR / "frontend" / "public" / "admin.html", public / "admin.html")
+
+    return {"cameras": n_cameras, "datasheet_ids": datasheet_ids}
+
+
+def load_app(root: Path):
+    """Importe le backend du bac à sable (chemins dérivés de son propre emplacement)."""
+    os.environ.update(SERVER_ENV)
+    spec = importlib.util.spec_from_file_location("bench_app", root / "backend" / "app.py")
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    return mod
+
+
+def seed_kpi(mod, n: int, seed: int, chunk: int = 20_000) -> float:
+    """Insère n events KPI répartis sur KPI_SPAN_DAYS via le chemin d'écriture du backend."""
+    rng = random.Random(seed)
+    names = [e for e, _ in KPI_EVENTS]
+    weights = [w for _, w in KPI_EVENTS]
+    sessions = max(1, n // 12)
+    step_s = KPI_SPAN_DAYS * 86400 / max(1, n)
+    con = mod._db()
+    parts: dict[str, sqlite3.Connection] = {}
+
+    def part(month: str):
+        if month not in parts:
+            parts[month] = mod._kpi_part_db(month, create=True)
+        return parts[month]
+
+    t0 = time.perf_counter()
+    try:
+        for start in range(0, n, chunk):
+            rows = []
+            for i in range(start, min(n, start + chunk)):
+                ts = KPI_EPOCH + timedelta(seconds=i * step_s + rng.random() * step_s)
+                payload = {"step": rng.choice(KPI_STEPS), "lang": rng.choice(KPI_LANGS), "cams": rng.randint(1, 64)}
+                rows.append((ts.isoformat(), f"s{rng.randrange(sessions):07d}", rng.choices(names, weights)[0],
+                             json.dumps(payload), "/", "bench/1.0", "127.0.0.1"))
+            mod._kpi_insert_rows(con, rows, part)
+    finally:
+        con.close()
+        for c in parts.values():
+            c.close()
+    return time.perf_counter() - t0
+
+
+# =========================
+# SCÉNARIOS
+# =========================
+@dataclass
+class Scenario:
+    name: str
+    method: str
+    path: str
+    requests: int                       # à l'échelle 1.0 (profil full)
+    concurrency: int
+    warmup: int = 10
+    auth: bool = False
+    headers: dict = field(default_factory=dict)
+    body: Callable | None = None        # (state, rng, i) -> (content bytes, content-type)
+    items_per_request: int = 1          # events par requête (débit d'ingestion)
+
+
+def _json(obj) -> tuple[bytes, str]:
+    return json.dumps(obj, separators=(",", ":")).encode("utf-8"), "application/json"
+
+
+def body_kpi_event(state, rng, i):
+    return _json({"session_id": f"b{rng.randrange(5000):05d}", "event": rng.choice(KPI_STEPS),
+                  "payload": {"step": rng.choice(KPI_STEPS), "i": i}})
+
+
+def body_kpi_batch(state, rng, i):
+    return _json({"session_id": f"b{rng.randrange(5000):05d}",
+                  "events": [{"event": rng.choice(KPI_STEPS), "payload": {"i": i, "k": k}} for k in range(50)]})
+
+
+def body_catalog_put(state, rng, i):
+    """Catalogue caméras complet, 1re ligne alternée pour forcer une vraie écriture."""
+    cat = state["catalog"]
+    rows = list(cat["rows"])
+    rows[0] = dict(rows[0], name=f"{rows[0]['name']} [{i % 2}]")
+    return _json({"columns": cat["columns"], "rows": rows})
+
+
+def body_localzip(state, rng, i):
+    return state["localzip_json"], "application/json"
+
+
+def body_localzip_upload(state, rng, i):
+    return state["pdf"], "application/pdf"
+
+
+GZIP_BR = {"Accept-Encoding": "gzip, br"}
+
+SCENARIOS = [
+    Scenario("kpi_event", "POST", "/api/kpi/event", 5000, 32, body=body_kpi_event),
+    Scenario("kpi_batch", "POST", "/api/kpi/batch", 500, 8, body=body_kpi_batch, items_per_request=50),
+    Scenario("kpi_summary", "GET", "/api/kpi/summary", 200, 4, auth=True),
+    Scenario("catalog_bundle", "GET", "/api/catalog/bundle", 500, 8, headers=GZIP_BR),
+    Scenario("catalog_query", "GET", "/api/catalog/cameras/query?f=resolution_mp:gte:4&sort=-dori_detection_m&limit=50",
+             1000, 16),
+    Scenario("catalog_get", "GET", "/api/admin/catalog/cameras", 300, 8, auth=True, headers=GZIP_BR),
+    Scenario("catalog_put", "PUT", "/api/admin/catalog/cameras", 20, 1, warmup=2, auth=True, body=body_catalog_put),
+    Scenario("export_localzip", "POST", "/export/localzip", 10, 2, warmup=1, body=body_localzip),
+    Scenario("export_localzip_upload", "POST", "/export/localzip/upload?zip_name=bench.zip&product_ids={ids}", 10, 2,
+             warmup=1, body=body_localzip_upload),
+    Scenario("static_index", "GET", "/", 3000, 32, headers=GZIP_BR),
+    Scenario("static_asset", "GET", "/assets/app.js", 2000, 32, headers=GZIP_BR),
+    Scenario("spa_fallback", "GET", "/projets/demo/etape-3", 2000, 32, headers=GZIP_BR),
+]
+
+
+def percentile(sorted_values: list[float], p: float) -> float:
+    """Rang le plus proche (valeurs triées)."""
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, max(0, math.ceil(p / 100 * len(sorted_values)) - 1))]
+
+
+async def run_scenario(client: httpx.AsyncClient, sc: Scenario, state: dict, scale: float, seed: int) -> dict:
+    n = max(1, round(sc.requests * scale))
+    rng = random.Random(f"{seed}:{sc.name}")
+    headers = dict(sc.headers)
+    if sc.auth:
+        headers["Authorization"] = f"Bearer {state['token']}"
+    path = sc.path.format(ids=",".join(state["datasheet_ids"]))
+    latencies: list[float] = []
+    stats = {"errors": 0, "bytes": 0, "first_error": None}
+
+    async def drive(count: int, record: bool):
+        it = iter(range(count))
+        # corps générés hors chronométrage, dans l'ordre des indices (déterministe)
+        bodies = [sc.body(state, rng, i) if sc.body else (None, None) for i in range(count)]
+
+        async def worker():
+            for i in it:
+                content, ctype = bodies[i]
+                h = dict(headers, **({"Content-Type": ctype} if ctype else {}))
+                t0 = time.perf_counter()
+                try:
+                    r = await client.request(sc.method, path, content=content, headers=h)
+                    size = len(r.content)
+                    ok = r.status_code < 400
+                except httpx.HTTPError as e:
+                    size, ok, r = 0, False, e
+                dt = time.perf_counter() - t0
+                if not record:
+                    continue
+                latencies.append(dt * 1000)
+                stats["bytes"] += size
+                if not ok:
+                    stats["errors"] += 1
+                    if stats["first_error"] is None:
+                        stats["first_error"] = (f"HTTP {r.status_code}: {r.text[:200]}"
+                                                if isinstance(r, httpx.Response) else repr(r))
+
+        await asyncio.gather(*(worker() for _ in range(max(1, min(sc.concurrency, count)))))
+
+    await drive(min(sc.warmup, n), record=False)
+    t0 = time.perf_counter()
+    await drive(n, record=True)
+    wall = time.perf_counter() - t0
+
+    lat = sorted(latencies)
+    out = {
+        "requests": n,
+        "concurrency": sc.concurrency,
+        "errors": stats["errors"],
+        "wall_s": round(wall, 3),
+        "rps": round(n / wall, 1) if wall else 0.0,
+        "latency_ms": {
+            "p50": round(percentile(lat, 50), 3),
+            "p95": round(percentile(lat, 95), 3),
+            "p99": round(percentile(lat, 99), 3),
+            "mean": round(sum(lat) / len(lat), 3) if lat else 0.0,
+            "max": round(lat[-1], 3) if lat else 0.0,
+        },
+        "mb_in": round(stats["bytes"] / 1e6, 2),
+    }
+    if sc.items_per_request > 1:
+        out["items_per_s"] = round(n * sc.items_per_request / wall, 1) if wall else 0.0
+    if stats["first_error"]:
+        out["first_error"] = stats["first_error"]
+    return out
+
+
+# =========================
+# EXÉCUTION (in-process / uvicorn)
+# =========================
+async def wait_ready(client: httpx.AsyncClient) -> None:
+    deadline = time.monotonic() + READY_TIMEOUT_S
+    while time.monotonic() < deadline:
+        try:
+            if (await client.get("/health/ready")).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError("backend non prêt (/health/ready)")
+
+
+async def prepare_state(client: httpx.AsyncClient, state: dict) -> None:
+    r = await client.post("/api/login", json={"password": ADMIN_PASSWORD})
+    r.raise_for_status()
+    state["token"] = r.json()["token"]
+    r = await client.get("/api/admin/catalog/cameras", headers={"Authorization": f"Bearer {state['token']}"})
+    r.raise_for_status()
+    state["catalog"] = r.json()
+
+
+async def run_all(client: httpx.AsyncClient, scenarios: list[Scenario], state: dict, scale: float, seed: int) -> dict:
+    await wait_ready(client)
+    await prepare_state(client, state)
+    results = {}
+    for sc in scenarios:
+        print(f"  {sc.name:<24}", end="", flush=True)
+        res = await run_scenario(client, sc, state, scale, seed)
+        lat = res["latency_ms"]
+        print(f"{res['rps']:>9.1f} req/s   p50 {lat['p50']:>8.2f} ms   p95 {lat['p95']:>8.2f} ms   "
+              f"p99 {lat['p99']:>8.2f} ms   err {res['errors']}")
+        results[sc.name] = res
+    return results
+
+
+async def run_inprocess(mod, scenarios, state, scale, seed) -> dict:
+    transport = httpx.ASGITransport(app=mod.app)
+    async with mod.app.router.lifespan_context(mod.app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=300) as client:
+            return await run_all(client, scenarios, state, scale, seed)
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def run_uvicorn(root: Path, workers: int, scenarios, state, scale, seed) -> dict:
+    port = free_port()
+    cmd = [sys.executable, "-m", "uvicorn", "app:app", "--app-dir", str(root / "backend"),
+           "--host", "127.0.0.1", "--port", str(port), "--workers", str(workers),
+           "--log-level", "warning", "--no-access-log"]
+    proc = subprocess.Popen(cmd, env={**os.environ, **SERVER_ENV}, stdout=subprocess.DEVNULL)
+    limits = httpx.Limits(max_connections=max(sc.concurrency for sc in scenarios) + 4)
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=300, limits=limits) as client:
+            return await run_all(client, scenarios, state, scale, seed)
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=20)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+def git_rev() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BASE_DIR, capture_output=True,
+                              text=True, timeout=10).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return ""
+
+
+def run(args) -> dict:
+    profile = dict(PROFILES[args.profile])
+    if args.kpi_events is not None:
+        profile["kpi_events"] = args.kpi_events
+    if args.cameras is not None:
+        profile["cameras"] = args.cameras
+    scenarios = [sc for sc in SCENARIOS if not args.only or sc.name in args.only]
+    if not scenarios:
+        raise SystemExit(f"aucun scénario ne correspond à --only (disponibles : {', '.join(s.name for s in SCENARIOS)})")
+
+    root = Path(tempfile.mkdtemp(prefix="bench_"))
+    try:
+        print(f"Bac à sable : {root}")
+        info = build_sandbox(root, profile, args.seed)
+        mod = load_app(root)
+        seed_s = seed_kpi(mod, profile["kpi_events"], args.seed)
+        print(f"Données : {info['cameras']} caméras, {profile['kpi_events']} events KPI ({seed_s:.1f} s), "
+              f"{len(info['datasheet_ids'])} fiches, PDF {profile['pdf_mb']} Mo")
+
+        rng = random.Random(args.seed)
+        pdf = fake_pdf(profile["pdf_mb"] * 1024 * 1024, rng)
+        state = {
+            "datasheet_ids": info["datasheet_ids"],
+            "pdf": pdf,
+            "localzip_json": json.dumps({"pdf_base64": base64.b64encode(pdf).decode("ascii"), "pdf_name": "rapport.pdf",
+                                         "product_ids": info["datasheet_ids"], "zip_name": "bench.zip"}).encode("utf-8"),
+        }
+
+        print(f"Scénarios ({args.server}{f', {args.workers} workers' if args.server == 'uvicorn' else ''}) :")
+        t0 = time.perf_counter()
+        if args.server == "uvicorn":
+            results = asyncio.run(run_uvicorn(root, args.workers, scenarios, state, profile["scale"], args.seed))
+        else:
+            results = asyncio.run(run_inprocess(mod, scenarios, state, profile["scale"], args.seed))
+        total_s = time.perf_counter() - t0
+    finally:
+        if args.keep:
+            print(f"Bac à sable conservé : {root}")
+        else:
+            shutil.rmtree(root, ignore_errors=True)
+
+    return {
+        "meta": {
+            "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "git": git_rev(),
+            "server": args.server,
+            "workers": args.workers if args.server == "uvicorn" else 1,
+            "profile": args.profile,
+            "seed": args.seed,
+            "data": {"cameras": info["cameras"], "kpi_events": profile["kpi_events"], "pdf_mb": profile["pdf_mb"],
+                     "datasheets": len(info["datasheet_ids"])},
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "kpi_seed_s": round(seed_s, 2),
+            "total_s": round(total_s, 2),
+        },
+        "scenarios": results,
+    }
+
+
+# =========================
+# COMPARAISON
+# =========================
+def load_thresholds(path: Path | None) -> dict:
+    cfg = {"default": {"p95_pct": 20, "p99_pct": 35, "rps_pct": 15, "min_ms": 2.0, "errors": 0}, "scenarios": {}}
+    if path and path.is_file():
+        user = json.loads(path.read_text(encoding="utf-8"))
+        cfg["default"].update(user.get("default", {}))
+        cfg["scenarios"].update(user.get("scenarios", {}))
+    return cfg
+
+
+def compare(base: dict, cur: dict, thresholds: dict) -> dict:
+    """Régressions de cur par rapport à base (latences p95/p99, débit, erreurs) selon les seuils."""
+    for key in ("server", "workers", "profile"):
+        if base.get("meta", {}).get(key) != cur.get("meta", {}).get(key):
+            print(f"⚠️  {key} différent : base={base['meta'].get(key)} courant={cur['meta'].get(key)}")
+    rows, regressions = [], []
+    for name, c in cur["scenarios"].items():
+        b = base["scenarios"].get(name)
+        if not b:
+            rows.append({"scenario": name, "status": "new"})
+            continue
+        t = {**thresholds["default"], **thresholds["scenarios"].get(name, {})}
+        checks = []
+        for q in ("p95", "p99"):
+            bv, cv = b["latency_ms"][q], c["latency_ms"][q]
+            limit = bv * (1 + t[f"{q}_pct"] / 100)
+            checks.append((f"{q}_ms", bv, cv, cv > limit and cv - bv > t["min_ms"]))
+        checks.append(("rps", b["rps"], c["rps"], c["rps"] < b["rps"] * (1 - t["rps_pct"] / 100)))
+        checks.append(("errors", b["errors"], c["errors"], c["errors"] > b["errors"] + t["errors"]))
+        for metric, bv, cv, bad in checks:
+            delta = round((cv - bv) / bv * 100, 1) if bv else None
+            row = {"scenario": name, "metric": metric, "base": bv, "current": cv, "delta_pct": delta,
+                   "status": "REGRESSION" if bad else "ok"}
+            rows.append(row)
+            if bad:
+                regressions.append(row)
+    for name in base["scenarios"]:
+        if name not in cur["scenarios"]:
+            rows.append({"scenario": name, "status": "missing"})
+    return {"regressions": len(regressions), "rows": rows}
+
+
+def print_comparison(result: dict) -> None:
+    print("")
+    print("=== Comparaison ===")
+    for r in result["rows"]:
+        if "metric" not in r:
+            print(f"  {r['scenario']:<24} {r['status']}")
+            continue
+        delta = "   n/a" if r["delta_pct"] is None else f"{r['delta_pct']:+6.1f}%"
+        print(f"  {r['scenario']:<24} {r['metric']:<8} {r['base']:>11} -> {r['current']:>11}  {delta}  {r['status']}")
+    print(f"Régressions : {result['regressions']}")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Banc de performance du backend (ASGI in-process ou uvicorn local).")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    rp = sub.add_parser("run", help="génère les données, exécute les scénarios, écrit le rapport JSON")
+    rp.add_argument("--profile", choices=sorted(PROFILES), default="full", help="taille des données et des séries")
+    rp.add_argument("--server", choices=("asgi", "uvicorn"), default="asgi", help="client ASGI in-process ou uvicorn local")
+    rp.add_argument("--workers", type=int, default=2, help="workers uvicorn (--server uvicorn)")
+    rp.add_argument("--seed", type=int, default=SEED, help="graine des générateurs et des requêtes")
+    rp.add_argument("--kpi-events", type=int, default=None, help="surcharge du nombre d'events KPI du profil")
+    rp.add_argument("--cameras", type=int, default=None, help="surcharge de la taille du catalogue caméras")
+    rp.add_argument("--only", action="append", help="limiter à un scénario (répétable)")
+    rp.add_argument("--out", default=None, help="écrit le rapport JSON dans ce fichier")
+    rp.add_argument("--baseline", default=None, help="rapport de référence : exit 3 en cas de régression")
+    rp.add_argument("--thresholds", default=str(THRESHOLDS_PATH), help="seuils de régression (JSON)")
+    rp.add_argument("--keep", action="store_true", help="conserve le bac à sable pour inspection")
+
+    cp = sub.add_parser("compare", help="compare deux rapports JSON (exit 3 en cas de régression)")
+    cp.add_argument("baseline")
+    cp.add_argument("current")
+    cp.add_argument("--thresholds", default=str(THRESHOLDS_PATH), help="seuils de régression (JSON)")
+    args = ap.parse_args()
+
+    thresholds = load_thresholds(Path(args.thresholds))
+    if args.cmd == "compare":
+        base = json.loads(Path(args.baseline).read_text(encoding="utf-8"))
+        cur = json.loads(Path(args.current).read_text(encoding="utf-8"))
+        result = compare(base, cur, thresholds)
+        print_comparison(result)
+        sys.exit(3 if result["regressions"] else 0)
+
+    report = run(args)
+    errors = sum(s["errors"] for s in report["scenarios"].values())
+    if args.baseline:
+        base = json.loads(Path(args.baseline).read_text(encoding="utf-8"))
+        report["comparison"] = compare(base, report, thresholds)
+        print_comparison(report["comparison"])
+    out = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.out:
+        Path(args.out).write_text(out, encoding="utf-8")
+        print(f"Rapport : {args.out}")
+    else:
+        print(out)
+
+    if report.get("comparison", {}).get("regressions"):
+        sys.exit(3)
+    if errors:
+        sys.exit(2)
+
+
+if __name__ == "__main__":
+    main()
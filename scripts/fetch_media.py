@@ -1,41 +1,62 @@
 from __future__ import annotations
 
+import argparse
 import csv
+import json
 import os
-import re
 import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 from urllib.parse import urlparse
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 
 # =========================
 # CONFIG
 # =========================
-BASE_DIR = Path(r"C:\AI\Configurateur")
+# Racine du projet : --base-dir > CONFIGURATEUR_BASE_DIR > dossier parent de scripts/
+BASE_DIR = Path(os.getenv("CONFIGURATEUR_BASE_DIR") or Path(__file__).resolve().parent.parent)
 DATA_DIR = BASE_DIR / "data"
 
 OUT_IMAGES = DATA_DIR / "Images"
 OUT_FT = DATA_DIR / "Fiche_tech"
+MANIFEST_PATH = DATA_DIR / "_media_manifest.json"
 
 TIMEOUT_S = 25
 ALLOWED_HOSTS = {"staticpro.comelitgroup.com"}  # garde-fou
+WORKERS = 8          # téléchargements simultanés (total)
+PER_HOST = 4         # téléchargements simultanés par hôte
+RETRIES = 3
 
 
 # Familles CSV “classiques” (id + image_url + datasheet_url)
 CSV_STANDARD = [
-    ("cameras", DATA_DIR / "cameras.csv"),
-    ("nvrs", DATA_DIR / "nvrs.csv"),
-    ("hdds", DATA_DIR / "hdds.csv"),
-    ("switches", DATA_DIR / "switches.csv"),
-    ("screens", DATA_DIR / "screens.csv"),
-    ("enclosures", DATA_DIR / "enclosures.csv"),
-    ("signage", DATA_DIR / "signage.csv"),
+    ("cameras", "cameras.csv"),
+    ("nvrs", "nvrs.csv"),
+    ("hdds", "hdds.csv"),
+    ("switches", "switches.csv"),
+    ("screens", "screens.csv"),
+    ("enclosures", "enclosures.csv"),
+    ("signage", "signage.csv"),
 ]
 
 # CSV “mapping”
-CSV_ACCESSORIES = ("accessories", DATA_DIR / "accessories.csv")
+CSV_ACCESSORIES = ("accessories", "accessories.csv")
+
+
+def set_base_dir(base: Path) -> None:
+    """Repositionne tous les chemins dérivés de BASE_DIR."""
+    global BASE_DIR, DATA_DIR, OUT_IMAGES, OUT_FT, MANIFEST_PATH
+    BASE_DIR = Path(base)
+    DATA_DIR = BASE_DIR / "data"
+    OUT_IMAGES = DATA_DIR / "Images"
+    OUT_FT = DATA_DIR / "Fiche_tech"
+    MANIFEST_PATH = DATA_DIR / "_media_manifest.json"
 
 
 # =========================
@@ -84,27 +105,6 @@ def guess_ext_from_url(url: str, default: str) -> str:
     return default
 
 
-def download_if_missing(url: str, dst: Path) -> str:
-    if not url:
-        return "SKIP (URL vide)"
-    if not is_allowed_url(url):
-        return f"SKIP (host interdit: {urlparse(url).netloc})"
-    if dst.exists() and dst.stat().st_size > 0:
-        return "SKIP (déjà présent)"
-
-    try:
-        dst.parent.mkdir(parents=True, exist_ok=True)
-        with requests.get(url, stream=True, timeout=TIMEOUT_S) as r:
-            r.raise_for_status()
-            with open(dst, "wb") as f:
-                for chunk in r.iter_content(chunk_size=1024 * 128):
-                    if chunk:
-                        f.write(chunk)
-        return "OK"
-    except Exception as e:
-        return f"ERR ({type(e).__name__}: {e})"
-
-
 def read_csv_rows(csv_path: Path) -> list[dict]:
     rows: list[dict] = []
     if not csv_path.exists():
@@ -116,12 +116,205 @@ def read_csv_rows(csv_path: Path) -> list[dict]:
     return rows
 
 
+def make_session(pool_size: int) -> requests.Session:
+    """Session partagée : connexions réutilisées + retry sur erreurs transitoires."""
+    retry = Retry(
+        total=RETRIES,
+        backoff_factor=0.5,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=("GET", "HEAD"),
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    s = requests.Session()
+    s.mount("http://", adapter)
+    s.mount("https://", adapter)
+    return s
+
+
 # =========================
-# ACCESSORIES (mapping)
+# MANIFEST (ETag / Last-Modified par fichier)
 # =========================
-def process_accessories_mapping(csv_path: Path) -> tuple[int, int, int]:
+class Manifest:
+    """data/_media_manifest.json : { "<chemin relatif>": {url, etag, last_modified, size} }."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.lock = threading.Lock()
+        try:
+            self.entries: dict[str, dict] = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            self.entries = {}
+
+    def get(self, rel: str) -> dict:
+        with self.lock:
+            return dict(self.entries.get(rel) or {})
+
+    def set(self, rel: str, entry: dict) -> None:
+        with self.lock:
+            self.entries[rel] = entry
+
+    def save(self) -> None:
+        with self.lock:
+            data = json.dumps(self.entries, indent=1, sort_keys=True)
+        tmp = self.path.with_suffix(".json.part")
+        tmp.write_text(data, encoding="utf-8")
+        os.replace(tmp, self.path)
+
+
+# =========================
+# TÉLÉCHARGEMENT (conditionnel, reprise, écriture atomique)
+# =========================
+_HOST_SLOTS: dict[str, threading.Semaphore] = {}
+_HOST_SLOTS_LOCK = threading.Lock()
+
+
+def host_slot(url: str) -> threading.Semaphore:
+    host = urlparse(url).netloc
+    with _HOST_SLOTS_LOCK:
+        if host not in _HOST_SLOTS:
+            _HOST_SLOTS[host] = threading.Semaphore(PER_HOST)
+        return _HOST_SLOTS[host]
+
+
+def seed_entry(session: requests.Session, url: str, dst: Path) -> dict | None:
     """
-    Télécharge les medias depuis accessories.csv (mapping caméra -> accessoires).
+    Fichier présent sans entrée de manifest : un HEAD récupère ETag / Last-Modified
+    pour les GET conditionnels suivants. None si le HEAD échoue ou si la taille
+    annoncée diffère du fichier local (il faut alors retélécharger).
+    """
+    try:
+        with host_slot(url):
+            r = session.head(url, timeout=TIMEOUT_S, allow_redirects=True)
+        r.raise_for_status()
+    except requests.RequestException:
+        return None
+    size = dst.stat().st_size
+    length = r.headers.get("Content-Length") or ""
+    if length.isdigit() and int(length) != size:
+        return None
+    return {
+        "url": url,
+        "etag": r.headers.get("ETag") or "",
+        "last_modified": r.headers.get("Last-Modified") or "",
+        "size": size,
+        "synced_at": int(time.time()),
+    }
+
+
+def sync_file(session: requests.Session, manifest: Manifest, url: str, dst: Path, force: bool = False) -> tuple[str, int]:
+    """
+    Synchronise dst avec url. Retourne (statut, octets reçus).
+    - fichier présent + manifest : GET conditionnel (If-None-Match / If-Modified-Since),
+    - fichier présent sans manifest : HEAD pour amorcer le manifest (GET complet si la taille diffère),
+    - fichier .part existant : reprise via Range (+ If-Range pour ne pas mélanger deux versions) ;
+      416 : .part déjà complet (finalisé) ou plus long que la ressource (supprimé, on repart de zéro),
+    - écriture dans .part puis renommage atomique.
+    """
+    if not url:
+        return "SKIP (URL vide)", 0
+    if not is_allowed_url(url):
+        return f"SKIP (host interdit: {urlparse(url).netloc})", 0
+
+    rel = dst.relative_to(DATA_DIR).as_posix()
+    entry = manifest.get(rel)
+    if entry.get("url") != url:
+        entry = {}  # URL changée : ni conditionnel ni reprise
+    part = dst.with_name(dst.name + ".part")
+    have = dst.exists() and dst.stat().st_size > 0
+
+    headers = {}
+    if have and not force and entry:
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+    elif have and not force and not entry:
+        # fichier déjà présent sans trace (ancienne version du script) : gardé si le serveur concorde
+        seeded = seed_entry(session, url, dst)
+        if seeded:
+            manifest.set(rel, seeded)
+            return "SKIP (manifest amorcé)", 0
+
+    offset = part.stat().st_size if part.exists() else 0
+    validator = entry.get("partial_etag") or entry.get("partial_last_modified")
+    if offset and validator:
+        headers["Range"] = f"bytes={offset}-"
+        headers["If-Range"] = validator
+    else:
+        offset = 0
+
+    try:
+        dst.parent.mkdir(parents=True, exist_ok=True)
+        with host_slot(url), session.get(url, headers=headers, stream=True, timeout=TIMEOUT_S) as r:
+            if r.status_code == 304:
+                return "SKIP (à jour)", 0
+            received = 0
+            if r.status_code == 416 and offset:
+                # .part complet (run tué avant le renommage) : Content-Range "bytes */<taille>"
+                total = r.headers.get("Content-Range", "").rpartition("/")[2]
+                if not (total.isdigit() and int(total) == offset):
+                    part.unlink()
+                    manifest.set(rel, {k: v for k, v in entry.items() if not k.startswith("partial_")})
+                    return "ERR (reprise invalide, .part supprimé)", 0
+                etag = entry.get("partial_etag") or ""
+                last_modified = entry.get("partial_last_modified") or ""
+                resumed = True
+            else:
+                r.raise_for_status()
+                etag = r.headers.get("ETag") or ""
+                last_modified = r.headers.get("Last-Modified") or ""
+                resumed = r.status_code == 206
+                # mémorise le validateur du téléchargement en cours (reprise après interruption)
+                manifest.set(rel, {**entry, "url": url, "partial_etag": etag, "partial_last_modified": last_modified})
+                with open(part, "ab" if resumed else "wb") as f:
+                    for chunk in r.iter_content(chunk_size=1024 * 128):
+                        if chunk:
+                            f.write(chunk)
+                            received += len(chunk)
+        os.replace(part, dst)
+        manifest.set(rel, {
+            "url": url,
+            "etag": etag,
+            "last_modified": last_modified,
+            "size": dst.stat().st_size,
+            "synced_at": int(time.time()),
+        })
+        return ("OK (repris)" if resumed else ("OK (mis à jour)" if have else "OK")), received
+    except Exception as e:
+        return f"ERR ({type(e).__name__}: {e})", 0
+
+
+# =========================
+# COLLECTE DES TÂCHES
+# =========================
+def jobs_for_standard_csv(family: str, csv_path: Path) -> list[tuple[str, str, str, str, Path]]:
+    """(famille, type, id, url, destination) pour un CSV id + image_url + datasheet_url."""
+    jobs = []
+    img_dir = OUT_IMAGES / family
+    ft_dir = OUT_FT / family
+
+    rows = read_csv_rows(csv_path)
+    if not rows:
+        print(f"[{family}] CSV vide ou introuvable: {csv_path}")
+        return jobs
+
+    for row in rows:
+        pid = get_row_id(row)
+        if not pid:
+            continue
+        image_url = safe_url(row.get("image_url"))
+        datasheet_url = safe_url(row.get("datasheet_url"))
+        if image_url:
+            ext = guess_ext_from_url(image_url, default=".png")
+            jobs.append((family, "IMG", pid, image_url, img_dir / f"{pid}{ext}"))
+        if datasheet_url:
+            jobs.append((family, "FT ", pid, datasheet_url, ft_dir / f"{pid}.pdf"))
+    return jobs
+
+
+def jobs_for_accessories_mapping(csv_path: Path) -> list[tuple[str, str, str, str, Path]]:
+    """
+    Medias depuis accessories.csv (mapping caméra -> accessoires).
     On récupère:
       junction_box_id + image_url_junction_box + datasheet_url_junction_box
       wall_mount_id   + image_url_wall_mount   + datasheet_url_wall_mount
@@ -131,172 +324,133 @@ def process_accessories_mapping(csv_path: Path) -> tuple[int, int, int]:
       data/Images/accessories/<ID>.png
       data/Fiche_tech/accessories/<ID>.pdf
     """
-    ok = skip = err = 0
-
+    jobs = []
     img_dir = OUT_IMAGES / "accessories"
     ft_dir = OUT_FT / "accessories"
-    ensure_dir(img_dir)
-    ensure_dir(ft_dir)
 
     rows = read_csv_rows(csv_path)
     if not rows:
         print("[accessories] CSV vide ou introuvable.")
-        return ok, skip, err
+        return jobs
 
     # Dédup par ID (une fois suffit)
     seen: set[str] = set()
-
-    def handle_one(acc_id: str, img_url: str, pdf_url: str) -> None:
-        nonlocal ok, skip, err
-
-        acc_id = safe_id(acc_id).upper()
-        if not acc_id or acc_id in seen:
-            return
-        seen.add(acc_id)
-
-        # image (PNG attendu, mais on garde un fallback)
-        if img_url:
-            ext = guess_ext_from_url(img_url, default=".png")
-            img_dst = img_dir / f"{acc_id}{ext}"
-            st = download_if_missing(img_url, img_dst)
-            if st == "OK":
-                ok += 1
-            elif st.startswith("SKIP"):
-                skip += 1
-            else:
-                err += 1
-            print(f"[accessories] IMG {acc_id:<14} -> {st}")
-
-        # datasheet (force .pdf)
-        if pdf_url:
-            ft_dst = ft_dir / f"{acc_id}.pdf"
-            st = download_if_missing(pdf_url, ft_dst)
-            if st == "OK":
-                ok += 1
-            elif st.startswith("SKIP"):
-                skip += 1
-            else:
-                err += 1
-            print(f"[accessories] FT  {acc_id:<14} -> {st}")
-
     for row in rows:
-        # Junction box
-        handle_one(
-            row.get("junction_box_id", ""),
-            safe_url(row.get("image_url_junction_box")),
-            safe_url(row.get("datasheet_url_junction_box")),
-        )
-        # Wall mount
-        handle_one(
-            row.get("wall_mount_id", ""),
-            safe_url(row.get("image_url_wall_mount")),
-            safe_url(row.get("datasheet_url_wall_mount")),
-        )
-        # Ceiling mount
-        handle_one(
-            row.get("ceiling_mount_id", ""),
-            safe_url(row.get("image_url_ceiling_mount")),
-            safe_url(row.get("datasheet_url_ceiling_mount")),
-        )
+        for slot in ("junction_box", "wall_mount", "ceiling_mount"):
+            acc_id = safe_id(row.get(f"{slot}_id", "")).upper()
+            if not acc_id or acc_id in seen:
+                continue
+            seen.add(acc_id)
+            img_url = safe_url(row.get(f"image_url_{slot}"))
+            pdf_url = safe_url(row.get(f"datasheet_url_{slot}"))
+            if img_url:
+                ext = guess_ext_from_url(img_url, default=".png")
+                jobs.append(("accessories", "IMG", acc_id, img_url, img_dir / f"{acc_id}{ext}"))
+            if pdf_url:
+                jobs.append(("accessories", "FT ", acc_id, pdf_url, ft_dir / f"{acc_id}.pdf"))
 
     # petit fichier “trace” utile
     out_list = DATA_DIR / "_accessories_downloaded_ids.txt"
     out_list.write_text("\n".join(sorted(seen)) + "\n", encoding="utf-8")
     print(f"[accessories] IDs accessoires traités: {len(seen)} -> {out_list}")
-
-    return ok, skip, err
+    return jobs
 
 
-# =========================
-# STANDARD CSV (id list)
-# =========================
 def get_row_id(row: dict) -> str:
     pid = (row.get("id") or "").strip()
     pid = pid.upper()
     return pid if pid else ""
 
 
-def process_standard_csv(family: str, csv_path: Path) -> tuple[int, int, int]:
-    ok = skip = err = 0
-
-    img_dir = OUT_IMAGES / family
-    ft_dir = OUT_FT / family
-    ensure_dir(img_dir)
-    ensure_dir(ft_dir)
-
-    rows = read_csv_rows(csv_path)
-    if not rows:
-        print(f"[{family}] CSV vide ou introuvable: {csv_path}")
-        return ok, skip, err
-
-    for row in rows:
-        pid = get_row_id(row)
-        if not pid:
+# =========================
+# SYNC
+# =========================
+def run(workers: int = WORKERS, force: bool = False, families: set[str] | None = None) -> dict:
+    jobs = []
+    for family, name in CSV_STANDARD:
+        if families and family not in families:
             continue
-
-        image_url = safe_url(row.get("image_url"))
-        datasheet_url = safe_url(row.get("datasheet_url"))
-
-        if image_url:
-            ext = guess_ext_from_url(image_url, default=".png")
-            img_dst = img_dir / f"{pid}{ext}"
-            st = download_if_missing(image_url, img_dst)
-            if st == "OK":
-                ok += 1
+        csv_path = DATA_DIR / name
+        if csv_path.exists():
+            jobs += jobs_for_standard_csv(family, csv_path)
+    fam, name = CSV_ACCESSORIES
+    if (not families or fam in families) and (DATA_DIR / name).exists():
+        jobs += jobs_for_accessories_mapping(DATA_DIR / name)
+
+    manifest = Manifest(MANIFEST_PATH)
+    session = make_session(max(workers, PER_HOST))
+    summary: dict[str, dict] = {}
+    lock = threading.Lock()
+    t0 = time.perf_counter()
+
+    done = [0]
+
+    def one(job):
+        family, kind, pid, url, dst = job
+        t = time.perf_counter()
+        st, nbytes = sync_file(session, manifest, url, dst, force=force)
+        dt = time.perf_counter() - t
+        with lock:
+            s = summary.setdefault(family, {"ok": 0, "skip": 0, "err": 0, "bytes": 0, "duration_s": 0.0})
+            if st.startswith("OK"):
+                s["ok"] += 1
             elif st.startswith("SKIP"):
-                skip += 1
+                s["skip"] += 1
             else:
-                err += 1
-            print(f"[{family}] IMG {pid:<14} -> {st}")
+                s["err"] += 1
+            s["bytes"] += nbytes
+            s["duration_s"] = round(s["duration_s"] + dt, 3)  # temps cumulé des téléchargements
+            done[0] += 1
+            checkpoint = done[0] % 50 == 0
+        if checkpoint:
+            manifest.save()  # validateurs de reprise conservés même si le run est tué
+        sys.stdout.write(f"[{family}] {kind} {pid:<14} -> {st}\n")  # une seule écriture : lignes non entrelacées
 
-        if datasheet_url:
-            ft_dst = ft_dir / f"{pid}.pdf"
-            st = download_if_missing(datasheet_url, ft_dst)
-            if st == "OK":
-                ok += 1
-            elif st.startswith("SKIP"):
-                skip += 1
-            else:
-                err += 1
-            print(f"[{family}] FT  {pid:<14} -> {st}")
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            for fut in as_completed([pool.submit(one, j) for j in jobs]):
+                fut.result()
+    finally:
+        manifest.save()
+        session.close()
 
-    return ok, skip, err
+    totals = {k: sum(s[k] for s in summary.values()) for k in ("ok", "skip", "err", "bytes")}
+    return {
+        "base_dir": str(BASE_DIR),
+        "families": summary,
+        "total": {**totals, "files": len(jobs), "wall_s": round(time.perf_counter() - t0, 3)},
+    }
 
 
 def main() -> None:
+    global PER_HOST
+    ap = argparse.ArgumentParser(description="Synchronise images et fiches techniques depuis les CSV catalogues.")
+    ap.add_argument("--base-dir", default=None, help="racine du projet (défaut : CONFIGURATEUR_BASE_DIR ou parent de scripts/)")
+    ap.add_argument("--workers", type=int, default=WORKERS, help="téléchargements simultanés")
+    ap.add_argument("--per-host", type=int, default=PER_HOST, help="téléchargements simultanés par hôte")
+    ap.add_argument("--force", action="store_true", help="ignore le manifest et retélécharge tout")
+    ap.add_argument("--family", action="append", help="limiter à une famille (répétable)")
+    ap.add_argument("--summary", default=None, help="écrit aussi le résumé JSON dans ce fichier")
+    args = ap.parse_args()
+
+    if args.base_dir:
+        set_base_dir(Path(args.base_dir))
+    PER_HOST = max(1, args.per_host)
+
     print(f"BASE_DIR : {BASE_DIR}")
     print(f"DATA_DIR : {DATA_DIR}")
     print("")
 
-    total_ok = total_skip = total_err = 0
-
-    # Standard
-    for family, csv_path in CSV_STANDARD:
-        if not csv_path.exists():
-            continue
-        print(f"=== {family} ===")
-        ok, skip, err = process_standard_csv(family, csv_path)
-        total_ok += ok
-        total_skip += skip
-        total_err += err
-        print("")
-
-    # Accessories mapping
-    fam, acc_csv = CSV_ACCESSORIES
-    if acc_csv.exists():
-        print("=== accessories (mapping) ===")
-        ok, skip, err = process_accessories_mapping(acc_csv)
-        total_ok += ok
-        total_skip += skip
-        total_err += err
-        print("")
+    result = run(workers=args.workers, force=args.force, families=set(args.family or []) or None)
 
+    print("")
     print("=== Résumé ===")
-    print(f"OK   : {total_ok}")
-    print(f"SKIP : {total_skip}")
-    print(f"ERR  : {total_err}")
+    out = json.dumps(result, indent=2, ensure_ascii=False)
+    print(out)
+    if args.summary:
+        Path(args.summary).write_text(out, encoding="utf-8")
 
-    if total_err > 0:
+    if result["total"]["err"] > 0:
         sys.exit(2)
 
 
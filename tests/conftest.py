@@ -0,0 +1,65 @@
+"""
+Tests du backend : backend/app.py importé une seule fois, tous ses chemins
+(données, bases SQLite, caches, verrous) redirigés vers un dossier temporaire.
+
+    pip install pytest httpx
+    python -m pytest -q
+"""
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TMP = tempfile.mkdtemp(prefix="cfg_tests_")
+ADMIN_PASSWORD = "test-admin"
+
+os.makedirs(os.path.join(TMP, "data"))
+for name in os.listdir(os.path.join(ROOT, "data")):
+    if name.endswith((".csv", ".json")):
+        shutil.copy2(os.path.join(ROOT, "data", name), os.path.join(TMP, "data", name))
+
+os.environ.update({
+    "CONFIG_ADMIN_PASSWORD": ADMIN_PASSWORD,
+    "DATA_DIR": os.path.join(TMP, "data"),
+    "KPI_DB": os.path.join(TMP, "kpi.sqlite3"),
+    "KPI_PARTS_DIR": os.path.join(TMP, "kpi_parts"),
+    "KPI_ARCHIVE_DIR": os.path.join(TMP, "kpi_archive"),
+    "KPI_RETENTION_MONTHS": "0",
+    "CATALOG_DB": os.path.join(TMP, "catalog.sqlite3"),
+    "CATALOG_HISTORY_DIR": os.path.join(TMP, "catalog_history"),
+    "LOCK_DIR": os.path.join(TMP, "locks"),
+    "SESSION_SECRET_FILE": os.path.join(TMP, "session_secret"),
+    "SESSION_DB": os.path.join(TMP, "sessions.sqlite3"),
+    "SHARE_DB": os.path.join(TMP, "shares.sqlite3"),
+    "REPORT_CACHE_DIR": os.path.join(TMP, "report_cache"),
+    "REPORT_WORKERS": "0",
+    "IMAGE_CACHE_DIR": os.path.join(TMP, "image_cache"),
+    "MEDIA_CACHE_DIR": os.path.join(TMP, "media_cache"),
+    "MEDIA_ALLOWED_HOSTS": "",
+})
+sys.path.insert(0, ROOT)
+
+from backend import app as backend_app  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def app_module():
+    return backend_app
+
+
+@pytest.fixture(scope="session")
+def client():
+    with TestClient(backend_app.app) as c:
+        yield c
+    shutil.rmtree(TMP, ignore_errors=True)
+
+
+@pytest.fixture(scope="session")
+def auth(client):
+    r = client.post("/api/login", json={"password": ADMIN_PASSWORD})
+    assert r.status_code == 200
+    return {"Authorization": f"Bearer {r.json()['token']}"}
@@ -0,0 +1,114 @@
+"""Écritures catalogue admin : conflits de version, validation sans écriture partielle, rollback."""
+import pytest
+
+URL = "/api/admin/catalog/hdds"
+
+
+def _current(client, auth):
+    r = client.get(URL, headers=auth)
+    assert r.status_code == 200
+    return r.json()
+
+
+def _csv(client):
+    return client.get("/data/hdds.csv").content
+
+
+def test_writes_require_auth(client):
+    assert client.put(URL, json={"columns": ["id"], "rows": []}).status_code == 401
+    assert client.patch(URL, json={"upsert": []}).status_code == 401
+    assert client.post(URL + "/rollback", json={"version": 1}).status_code == 401
+
+
+def test_patch_bumps_version_and_is_served(client, auth):
+    cur = _current(client, auth)
+    key = cur["rows"][0]["id"]
+    r = client.patch(URL, headers=auth, json={"upsert": [{"id": key, "series": "Purple-T"}],
+                                              "base_version": cur["version"]})
+    assert r.status_code == 200
+    body = r.json()
+    assert body["version"] == cur["version"] + 1
+    assert body["changed"] == {"updated": 1, "inserted": 0, "deleted": 0}
+    assert b"Purple-T" in _csv(client)
+    assert client.get("/api/catalog/versions").json()["hdds"] == body["version"]
+
+
+def test_stale_base_version_is_409_and_nothing_written(client, auth):
+    cur = _current(client, auth)
+    before = _csv(client)
+    r = client.patch(URL, headers=auth, json={"upsert": [{"id": cur["rows"][0]["id"], "series": "X"}],
+                                              "base_version": cur["version"] - 1})
+    assert r.status_code == 409
+    assert r.json()["detail"] == {"error": "version_conflict", "version": cur["version"]}
+    assert _csv(client) == before
+
+
+@pytest.mark.parametrize("change", [
+    {"upsert": [{"id": "NEW1", "capacity_tb": "beaucoup"}]},   # colonne numérique
+    {"upsert": [{"id": "NEW2", "colonne_inconnue": "1"}]},
+    {"upsert": [{"name": "sans id"}]},
+    {"delete": ["ID-ABSENT"]},
+])
+def test_invalid_patch_is_422_and_nothing_written(client, auth, change):
+    cur = _current(client, auth)
+    before = _csv(client)
+    r = client.patch(URL, headers=auth, json=change)
+    assert r.status_code == 422
+    assert _current(client, auth)["version"] == cur["version"]
+    assert _csv(client) == before
+
+
+def test_invalid_put_is_rejected(client, auth):
+    cur = _current(client, auth)
+    before = _csv(client)
+    assert client.put(URL, headers=auth, json={"columns": [" "], "rows": []}).status_code == 400
+    dup = [dict(cur["rows"][0]), dict(cur["rows"][0])]
+    r = client.put(URL, headers=auth, json={"columns": cur["columns"], "rows": dup})
+    assert r.status_code == 422
+    assert any("en double" in e for e in r.json()["detail"]["errors"])
+    r = client.put(URL, headers=auth, json={"columns": ["id", "name"], "rows": cur["rows"]})
+    assert r.status_code == 422  # colonnes du schéma manquantes
+    assert _csv(client) == before
+
+
+def test_rollback_restores_previous_content(client, auth):
+    cur = _current(client, auth)
+    before = _csv(client)
+    r = client.patch(URL, headers=auth, json={"delete": [cur["rows"][-1]["id"]]})
+    assert r.status_code == 200 and r.json()["changed"]["deleted"] == 1
+    assert _csv(client) != before
+    r = client.post(URL + "/rollback", headers=auth, json={"version": cur["version"]})
+    assert r.status_code == 200
+    assert r.json()["version"] == cur["version"] + 2  # republiée sous un nouveau numéro
+    assert _csv(client) == before
+    assert client.post(URL + "/rollback", headers=auth, json={"version": 99999}).status_code == 404
+
+
+
+def test_delete_then_upsert_same_key_replaces_the_row(client, auth):
+    cur = _current(client, auth)
+    row = cur["rows"][0]
+    r = client.patch(URL, headers=auth, json={"delete": [row["id"]],
+                                              "upsert": [{"id": row["id"], "name": "Remplacé", "capacity_tb": "2"}]})
+    assert r.status_code == 200, r.text
+    assert r.json()["changed"] == {"updated": 0, "inserted": 1, "deleted": 1}
+    rows = _current(client, auth)["rows"]
+    same = [x for x in rows if x["id"] == row["id"]]
+    assert len(same) == 1 and len(rows) == len(cur["rows"])
+    assert same[0]["name"] == "Remplacé" and same[0]["series"] == ""  # ligne repartie de zéro
+
+
+def _bundle_response(app_module, accept_encoding):
+    # appel direct de la route : GZipMiddleware (Starlette) n'intervient pas
+    from starlette.requests import Request
+    scope = {"type": "http", "method": "GET", "path": "/api/catalog/bundle", "query_string": b"",
+             "headers": [(b"accept-encoding", accept_encoding.encode())]}
+    return app_module.catalog_bundle(Request(scope))
+
+
+def test_bundle_honours_accept_encoding_q0(client, app_module):
+    r = _bundle_response(app_module, "gzip;q=0, identity")
+    assert "content-encoding" not in r.headers
+    assert r.body == app_module._bundle_get()["json"]
+    r = _bundle_response(app_module, "br, gzip;q=0.5")
+    assert r.headers["content-encoding"] == "gzip"
@@ -0,0 +1,133 @@
+"""Pack ZIP /export/localzip(/upload) : fiches techniques locales, plafond de taille appliqué pendant la lecture du corps."""
+import asyncio
+import base64
+import io
+import os
+import zipfile
+
+import pytest
+
+LIMIT = 64 * 1024
+PDF = b"%PDF-1.4\n" + b"0" * 1024 + b"\n%%EOF\n"
+
+
+@pytest.fixture
+def small_cap(app_module, monkeypatch):
+    monkeypatch.setattr(app_module, "EXPORT_MAX_UPLOAD_BYTES", LIMIT)
+
+
+def _chunks(total, size=8192):
+    sent = 0
+    yield b"%PDF-"
+    while sent < total:
+        yield b"0" * size
+        sent += size
+
+
+def _multipart_chunks(boundary, total):
+    yield (f"--{boundary}\r\nContent-Disposition: form-data; name=\"pdf\"; filename=\"r.pdf\"\r\n"
+           "Content-Type: application/pdf\r\n\r\n").encode()
+    yield from _chunks(total)
+    yield f"\r\n--{boundary}--\r\n".encode()
+
+
+def test_raw_upload_builds_zip(client, small_cap):
+    r = client.post("/export/localzip/upload", params={"pdf_name": "devis"}, content=PDF,
+                    headers={"Content-Type": "application/pdf"})
+    assert r.status_code == 200
+    with zipfile.ZipFile(io.BytesIO(r.content)) as z:
+        assert z.read("devis.pdf") == PDF
+
+
+def test_multipart_upload_builds_zip(client, small_cap):
+    r = client.post("/export/localzip/upload", files={"pdf": ("r.pdf", PDF, "application/pdf")},
+                    data={"pdf_name": "rapport"})
+    assert r.status_code == 200
+    with zipfile.ZipFile(io.BytesIO(r.content)) as z:
+        assert z.read("rapport.pdf") == PDF
+
+
+def test_raw_upload_over_cap_is_413(client, small_cap):
+    r = client.post("/export/localzip/upload", content=b"%PDF-" + b"0" * (LIMIT + 1),
+                    headers={"Content-Type": "application/pdf"})
+    assert r.status_code == 413
+
+
+def test_chunked_raw_upload_over_cap_is_413(client, small_cap):
+    # Pas de Content-Length : seul le comptage pendant la lecture peut refuser
+    r = client.post("/export/localzip/upload", content=_chunks(4 * LIMIT),
+                    headers={"Content-Type": "application/pdf"})
+    assert r.status_code == 413
+
+
+def test_chunked_multipart_upload_over_cap_is_413(app_module, small_cap):
+    # TestClient lit tout le corps d'avance : on pilote l'app ASGI directement pour
+    # vérifier que le refus intervient pendant la lecture, pas après bufferisation.
+    boundary = "testboundary"
+    chunks = list(_multipart_chunks(boundary, 64 * LIMIT))
+    received, sent = [], []
+
+    async def receive():
+        if len(received) == len(chunks):
+            return {"type": "http.disconnect"}
+        received.append(chunks[len(received)])
+        return {"type": "http.request", "body": received[-1], "more_body": len(received) < len(chunks)}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "POST",
+        "scheme": "http", "path": "/export/localzip/upload", "raw_path": b"/export/localzip/upload",
+        "root_path": "", "query_string": b"", "client": ("127.0.0.1", 1), "server": ("test", 80),
+        "headers": [(b"content-type", f"multipart/form-data; boundary={boundary}".encode()),
+                    (b"transfer-encoding", b"chunked")],
+    }
+    asyncio.run(app_module.app(scope, receive, send))
+    assert sent[0]["status"] == 413
+    assert sum(map(len, received)) < 4 * LIMIT
+
+
+def test_non_pdf_is_rejected(client, small_cap):
+    r = client.post("/export/localzip/upload", content=b"<html>nope</html>",
+                    headers={"Content-Type": "application/pdf"})
+    assert r.status_code == 400
+    r = client.post("/export/localzip/upload", files={"pdf": ("r.pdf", b"GIF89a....", "application/pdf")})
+    assert r.status_code == 400
+
+
+def test_malformed_multipart_is_400(client, small_cap):
+    r = client.post("/export/localzip/upload", content=b"garbage",
+                    headers={"Content-Type": "multipart/form-data"})
+    assert r.status_code == 400
+
+
+@pytest.fixture
+def local_datasheet(app_module):
+    pid = app_module._catalog_load("hdds")["rows"][0]["id"].upper()
+    path = os.path.join(app_module.DATASHEET_DIR, "hdds", f"{pid}.pdf")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    data = b"%PDF-1.4\n" + b"1" * 4096 + b"\n%%EOF\n"
+    with open(path, "wb") as f:
+        f.write(data)
+    yield pid, f"datasheets/{app_module._ZIP_FOLDERS.get('hdds', 'hdds')}/{pid}.pdf", data
+    os.remove(path)
+
+
+def test_pack_includes_local_datasheet(client, local_datasheet):
+    pid, entry, data = local_datasheet
+    r = client.post("/export/localzip", json={"pdf_base64": base64.b64encode(PDF).decode(),
+                                              "product_ids": [pid, "INCONNU"]})
+    assert r.status_code == 200
+    with zipfile.ZipFile(io.BytesIO(r.content)) as z:
+        assert z.read(entry) == data
+        assert z.read("rapport.pdf") == PDF
+
+
+def test_upload_pack_includes_local_datasheet(client, small_cap, local_datasheet):
+    pid, entry, data = local_datasheet
+    r = client.post("/export/localzip/upload", params={"product_ids": pid}, content=PDF,
+                    headers={"Content-Type": "application/pdf"})
+    assert r.status_code == 200
+    with zipfile.ZipFile(io.BytesIO(r.content)) as z:
+        assert z.read(entry) == data
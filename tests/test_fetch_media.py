@@ -0,0 +1,120 @@
+"""scripts/fetch_media.py : amorçage du manifest et reprise d'un .part déjà complet."""
+import importlib.util
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BODY = b"%PDF-" + b"x" * 4096
+ETAG = '"v1"'
+
+
+def _load():
+    spec = importlib.util.spec_from_file_location("fetch_media", os.path.join(ROOT, "scripts", "fetch_media.py"))
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    return mod
+
+
+class _Origin(BaseHTTPRequestHandler):
+    def _reply(self, with_body):
+        self.server.hits.append((self.command, self.headers.get("Range")))
+        if self.headers.get("If-None-Match") == ETAG:
+            self.send_response(304)
+            self.end_headers()
+            return
+        rng = self.headers.get("Range")
+        if rng:
+            start = int(rng.split("=")[1].rstrip("-"))
+            if start >= len(BODY):
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{len(BODY)}")
+                self.end_headers()
+                return
+        self.send_response(200)
+        self.send_header("ETag", ETAG)
+        self.send_header("Content-Length", str(len(BODY)))
+        self.end_headers()
+        if with_body:
+            self.wfile.write(BODY)
+
+    def do_GET(self):
+        self._reply(True)
+
+    def do_HEAD(self):
+        self._reply(False)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def fm(tmp_path, monkeypatch):
+    srv = ThreadingHTTPServer(("127.0.0.1", 0), _Origin)
+    srv.hits = []
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    mod = _load()
+    mod.set_base_dir(tmp_path)
+    host = f"127.0.0.1:{srv.server_address[1]}"
+    monkeypatch.setattr(mod, "ALLOWED_HOSTS", {host})
+    mod.origin = srv
+    mod.url = f"http://{host}/ft.pdf"
+    mod.dst = tmp_path / "data" / "Fiche_tech" / "cameras" / "X.pdf"
+    mod.dst.parent.mkdir(parents=True)
+    yield mod
+    srv.shutdown()
+    srv.server_close()
+
+
+def _sync(fm):
+    manifest = fm.Manifest(fm.MANIFEST_PATH)
+    with fm.make_session(1) as session:
+        st, n = fm.sync_file(session, manifest, fm.url, fm.dst)
+    manifest.save()
+    return st, manifest.get("Fiche_tech/cameras/X.pdf")
+
+
+def test_existing_file_without_manifest_is_seeded_then_revalidated(fm):
+    fm.dst.write_bytes(BODY)
+    st, entry = _sync(fm)
+    assert st == "SKIP (manifest amorcé)"
+    assert entry["etag"] == ETAG and entry["size"] == len(BODY)
+    assert fm.origin.hits == [("HEAD", None)]
+    # passage suivant : GET conditionnel -> 304
+    st, _ = _sync(fm)
+    assert st == "SKIP (à jour)"
+    assert fm.origin.hits[-1] == ("GET", None)
+
+
+def test_existing_file_with_wrong_size_is_downloaded(fm):
+    fm.dst.write_bytes(b"old")
+    st, entry = _sync(fm)
+    assert st.startswith("OK")
+    assert fm.dst.read_bytes() == BODY
+    assert entry["etag"] == ETAG
+
+
+def test_complete_part_is_finalized_on_416(fm):
+    part = fm.dst.with_name(fm.dst.name + ".part")
+    part.write_bytes(BODY)
+    manifest = fm.Manifest(fm.MANIFEST_PATH)
+    manifest.set("Fiche_tech/cameras/X.pdf", {"url": fm.url, "partial_etag": ETAG})
+    manifest.save()
+    st, entry = _sync(fm)
+    assert st == "OK (repris)"
+    assert fm.dst.read_bytes() == BODY and not part.exists()
+    assert entry["etag"] == ETAG and "partial_etag" not in entry
+
+
+def test_oversized_part_is_discarded_on_416(fm):
+    part = fm.dst.with_name(fm.dst.name + ".part")
+    part.write_bytes(BODY + b"garbage")
+    manifest = fm.Manifest(fm.MANIFEST_PATH)
+    manifest.set("Fiche_tech/cameras/X.pdf", {"url": fm.url, "partial_etag": ETAG})
+    manifest.save()
+    st, _ = _sync(fm)
+    assert st.startswith("ERR") and not part.exists()
+    st, _ = _sync(fm)
+    assert st == "OK" and fm.dst.read_bytes() == BODY
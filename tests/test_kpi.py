@@ -0,0 +1,127 @@
+"""Ingestion KPI : garde (débit, doublons, tailles, délestage) et remise à zéro d'un mois."""
+import os
+import sqlite3
+from datetime import datetime, timezone
+
+import pytest
+
+
+def _send(client, session, n, tag):
+    events = [{"event": "test_evt", "payload": {"tag": tag, "i": i}} for i in range(n)]
+    r = client.post("/api/kpi/batch", json={"session_id": session, "events": events})
+    assert r.status_code == 200, r.text
+    return r.json()["accepted"]
+
+
+def _month_total(client, auth, month):
+    days = client.get("/api/kpi/summary", headers=auth).json()["by_day"]
+    return sum(d["count"] for d in days if d["date"].startswith(month))
+
+
+def test_reset_month_drops_partition_and_other_writers_follow(client, auth, app_module):
+    month = datetime.now(timezone.utc).strftime("%Y-%m")
+    assert _send(client, "reset-a", 5, "before") == 5
+    app_module.KPI_WRITER.flush()
+    path = app_module._kpi_part_path(month)
+    # écrivain d'un autre worker, avec sa connexion gardée sur la partition
+    other = app_module.KpiWriter(100, 60)
+    ts = month + "-01T00:00:00+00:00"
+    other._write([(ts, "other", "test_evt", '{"n":1}', "", "", "")])
+
+    r = client.request("DELETE", "/api/kpi/reset-month", json={"month": month}, headers=auth)
+    assert r.status_code == 200
+    assert r.json()["deleted"] >= 6
+    assert _month_total(client, auth, month) == 0
+    assert not os.path.exists(path)  # fichier supprimé : espace rendu immédiatement
+
+    other._write([(ts, "other", "test_evt", '{"n":2}', "", "", "")])
+    assert _send(client, "reset-b", 3, "after") == 3
+    app_module.KPI_WRITER.flush()
+    other.stop()
+    con = sqlite3.connect(path)
+    try:
+        # l'event de l'autre worker est dans la nouvelle partition, pas dans l'ancien fichier supprimé
+        assert con.execute("SELECT COUNT(*) FROM kpi_events").fetchone()[0] == 4
+    finally:
+        con.close()
+    assert _month_total(client, auth, month) == 4
+
+
+def test_reset_month_rejects_bad_format(client, auth):
+    r = client.request("DELETE", "/api/kpi/reset-month", json={"month": "2024-13"}, headers=auth)
+    assert r.status_code == 400
+
+
+@pytest.fixture
+def guard(app_module, monkeypatch):
+    g = app_module.KpiGuard(session_rate=1, session_burst=3, ip_rate=0, ip_burst=0,
+                            max_payload=256, dedup_window_s=60, max_keys=1000)
+    monkeypatch.setattr(app_module, "KPI_GUARD", g)
+    return g
+
+
+def _batch(client, session, events):
+    return client.post("/api/kpi/batch", json={"session_id": session, "events": events})
+
+
+def test_session_rate_limit_returns_429_with_retry_after(client, guard):
+    r = _batch(client, "rl", [{"event": "e", "payload": {"i": i}} for i in range(5)])
+    assert r.status_code == 429
+    assert int(r.headers["Retry-After"]) >= 1
+    assert r.json() == {"ok": True, "accepted": 3, "dropped": 2}
+    assert guard.snapshot()["rate_limited"] == 2
+
+
+def test_duplicates_are_dropped_without_retry(client, guard):
+    ev = {"event": "e", "payload": {"same": 1}}
+    assert _batch(client, "dup", [ev, ev]).json()["accepted"] == 1
+    r = client.post("/api/kpi/collect", json={"session_id": "dup", **ev})
+    assert r.status_code == 200 and r.json()["accepted"] == 0
+    assert guard.snapshot()["duplicate"] == 2
+
+
+def test_oversized_payload_is_dropped(client, guard):
+    r = _batch(client, "big", [{"event": "e", "payload": {"x": "a" * 500}}, {"event": "e", "payload": {}}])
+    assert r.status_code == 200 and r.json()["accepted"] == 1
+    assert guard.snapshot()["too_large"] == 1
+
+
+def test_oversized_body_is_413(client, guard, app_module, monkeypatch):
+    monkeypatch.setattr(app_module, "KPI_MAX_BODY_BYTES", 1024)
+    r = client.post("/api/kpi/collect", json={"event": "e", "payload": {"x": "a" * 2000}})
+    assert r.status_code == 413
+    assert guard.snapshot()["body_too_large"] == 1
+
+
+def test_full_writer_queue_sheds_with_202(client, guard, app_module, monkeypatch):
+    app_module.KPI_WRITER.flush()
+    monkeypatch.setattr(app_module.KPI_WRITER, "max_queue", 1)
+    r = _batch(client, "shed", [{"event": "e", "payload": {"i": i}} for i in range(3)])
+    assert r.status_code == 202
+    assert r.json() == {"ok": True, "accepted": 1, "dropped": 2}
+    assert guard.snapshot()["shed"] == 2
+
+
+def test_compaction_archives_and_drops_old_partition(app_module):
+    month = "2021-03"
+    w = app_module.KpiWriter(100, 60)
+    w._write([(f"{month}-02T10:00:00+00:00", "old", "test_evt", "{}", "", "", "")])
+    w.stop()
+    assert month in app_module._kpi_months()
+    done = app_module._kpi_compact(retention_months=1)
+    assert {"month": month, "archived": 1} in done
+    assert month not in app_module._kpi_months()
+    assert os.path.exists(app_module._kpi_archive_path(month))
+
+
+def test_path_filter_uses_partition_index(app_module):
+    month = "2021-04"
+    con = app_module._kpi_part_db(month, create=True)
+    try:
+        where, args = app_module._kpi_where(start=f"{month}-02", path="/produits")
+        plan = " ".join(r[3] for r in con.execute(
+            f"EXPLAIN QUERY PLAN SELECT id FROM kpi_events{where} ORDER BY id DESC LIMIT 50", args))
+        assert "idx_kpi_path" in plan
+    finally:
+        con.close()
+        app_module._kpi_drop_partition(month)
@@ -0,0 +1,76 @@
+"""Proxy médias : liste d'hôtes autorisés, y compris à travers les redirections."""
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+
+class _Upstream(BaseHTTPRequestHandler):
+    def do_GET(self):
+        port = self.server.server_address[1]
+        if self.path == "/redirect-internal":
+            self.send_response(302)
+            self.send_header("Location", f"http://localhost:{port}/secret")
+            self.end_headers()
+        elif self.path == "/redirect-allowed":
+            self.send_response(302)
+            self.send_header("Location", f"http://127.0.0.1:{port}/public")
+            self.end_headers()
+        else:
+            body = b"INTERNAL-SECRET" if self.path == "/secret" else b"PUBLIC"
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        self.server.hits.append(self.path)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def upstream():
+    srv = ThreadingHTTPServer(("127.0.0.1", 0), _Upstream)
+    srv.hits = []
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    yield srv
+    srv.shutdown()
+    srv.server_close()
+
+
+@pytest.fixture
+def media_cache(app_module, monkeypatch, tmp_path):
+    cache = app_module.MediaCache(str(tmp_path), 10 * 1024 * 1024, 3600, {"127.0.0.1"})
+    monkeypatch.setattr(app_module, "MEDIA_CACHE", cache)
+    return cache
+
+
+def test_media_rejects_host_outside_allow_list(client, media_cache):
+    assert client.get("/api/media", params={"url": "http://localhost:1/x"}).status_code == 403
+    assert client.get("/api/media", params={"url": "file:///etc/passwd"}).status_code == 403
+
+
+def test_media_serves_allowed_host(client, media_cache, upstream):
+    url = f"http://127.0.0.1:{upstream.server_address[1]}/public"
+    r = client.get("/api/media", params={"url": url})
+    assert r.status_code == 200
+    assert r.content == b"PUBLIC"
+    # 2e appel servi depuis le cache disque
+    assert client.get("/api/media", params={"url": url}).content == b"PUBLIC"
+    assert upstream.hits == ["/public"]
+
+
+def test_media_redirect_to_disallowed_host_is_refused(client, media_cache, upstream):
+    url = f"http://127.0.0.1:{upstream.server_address[1]}/redirect-internal"
+    r = client.get("/api/media", params={"url": url})
+    assert r.status_code == 502
+    assert b"INTERNAL-SECRET" not in r.content
+    assert "/secret" not in upstream.hits
+
+
+def test_media_redirect_within_allow_list_is_followed(client, media_cache, upstream):
+    url = f"http://127.0.0.1:{upstream.server_address[1]}/redirect-allowed"
+    r = client.get("/api/media", params={"url": url})
+    assert r.status_code == 200
+    assert r.content == b"PUBLIC"
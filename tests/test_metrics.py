@@ -0,0 +1,15 @@
+"""Métriques : journal des requêtes SQLite lentes."""
+import logging
+
+
+def test_slow_sql_is_logged_as_warning(app_module, monkeypatch, tmp_path, caplog):
+    monkeypatch.setattr(app_module, "SQL_SLOW_MS", 0)
+    con = app_module._sqlite_connect(str(tmp_path / "t.sqlite3"))
+    try:
+        with caplog.at_level(logging.WARNING, logger="configurateur.sql"):
+            con.execute("SELECT   1")
+    finally:
+        con.close()
+    rec = [r for r in caplog.records if r.name == "configurateur.sql"]
+    assert rec and rec[0].levelno == logging.WARNING
+    assert rec[0].getMessage().endswith("SELECT 1")
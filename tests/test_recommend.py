@@ -0,0 +1,23 @@
+"""Moteur de recommandation : index précalculés et règles d'élimination."""
+
+
+def test_unknown_values_are_indexed_once(app_module):
+    eng = app_module._reco_engine()
+    assert eng.unknown_focal == {i for i, c in enumerate(eng.cams) if not c["focal_reach_mm"]}
+    assert eng.unknown_ip == {i for i, c in enumerate(eng.cams) if c["ip"] is None}
+
+
+def test_exterior_rule_eliminates_low_ip_but_keeps_unknown(app_module):
+    eng = app_module._reco_engine()
+    out, _ = eng._eliminated(10, "exterieur")
+    for i, c in enumerate(eng.cams):
+        if c["ip"] is not None and c["ip"] < 66:
+            assert i in out
+        if c["ip"] is None and c["type"] != "ptz":
+            assert i not in out
+
+
+def test_recommend_route(client):
+    r = client.post("/api/recommend", json={"blocks": [{"id": "b1", "answers": {"emplacement": "exterieur", "distance": 40}}]})
+    assert r.status_code == 200
+    assert r.json()["results"][0]["id"] == "b1"
@@ -0,0 +1,21 @@
+"""Sessions admin : créées au démarrage de l'app, pas à l'import du module."""
+import os
+import subprocess
+import sys
+
+from conftest import ROOT
+
+
+def test_import_does_not_touch_session_secret(tmp_path):
+    secret = tmp_path / "secret"
+    env = {**os.environ, "SESSION_SECRET_FILE": str(secret), "SESSION_SECRET": ""}
+    code = "from backend import app; assert app.SESSIONS is None"
+    subprocess.run([sys.executable, "-c", code], cwd=ROOT, env=env, check=True, timeout=60)
+    assert not secret.exists()
+
+
+def test_login_verify_and_bad_tokens(client, auth):
+    assert client.get("/api/media/stats", headers=auth).status_code == 200
+    assert client.get("/api/media/stats").status_code == 401
+    assert client.get("/api/media/stats", headers={"Authorization": "Bearer forged.token"}).status_code == 401
+    assert client.post("/api/login", json={"password": "wrong"}).status_code == 403
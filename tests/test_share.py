@@ -0,0 +1,29 @@
+"""Liens de partage : id stable par contenu, lecture immuable (ETag / 304)."""
+
+PROJECT = {
+    "projectName": "Parking",
+    "cameraBlocks": [{"id": "b1", "label": "Entrée", "selectedCameraId": {"id": "CAM-1", "name": "x"}, "qty": 2}],
+    "cameraLines": [{"cameraId": "CAM-1", "fromBlockId": "b1", "qty": 2}],
+}
+
+
+def test_same_project_gets_same_id(client):
+    first = client.post("/api/share", json=PROJECT).json()
+    again = client.post("/api/share", json={**PROJECT, "savedAt": "ignoré"}).json()
+    assert first["id"] == again["id"]
+    assert again["created"] is False
+
+
+def test_get_roundtrip_and_etag(client):
+    sid = client.post("/api/share", json=PROJECT).json()["id"]
+    r = client.get(f"/api/share/{sid}")
+    assert r.status_code == 200
+    assert r.json()["cameraBlocks"][0]["selectedCameraId"] == "CAM-1"
+    assert "immutable" in r.headers["Cache-Control"]
+    r2 = client.get(f"/api/share/{sid}", headers={"If-None-Match": r.headers["ETag"]})
+    assert r2.status_code == 304
+
+
+def test_unknown_or_malformed_id_is_404(client):
+    assert client.get("/api/share/AAAAAAAAAAA").status_code == 404
+    assert client.get("/api/share/..%2Fetc").status_code == 404
@@ -0,0 +1,18 @@
+"""Dimensionnement projet : bornes des paramètres d'enregistrement."""
+import pytest
+
+CAMERA = "IPBCAMN04F01CUA"
+
+
+def _switches(client, **rec):
+    r = client.post("/api/project/compute", json={"cameraLines": [{"cameraId": CAMERA, "qty": 40}], "recording": rec})
+    assert r.status_code == 200
+    return r.json()["switches"]
+
+
+@pytest.mark.parametrize("pct, ports", [(-500, 40), (10, 44), (100, 80), (1e6, 80)])
+def test_reserve_ports_pct_is_clamped(client, pct, ports):
+    sw = _switches(client, reservePortsPct=pct)
+    assert sw["camerasOnSwitches"] == 40
+    assert sw["portsNeeded"] == ports
+    assert sw["totalPorts"] >= sw["portsNeeded"]